@@ -0,0 +1,94 @@
+import json
+import re
+from functools import lru_cache
+from sqlalchemy import select, update
+from backend import models, settings
+
+# Аллерген -> основы слов, по которым он находится в описании блюда или в предпочтениях
+# ученика. Основа совпадает со словом с любым окончанием, а основа с "$" на конце —
+# только с этим словом целиком: у короткой "мед" иначе нашлись бы "медленно" и "медиум"
+DEFAULT_ALLERGENS = {
+    "орехи": ["орех", "фундук", "арахис", "миндал", "кешью", "фисташ"],
+    "молоко": ["молок", "молоч", "сливк", "сливоч", "творог", "творож", "лактоз"],
+    "мед": ["мёд", "мед$", "меда$", "меду$", "медом$", "медов"],
+    "яйца": ["яйц", "яичн"],
+}
+
+
+def load_dictionary():
+    if settings.ALLERGENS_FILE:
+        with open(settings.ALLERGENS_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_ALLERGENS
+
+
+ALLERGENS = load_dictionary()
+# (основа, только целое слово, аллерген); длинные основы идут первыми, чтобы "молоч"
+# не перехватывалось более коротким совпадением
+STEMS = sorted(
+    ((stem.lower().rstrip("$"), stem.endswith("$"), allergen) for allergen, stems in ALLERGENS.items() for stem in stems),
+    key=lambda entry: len(entry[0]),
+    reverse=True,
+)
+
+# Один проход по тексту для всех основ; группа 1 — отрицание "без" перед словом
+_pattern = re.compile(
+    r"(?<!\w)(без\s+)?("
+    + "|".join(re.escape(stem) + (r"(?!\w)" if whole else r"\w*") for stem, whole, _ in STEMS)
+    + ")",
+    re.IGNORECASE,
+)
+
+
+@lru_cache(maxsize=4096)
+def _allergen_of(word):
+    word = word.lower()
+    for stem, whole, allergen in STEMS:
+        if word == stem if whole else word.startswith(stem):
+            return allergen
+
+
+def _find(text, negation):
+    if not text:
+        return frozenset()
+    return frozenset(
+        _allergen_of(match.group(2))
+        for match in _pattern.finditer(text)
+        if not (negation and match.group(1))
+    )
+
+
+@lru_cache(maxsize=4096)
+def dish_allergens(text):
+    # Описание блюда: "без орехов" аллергеном не считается
+    return _find(text, negation=True)
+
+
+@lru_cache(maxsize=4096)
+def user_allergens(text):
+    # Предпочтения ученика: "без орехов, пожалуйста" — как раз про орехи
+    return _find(text, negation=False)
+
+
+def item_allergens(item):
+    if item.allergens is not None:
+        return frozenset(item.allergens)
+    return dish_allergens(item.description)
+
+
+def index_item(item):
+    item.allergens = sorted(dish_allergens(item.description))
+
+
+def backfill(bind):
+    # Досчитывает индекс для блюд, созданных до его появления, и пересчитывает тот,
+    # что разошёлся с текущим словарём (изменился словарь или правила разбора)
+    with bind.begin() as conn:
+        rows = conn.execute(select(models.MenuItem.id, models.MenuItem.description, models.MenuItem.allergens)).all()
+        changed = [
+            {"id": row.id, "allergens": found}
+            for row in rows
+            if row.allergens != (found := sorted(dish_allergens(row.description)))
+        ]
+        if changed:
+            conn.execute(update(models.MenuItem), changed)
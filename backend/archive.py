@@ -0,0 +1,123 @@
+import argparse
+import time
+from datetime import date, timedelta
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session, sessionmaker
+from backend import models, settings
+from backend.cache import TTLCache
+from backend.database import engine, tenant_key, tenants
+from backend.migrate import tenant_engine
+from backend.pagination import date_range
+
+# имя -> (горячая таблица, архивная, колонка даты)
+TABLES = {
+    "orders": (models.Order, models.OrderArchive, "order_date"),
+    "reviews": (models.Review, models.ReviewArchive, "created_at"),
+}
+
+# Граница архива: {имя: (horizon, max_id)}; читается на каждом запросе истории,
+# поэтому держится в памяти и перечитывается раз в ARCHIVE_STATE_TTL_SECONDS
+state_cache = TTLCache(maxsize=256, ttl=settings.ARCHIVE_STATE_TTL_SECONDS)
+
+
+def _state_query():
+    return select(models.ArchiveState.name, models.ArchiveState.horizon, models.ArchiveState.max_id)
+
+
+def state(db: Session):
+    key = tenant_key("archive")
+    cached = state_cache.get(key)
+    if cached is None:
+        cached = {row.name: (row.horizon, row.max_id) for row in db.execute(_state_query())}
+        state_cache.set(key, cached)
+    return cached
+
+
+async def state_async(db):
+    key = tenant_key("archive")
+    cached = state_cache.get(key)
+    if cached is None:
+        cached = {row.name: (row.horizon, row.max_id) for row in await db.execute(_state_query())}
+        state_cache.set(key, cached)
+    return cached
+
+
+def reaches(archive_state, name: str, date_from: date = None):
+    # Нужен ли архив: он есть, и диапазон начинается раньше его границы
+    entry = archive_state.get(name)
+    return entry is not None and (date_from is None or date_from < entry[0])
+
+
+def max_id(archive_state, name: str):
+    # Самый большой id, перенесённый в архив
+    return archive_state[name][1]
+
+
+def archive_table(db: Session, name: str, horizon: date, batch_size: int = settings.ARCHIVE_BATCH_SIZE, grace: float = 0):
+    # Переносит строки старше horizon пачками по batch_size: каждая пачка — INSERT ... SELECT
+    # и DELETE по одним и тем же id в одной транзакции, так что строка всегда ровно в
+    # одной из таблиц. Граница записывается до переноса, а grace секунд дают серверам
+    # перечитать её: запросы, заставшие перенос, уже смотрят в обе таблицы
+    hot, cold, date_name = TABLES[name]
+    old = date_range(getattr(hot, date_name), None, horizon - timedelta(days=1))
+    max_id = db.scalar(select(func.max(hot.id)).where(*old))
+    if max_id is None:
+        return 0
+
+    current = db.get(models.ArchiveState, name)
+    if current is None:
+        db.add(models.ArchiveState(name=name, horizon=horizon, max_id=max_id))
+    elif current.horizon < horizon or current.max_id < max_id:
+        current.horizon = max(current.horizon, horizon)
+        current.max_id = max(current.max_id, max_id)
+    else:
+        grace = 0
+    db.commit()
+    state_cache.clear()
+    time.sleep(grace)
+
+    columns = [column.key for column in cold.__table__.columns]
+    moved = 0
+    while True:
+        ids = db.scalars(select(hot.id).where(*old).order_by(hot.id).limit(batch_size)).all()
+        if not ids:
+            break
+        db.execute(insert(cold).from_select(
+            columns, select(*[getattr(hot, column) for column in columns]).where(hot.id.in_(ids))
+        ))
+        db.execute(delete(hot).where(hot.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+    return moved
+
+
+def run(db: Session, horizon: date, batch_size: int = settings.ARCHIVE_BATCH_SIZE, grace: float = 0):
+    return {name: archive_table(db, name, horizon, batch_size, grace) for name in TABLES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос старых заказов и отзывов в архивные таблицы")
+    parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS, help="архивировать старше стольких дней")
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--tenant", help="школа из TENANT_DATABASE_URL")
+    parser.add_argument("--no-wait", action="store_true", help="не ждать, пока серверы перечитают границу архива")
+    args = parser.parse_args()
+
+    if args.tenant:
+        if tenants is None:
+            parser.error("не задан TENANT_DATABASE_URL")
+        bind = tenant_engine(args.tenant)
+    else:
+        bind = engine
+    db = sessionmaker(bind=bind)()
+    horizon = date.today() - timedelta(days=args.days)
+    started = time.perf_counter()
+    moved = run(db, horizon, args.batch_size, 0 if args.no_wait else settings.ARCHIVE_STATE_TTL_SECONDS)
+    db.close()
+    for name, count in moved.items():
+        print(f"{name}: перенесено в архив {count}")
+    print(f"Граница архива {horizon}, за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,318 @@
+import asyncio
+import glob
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from backend import metrics, settings
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = settings.BASE_DIR
 
-DB_PATH = os.path.join(BASE_DIR, "canteen.db")
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.DB_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics.record_query(statement, time.perf_counter() - context._query_started)
+
+def instrument(sync_engine):
+    # Число запросов и время в базе для /metrics и лога медленных запросов
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+def make_engine(url: str, profile: str = settings.DB_PROFILE):
+    if profile == "legacy":
+        connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+        new_engine = create_engine(url, connect_args=connect_args)
+    elif url.startswith("sqlite"):
+        new_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": settings.DB_BUSY_TIMEOUT_MS / 1000},
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+        event.listen(new_engine, "connect", _set_sqlite_pragmas)
+    else:
+        new_engine = create_engine(
+            url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    instrument(new_engine)
+    return new_engine
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def to_async_url(url: str):
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+def make_async_engine(url: str, profile: str = settings.DB_PROFILE):
+    if profile == "legacy":
+        new_engine = create_async_engine(url)
+    elif url.startswith("sqlite"):
+        new_engine = create_async_engine(
+            url,
+            connect_args={"timeout": settings.DB_BUSY_TIMEOUT_MS / 1000},
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    else:
+        new_engine = create_async_engine(
+            url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    instrument(new_engine.sync_engine)
+    return new_engine
+
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = make_engine(settings.DATABASE_READ_URL) if settings.DATABASE_READ_URL else engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Асинхронный движок только для чтения: запросы ждут базу, не занимая потоки пула FastAPI
+async_engine = make_async_engine(
+    settings.DATABASE_ASYNC_URL or to_async_url(settings.DATABASE_READ_URL or SQLALCHEMY_DATABASE_URL)
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
+# Школа текущего запроса; None — однотенантный режим с базой DATABASE_URL
+current_tenant = ContextVar("current_tenant", default=None)
+
+
+def tenant_key(key):
+    # Ключ кэша, общего для всех школ процесса, в пределах школы текущего запроса
+    tenant = current_tenant.get()
+    return key if tenant is None else (tenant, key)
+
+
+class TenantEngines:
+    __slots__ = ("tenant", "engine", "Session", "async_engine", "AsyncSession", "loop", "last_used")
+
+    def __init__(self, tenant: str, url: str):
+        self.tenant = tenant
+        self.engine = make_engine(url)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.async_engine = None
+        self.AsyncSession = None
+        self.loop = None
+        self.last_used = time.monotonic()
+
+    def async_sessions(self):
+        if self.async_engine is None:
+            self.async_engine = make_async_engine(to_async_url(self.engine.url.render_as_string(hide_password=False)))
+            self.AsyncSession = async_sessionmaker(bind=self.async_engine, autoflush=False, expire_on_commit=False)
+            self.loop = asyncio.get_running_loop()
+        return self.AsyncSession
+
+    def dispose(self):
+        self.engine.dispose()
+        if self.async_engine is not None:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is self.loop:
+                self.loop.create_task(self.async_engine.dispose())
+            elif not self.loop.is_closed():
+                asyncio.run_coroutine_threadsafe(self.async_engine.dispose(), self.loop)
+
+
+class TenantRegistry:
+    # Своя база на каждую школу: пик обедов одной школы не держит блокировку записи
+    # у остальных. Движки создаются при первом запросе школы, а давно не
+    # использовавшиеся закрываются — и сверх max_engines (LRU), и после idle_seconds
+    # простоя
+    def __init__(self, url_template: str, max_engines: int, idle_seconds: float):
+        self.url_template = url_template
+        self.max_engines = max_engines
+        self.idle_seconds = idle_seconds
+        self.opened = 0
+        self.closed = 0
+        self._engines = OrderedDict()
+        # школа -> Event, выставленный, когда хуки открытия для неё отработали; хуки
+        # идут один раз за процесс, а не на каждое повторное открытие после вытеснения
+        self._prepared = {}
+        self._lock = threading.Lock()
+        self._on_create = []
+        self._on_close = []
+
+    def on_create(self, hook):
+        # hook(engine) — например, досоздание схемы при первом открытии базы школы
+        self._on_create.append(hook)
+
+    def on_close(self, hook):
+        # hook(engine) — освободить то, что держится за закрываемый движок
+        self._on_close.append(hook)
+
+    def url(self, tenant: str):
+        return self.url_template.format(tenant=tenant)
+
+    def exists(self, tenant: str):
+        url = make_url(self.url(tenant))
+        if url.get_backend_name() != "sqlite":
+            return True
+        return bool(url.database) and os.path.exists(url.database)
+
+    def names(self):
+        # Школы, у которых уже есть база; перечислить можно только файлы SQLite
+        url = make_url(self.url_template)
+        if url.get_backend_name() != "sqlite":
+            return []
+        prefix, suffix = url.database.split("{tenant}")
+        return sorted(
+            path[len(prefix):len(path) - len(suffix)]
+            for path in glob.glob(glob.escape(prefix) + "*" + glob.escape(suffix))
+        )
+
+    def get(self, tenant: str):
+        entry, ready, prepare, expired = self._checkout(tenant)
+        self._settle(tenant, ready, prepare, expired, entry)
+        return entry
+
+    async def get_async(self, tenant: str):
+        # Хуки открытия и закрытия (миграция, join писателя, дозапись раздач) блокируют,
+        # поэтому из асинхронных обработчиков идут в пул потоков; уже открытая и готовая
+        # база отдаётся сразу, без переключения
+        entry, ready, prepare, expired = self._checkout(tenant)
+        if prepare or expired or not ready.is_set():
+            await run_in_threadpool(self._settle, tenant, ready, prepare, expired, entry)
+        return entry
+
+    def _checkout(self, tenant: str):
+        # Под замком реестра — только словарь движков; хуки выполняет _settle вне замка,
+        # чтобы миграция одной школы не задерживала запросы остальных
+        now = time.monotonic()
+        expired = []
+        prepare = False
+        with self._lock:
+            entry = self._engines.get(tenant)
+            if entry is not None:
+                self._engines.move_to_end(tenant)
+            else:
+                if not self.exists(tenant):
+                    raise HTTPException(status_code=404, detail="Школа не найдена")
+                entry = self._engines[tenant] = TenantEngines(tenant, self.url(tenant))
+                self.opened += 1
+            ready = self._prepared.get(tenant)
+            if ready is None:
+                ready = self._prepared[tenant] = threading.Event()
+                prepare = True
+            entry.last_used = now
+            while len(self._engines) > self.max_engines:
+                expired.append(self._engines.popitem(last=False)[1])
+            for name, other in list(self._engines.items()):
+                if now - other.last_used < self.idle_seconds:
+                    break
+                expired.append(self._engines.pop(name))
+            self.closed += len(expired)
+        return entry, ready, prepare, expired
+
+    def _settle(self, tenant: str, ready: threading.Event, prepare: bool, expired, entry: TenantEngines):
+        for other in expired:
+            self._close(other)
+        if prepare:
+            try:
+                for hook in self._on_create:
+                    hook(entry.engine)
+            except Exception:
+                # Следующее открытие попробует снова
+                with self._lock:
+                    self._prepared.pop(tenant, None)
+                raise
+            finally:
+                ready.set()
+            return
+        # Базу школы готовит другой запрос — ждём его
+        ready.wait()
+        if self._prepared.get(tenant) is not ready:
+            raise HTTPException(status_code=503, detail="База школы недоступна")
+
+    def _close(self, entry: TenantEngines):
+        for hook in self._on_close:
+            hook(entry.engine)
+        entry.dispose()
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._engines.values())
+            self._engines.clear()
+            self.closed += len(entries)
+        for entry in entries:
+            self._close(entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": list(self._engines),
+                "max_engines": self.max_engines,
+                "opened": self.opened,
+                "closed": self.closed,
+            }
+
+
+tenants = TenantRegistry(settings.TENANT_DATABASE_URL, settings.TENANT_MAX_ENGINES, settings.TENANT_IDLE_SECONDS) \
+    if settings.TENANT_DATABASE_URL else None
+
+
+def _current_tenant():
+    tenant = current_tenant.get()
+    if tenant is None and tenants is not None:
+        raise HTTPException(status_code=400, detail="Не указана школа")
+    return tenant
+
+
+def _tenant_engines():
+    tenant = _current_tenant()
+    return None if tenant is None else tenants.get(tenant)
+
+
 def get_db():
-    db = SessionLocal()
+    entry = _tenant_engines()
+    db = SessionLocal() if entry is None else entry.Session()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    # У школ нет отдельных реплик: читаем из той же базы, что и пишем
+    entry = _tenant_engines()
+    db = ReadSessionLocal() if entry is None else entry.Session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    tenant = _current_tenant()
+    entry = None if tenant is None else await tenants.get_async(tenant)
+    async with (AsyncSessionLocal if entry is None else entry.async_sessions())() as db:
+        yield db
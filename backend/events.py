@@ -0,0 +1,153 @@
+import asyncio
+import json
+from sqlalchemy import select
+from backend import models, schemas
+from backend.database import current_tenant
+
+EVENT_QUEUE_SIZE = 256
+KEEPALIVE_SECONDS = 15
+STAFF_TOPICS = ("role:admin", "role:cook")
+
+
+class EventBroker:
+    # Подписчики SSE по темам "user:<id>" и "role:<роль>". Публикация из любого
+    # потока: событие сериализуется один раз и раздаётся в цикле событий только
+    # тем, кто подписан на его темы, поэтому тысячи простаивающих подписчиков
+    # ничего не стоят. Кто не успевает читать, отключается и переподключается.
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.published = 0
+        self.dropped = 0
+        self._topics = {}
+        self._loop = None
+        self._heartbeat = None
+
+    def has_subscribers(self, topics):
+        return any(self._topics.get(topic) for topic in topics)
+
+    def subscribe(self, topics):
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        for topic in topics:
+            self._topics.setdefault(topic, set()).add(queue)
+        if self._heartbeat is None or self._heartbeat.done() or self._heartbeat.get_loop() is not self._loop:
+            self._heartbeat = self._loop.create_task(self._keepalive())
+        return queue
+
+    async def _keepalive(self):
+        # Один таймер на всех вместо таймера на каждого подписчика; комментарий SSE
+        # не даёт прокси закрыть простаивающее соединение
+        while self._topics:
+            await asyncio.sleep(KEEPALIVE_SECONDS)
+            self._dispatch(list(self._topics), ": ping\n\n", count=False)
+
+    def unsubscribe(self, queue, topics):
+        for topic in topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def publish(self, topics, event: str, data):
+        if not self.has_subscribers(topics):
+            return
+        message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._dispatch(topics, message)
+        else:
+            self._loop.call_soon_threadsafe(self._dispatch, topics, message)
+
+    def _dispatch(self, topics, message, count=True):
+        if count:
+            self.published += 1
+        # Один подписчик может быть в нескольких темах события, но получает его один раз
+        queues = set()
+        for topic in topics:
+            queues.update(self._topics.get(topic, ()))
+        for queue in queues:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def stream(self, topics):
+        queue = self.subscribe(topics)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                message = await queue.get()
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(queue, topics)
+
+    def stats(self):
+        return {
+            "topics": len(self._topics),
+            "subscribers": len(set().union(*self._topics.values())) if self._topics else 0,
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+broker = EventBroker()
+
+
+def scoped(*topics):
+    # У каждой школы своя нумерация пользователей: темы разводятся по школе запроса
+    tenant = current_tenant.get()
+    return topics if tenant is None else tuple(f"{tenant}/{topic}" for topic in topics)
+
+
+def topics_for(user: schemas.CurrentUser):
+    if user.role == "admin":
+        return list(scoped("role:admin", f"user:{user.id}"))
+    if user.role == "cook":
+        return list(scoped("role:cook", f"user:{user.id}"))
+    return list(scoped(f"user:{user.id}"))
+
+
+# Вызываются обработчиками после коммита
+
+def order_changed(order, price: float = None):
+    broker.publish(
+        scoped(f"user:{order.user_id}", *STAFF_TOPICS), "order",
+        {"id": order.id, "user_id": order.user_id, "menu_item_id": order.menu_item_id,
+         "order_date": order.order_date, "is_paid": order.is_paid, "is_received": order.is_received},
+    )
+    if order.is_received:
+        deltas = {"received_count": 1, "waiting_count": -1 if order.is_paid else 0}
+    else:
+        deltas = {"paid_count": 1, "waiting_count": 1, "revenue": price}
+    broker.publish(scoped(*STAFF_TOPICS), "attendance", {"day": order.order_date, **deltas})
+
+
+def stock_changed(db, inventory_ids=None, menu_item_ids=None):
+    # Новые остатки перечитываются только если на склад кто-то подписан
+    if not broker.has_subscribers(scoped(*STAFF_TOPICS)):
+        return
+    stmt = select(models.Inventory.id, models.Inventory.quantity)
+    if menu_item_ids is not None:
+        stmt = stmt.where(models.Inventory.id.in_(
+            select(models.Recipe.inventory_id).where(models.Recipe.menu_item_id.in_(menu_item_ids))
+        ))
+    else:
+        stmt = stmt.where(models.Inventory.id.in_(inventory_ids))
+    # Отдельное соединение: сессия обработчика могла начать чтение до коммита писателя
+    with db.get_bind().connect() as conn:
+        items = [{"id": row.id, "quantity": row.quantity} for row in conn.execute(stmt)]
+    if items:
+        broker.publish(scoped(*STAFF_TOPICS), "inventory", {"items": items})
+
+
+def purchase_request_changed(request_id: int, status: str):
+    broker.publish(scoped(*STAFF_TOPICS), "purchase_request", {"id": request_id, "status": status})
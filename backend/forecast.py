@@ -0,0 +1,227 @@
+import argparse
+import threading
+from datetime import date, timedelta
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session, sessionmaker
+from backend import models, schemas, settings
+from backend.cache import TTLCache
+from backend.database import engine, tenant_key, tenants
+from backend.migrate import tenant_engine
+
+MAX_FORECAST_DAYS = 31
+
+# (школа, день) -> {inventory_id: [reserved, expected]}. Потребность меняется с каждым
+# заказом, поэтому живёт FORECAST_CACHE_TTL_SECONDS; остатки склада читаются заново
+# на каждый прогноз, чтобы приход продуктов был виден сразу
+demand_cache = TTLCache(maxsize=1024, ttl=settings.FORECAST_CACHE_TTL_SECONDS)
+
+# Заявки по нехватке создаются по одной генерации за раз, иначе две одновременные
+# не увидят pending-заявки друг друга и закажут продукт дважды
+_generate_lock = threading.Lock()
+
+
+def typical_portions(db: Session, before: date):
+    # Сколько порций каждого приёма пищи в среднем оплачивают за день (по сводке daily_stats)
+    rows = db.execute(
+        select(models.DailyStats.meal_type, func.sum(models.DailyStats.paid_count), func.count())
+        .where(
+            models.DailyStats.day >= before - timedelta(days=settings.FORECAST_HISTORY_DAYS),
+            models.DailyStats.day < before,
+        )
+        .group_by(models.DailyStats.meal_type)
+    ).all()
+    return {meal_type: total / days for meal_type, total, days in rows}
+
+
+def _load_demand(db: Session, date_from: date, date_to: date):
+    # Потребность по дням и продуктам. reserved — уже оплаченные и не выданные заказы:
+    # продукты под них списаны со склада при оформлении. expected — порции, которые ещё
+    # закажут: средняя дневная явка приёма пищи делится поровну между блюдами дня,
+    # из доли блюда вычитается уже заказанное
+    by_day = {date_from + timedelta(days=n): {} for n in range((date_to - date_from).days + 1)}
+
+    reserved = db.execute(
+        select(
+            models.Order.order_date,
+            models.Recipe.inventory_id,
+            func.sum(models.Recipe.quantity_required).label("need"),
+        )
+        .join(models.Recipe, models.Recipe.menu_item_id == models.Order.menu_item_id)
+        .where(
+            models.Order.order_date >= date_from,
+            models.Order.order_date <= date_to,
+            models.Order.is_paid == True,
+            models.Order.is_received == False,
+        )
+        .group_by(models.Order.order_date, models.Recipe.inventory_id)
+    )
+    for row in reserved:
+        by_day[row.order_date].setdefault(row.inventory_id, [0.0, 0.0])[0] += row.need
+
+    typical = typical_portions(db, date_from)
+    if not typical:
+        return by_day
+
+    ordered = (
+        select(models.Order.menu_item_id, func.count().label("count"))
+        .where(models.Order.order_date >= date_from, models.Order.order_date <= date_to, models.Order.is_paid == True)
+        .group_by(models.Order.menu_item_id)
+        .subquery()
+    )
+    items = db.execute(
+        select(models.MenuItem.id, models.MenuItem.date, models.MenuItem.meal_type, func.coalesce(ordered.c.count, 0).label("ordered"))
+        .outerjoin(ordered, ordered.c.menu_item_id == models.MenuItem.id)
+        .where(models.MenuItem.date >= date_from, models.MenuItem.date <= date_to, models.MenuItem.is_available == True)
+    ).all()
+    dishes = {}
+    for item in items:
+        dishes[(item.date, item.meal_type)] = dishes.get((item.date, item.meal_type), 0) + 1
+    extra = {
+        item.id: typical.get(item.meal_type, 0) / dishes[(item.date, item.meal_type)] - item.ordered
+        for item in items
+    }
+    extra = {item_id: portions for item_id, portions in extra.items() if portions > 0}
+    if not extra:
+        return by_day
+
+    portions = case(extra, value=models.Recipe.menu_item_id, else_=0)
+    expected = db.execute(
+        select(
+            models.MenuItem.date,
+            models.Recipe.inventory_id,
+            func.sum(models.Recipe.quantity_required * portions).label("need"),
+        )
+        .join(models.MenuItem, models.MenuItem.id == models.Recipe.menu_item_id)
+        .where(models.Recipe.menu_item_id.in_(list(extra)))
+        .group_by(models.MenuItem.date, models.Recipe.inventory_id)
+    )
+    for row in expected:
+        by_day[row.date].setdefault(row.inventory_id, [0.0, 0.0])[1] += row.need
+    return by_day
+
+
+def demand(db: Session, date_from: date, date_to: date):
+    # Потребность за период, собранная из кэша по дням; дни, которых в кэше нет,
+    # досчитываются одним проходом по их общему диапазону
+    days = [date_from + timedelta(days=n) for n in range((date_to - date_from).days + 1)]
+    by_day = {day: demand_cache.get(tenant_key(("forecast", day))) for day in days}
+    missing = [day for day, cached in by_day.items() if cached is None]
+    if missing:
+        for day, needs in _load_demand(db, min(missing), max(missing)).items():
+            demand_cache.set(tenant_key(("forecast", day)), needs)
+            by_day[day] = needs
+
+    total = {}
+    for needs in by_day.values():
+        for inventory_id, (reserved, expected) in needs.items():
+            entry = total.setdefault(inventory_id, [0.0, 0.0])
+            entry[0] += reserved
+            entry[1] += expected
+    return total
+
+
+def forecast(db: Session, date_from: date, date_to: date):
+    # По строке на продукт, который понадобится за период; shortfall — сколько не хватит
+    # на ожидаемые заказы поверх свободного остатка (под оплаченные продукты уже списаны)
+    needs = demand(db, date_from, date_to)
+    if not needs:
+        return []
+    stock = db.execute(
+        select(models.Inventory.id, models.Inventory.product_name, models.Inventory.unit, models.Inventory.quantity)
+        .where(models.Inventory.id.in_(list(needs)))
+        .order_by(models.Inventory.id)
+    ).all()
+    return [
+        {
+            "inventory_id": row.id,
+            "product_name": row.product_name,
+            "unit": row.unit,
+            "quantity": row.quantity,
+            "reserved": round(needs[row.id][0], 3),
+            "expected": round(needs[row.id][1], 3),
+            "shortfall": round(max(needs[row.id][1] - row.quantity, 0.0), 3),
+        }
+        for row in stock
+    ]
+
+
+def generate_requests(db: Session, date_from: date, date_to: date, user_id: int):
+    # Заявки на закупку по нехватке прогноза одним INSERT; то, что уже заказано
+    # pending-заявками на тот же продукт в той же единице, из нехватки вычитается:
+    # заявку в другой единице approve_requests на этот продукт не оприходует.
+    # Коммит — под блокировкой, чтобы следующая генерация уже видела эти заявки
+    with _generate_lock:
+        shortfalls = [row for row in forecast(db, date_from, date_to) if row["shortfall"] > 0]
+        if not shortfalls:
+            return []
+        pending = {
+            (name, unit): quantity
+            for name, unit, quantity in db.execute(
+                select(
+                    models.PurchaseRequest.product_name,
+                    models.PurchaseRequest.unit,
+                    func.sum(models.PurchaseRequest.requested_quantity),
+                )
+                .where(
+                    models.PurchaseRequest.status == "pending",
+                    models.PurchaseRequest.product_name.in_([row["product_name"] for row in shortfalls]),
+                )
+                .group_by(models.PurchaseRequest.product_name, models.PurchaseRequest.unit)
+            )
+        }
+        rows = [
+            {
+                "product_name": row["product_name"],
+                "requested_quantity": round(row["shortfall"] - pending.get((row["product_name"], row["unit"]), 0.0), 3),
+                "unit": row["unit"],
+                "requested_by": user_id,
+                "status": "pending",
+            }
+            for row in shortfalls
+        ]
+        rows = [row for row in rows if row["requested_quantity"] > 0]
+        if not rows:
+            return []
+        created = [
+            schemas.PurchaseRequestOut.model_validate(request)
+            for request in db.scalars(
+                insert(models.PurchaseRequest).returning(models.PurchaseRequest, sort_by_parameter_order=True), rows
+            )
+        ]
+        db.commit()
+        return created
+
+
+def main():
+    # Для запуска по расписанию, например вечером на следующие учебные дни
+    parser = argparse.ArgumentParser(description="Прогноз расхода продуктов и заявки на закупку по нехватке")
+    parser.add_argument("--days", type=int, default=1, help="сколько дней начиная с завтрашнего")
+    parser.add_argument("--generate", action="store_true", help="создать заявки на закупку по нехватке")
+    parser.add_argument("--tenant", help="школа из TENANT_DATABASE_URL")
+    args = parser.parse_args()
+    if not 1 <= args.days <= MAX_FORECAST_DAYS:
+        parser.error(f"--days от 1 до {MAX_FORECAST_DAYS}")
+
+    if args.tenant:
+        if tenants is None:
+            parser.error("не задан TENANT_DATABASE_URL")
+        bind = tenant_engine(args.tenant)
+    else:
+        bind = engine
+    db = sessionmaker(bind=bind)()
+    date_from = date.today() + timedelta(days=1)
+    date_to = date_from + timedelta(days=args.days - 1)
+    for row in forecast(db, date_from, date_to):
+        print(f"{row['product_name']}: остаток {row['quantity']} {row['unit']}, "
+              f"оплачено {row['reserved']}, ожидается {row['expected']}, не хватает {row['shortfall']}")
+    if args.generate:
+        admin_id = db.scalar(select(func.min(models.User.id)).where(models.User.role == "admin"))
+        if admin_id is None:
+            parser.error("в базе нет администратора, от имени которого создавать заявки")
+        created = generate_requests(db, date_from, date_to, admin_id)
+        print(f"Создано заявок на закупку: {len(created)}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
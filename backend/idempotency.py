@@ -0,0 +1,148 @@
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend import models, settings
+from backend.cache import TTLCache
+from backend.database import current_tenant
+
+REPLAY_HEADER = "Idempotent-Replayed"
+PURGE_EVERY = 1000
+
+
+class Key:
+    __slots__ = ("value", "fingerprint")
+
+    def __init__(self, value: str, fingerprint: str):
+        self.value = value
+        self.fingerprint = fingerprint
+
+
+def make_key(header: str, scope: str, payload):
+    # Ключ клиента действует только в пределах эндпоинта и пользователя; отпечаток тела
+    # ловит повтор ключа с другим запросом
+    if not header:
+        return None
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False)
+    # Таблица своя у каждой школы, а кэш процесса общий — ключ в нём включает школу
+    tenant = current_tenant.get()
+    value = f"{scope}:{header}" if tenant is None else f"{tenant}/{scope}:{header}"
+    return Key(value, hashlib.sha256(body.encode()).hexdigest())
+
+
+class IdempotencyStore:
+    # Недавние ответы живут в TTLCache процесса, а на промах читаются из таблицы
+    # idempotency_keys. Дубликаты внутри процесса ждут первый запрос на замке ключа
+    # и получают его ответ, не выполняя транзакцию заново
+    def __init__(self, maxsize: int, ttl: float):
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.replays = 0
+        self.saved = 0
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lock(self, key: Key):
+        if key is None:
+            yield
+            return
+        with self._lock:
+            entry = self._locks.setdefault(key.value, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key.value]
+
+    def replay(self, db: Session, key: Key):
+        if key is None:
+            return None
+        stored = self.cache.get(key.value)
+        if stored is None:
+            row = db.execute(
+                select(models.IdempotencyKey.fingerprint, models.IdempotencyKey.status_code, models.IdempotencyKey.response)
+                .where(models.IdempotencyKey.key == key.value, models.IdempotencyKey.created_at >= self._cutoff())
+            ).first()
+            if row is None:
+                return None
+            stored = (row.fingerprint, row.status_code, row.response)
+            self.cache.set(key.value, stored)
+        fingerprint, status_code, response = stored
+        if fingerprint != key.fingerprint:
+            raise HTTPException(status_code=422, detail="Ключ идемпотентности уже использован с другим запросом")
+        with self._lock:
+            self.replays += 1
+        return JSONResponse(response, status_code=status_code, headers={REPLAY_HEADER: "true"})
+
+    def save(self, db: Session, key: Key, response, status_code: int = 200):
+        # Вызывается внутри транзакции операции, до коммита
+        if key is None:
+            return
+        response = jsonable_encoder(response)
+        db.execute(delete(models.IdempotencyKey).where(
+            models.IdempotencyKey.key == key.value, models.IdempotencyKey.created_at < self._cutoff()
+        ))
+        db.execute(insert(models.IdempotencyKey).values(
+            key=key.value, fingerprint=key.fingerprint, status_code=status_code,
+            response=response, created_at=datetime.utcnow(),
+        ))
+        with self._lock:
+            self.saved += 1
+            purge = self.saved % PURGE_EVERY == 0
+        if purge:
+            db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.created_at < self._cutoff()))
+
+    def remember(self, key: Key, response, status_code: int = 200):
+        # После коммита: следующий дубликат обслуживается из памяти
+        if key is not None:
+            self.cache.set(key.value, (key.fingerprint, status_code, jsonable_encoder(response)))
+
+    def recorded(self, key: Key, fn):
+        # Операция для write_queue: ответ пишется в той же точке сохранения, что и она сама
+        def operation(db: Session, *args):
+            result = fn(db, *args)
+            self.save(db, key, result)
+            return result
+        return operation
+
+    def is_duplicate(self, key: Key, error: Exception):
+        # Тот же ключ успел закоммитить другой процесс — наша транзакция откатилась целиком.
+        # Нарушено должно быть именно ограничение первичного ключа idempotency_keys, а не
+        # любое другое, в тексте которого встретилось имя таблицы
+        if key is None or not isinstance(error, IntegrityError):
+            return False
+        table = models.IdempotencyKey.__tablename__
+        constraint = getattr(getattr(error.orig, "diag", None), "constraint_name", None)
+        if constraint is not None:
+            return constraint == f"{table}_pkey"  # PostgreSQL
+        return str(error.orig) == f"UNIQUE constraint failed: {table}.key"  # SQLite
+
+    def replay_duplicate(self, db: Session, key: Key):
+        # Ответ на дубликат, проигравший гонку за ключ. Если ответа первого запроса ещё
+        # не видно, 500 клиенту ни к чему: запрос с этим ключом выполняется, его можно повторить
+        replay = self.replay(db, key)
+        if replay is None:
+            raise HTTPException(status_code=409, detail="Запрос с этим ключом идемпотентности ещё выполняется")
+        return replay
+
+    def _cutoff(self):
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    def stats(self):
+        with self._lock:
+            return {"replays": self.replays, "saved": self.saved, "in_flight": len(self._locks), **self.cache.stats()}
+
+
+idempotency_store = IdempotencyStore(settings.IDEMPOTENCY_CACHE_SIZE, settings.IDEMPOTENCY_TTL_SECONDS)
@@ -1,8 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from backend.routers import auth, menu, orders, admin, reviews
+from fastapi.responses import PlainTextResponse
+from backend import settings
+from backend.metrics import MetricsMiddleware, registry
+from backend.routers import auth, menu, orders, admin, reviews, exports, events, serving
+from backend.migrate import upgrade
+from backend.database import tenants
+from backend.serving import lines as serving_lines
+from backend.tenancy import TenantMiddleware
+from backend.write_queue import write_queue
 
-app = FastAPI(title="School Canteen API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схема досоздаётся при старте сервера, а не при импорте: бенчмарки, query_plans и
+    # тесты импортируют app, но работают со своими базами и отключают auto_migrate
+    if app.state.auto_migrate:
+        await run_in_threadpool(upgrade)
+    yield
+
+app = FastAPI(title="School Canteen API", lifespan=lifespan)
+app.state.auto_migrate = settings.AUTO_MIGRATE
+
+if tenants is not None:
+    # База школы досоздаётся при первом открытии в процессе (не при каждом повторном
+    # после вытеснения), а при вытеснении из реестра отпускаются писатель группового
+    # коммита и раздачи, державшиеся за её движок. Хуки идут вне замка реестра и вне цикла событий
+    tenants.on_create(upgrade)
+    tenants.on_close(serving_lines.release)
+    tenants.on_close(write_queue.release)
+    # Добавлен первым — внутри CORS, чтобы и отказы получали CORS-заголовки
+    app.add_middleware(TenantMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,14 +39,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Idempotent-Replayed"],
 )
+# Последним, чтобы замер охватывал и CORS
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router)
 app.include_router(menu.router)
 app.include_router(orders.router)
 app.include_router(admin.router)
 app.include_router(reviews.router)
+app.include_router(exports.router)
+app.include_router(events.router)
+app.include_router(serving.router)
 
 @app.get("/")
 def home():
-    return {"message": "API системы 'Школьная Столовая' работает!"}
\ No newline at end of file
+    return {"message": "API системы 'Школьная Столовая' работает!"}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    # Формат Prometheus text exposition
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
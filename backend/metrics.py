@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from backend import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+slow_query_log = logging.getLogger("canteen.slow_queries")
+
+# Счётчики текущего запроса; middleware кладёт сюда RequestStats, хуки движка дописывают
+current_request = ContextVar("current_request", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    __slots__ = ("route", "queries", "db_time")
+
+    def __init__(self, route):
+        self.route = route
+        self.queries = 0
+        self.db_time = 0.0
+
+
+class Registry:
+    # Все метрики процесса под одной блокировкой: запись — несколько сложений
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}
+            self.queries_per_request = {}
+            self.db_time_per_request = {}
+            self.responses = {}
+            self.queries_total = 0
+            self.db_time_total = 0.0
+            self.slow_queries = 0
+
+    def observe_request(self, method, route, status, duration, stats: RequestStats):
+        key = (method, route)
+        with self._lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.queries_per_request[key] = Histogram(QUERY_COUNT_BUCKETS)
+                self.db_time_per_request[key] = Histogram(LATENCY_BUCKETS)
+            self.latency[key].observe(duration)
+            self.queries_per_request[key].observe(stats.queries)
+            self.db_time_per_request[key].observe(stats.db_time)
+            self.responses[key + (status,)] = self.responses.get(key + (status,), 0) + 1
+
+    def observe_query(self, duration, slow):
+        with self._lock:
+            self.queries_total += 1
+            self.db_time_total += duration
+            if slow:
+                self.slow_queries += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            _histograms(lines, "canteen_http_request_duration_seconds", "Время обработки запроса", self.latency)
+            lines.append("# HELP canteen_http_responses_total Ответы по маршруту и коду статуса")
+            lines.append("# TYPE canteen_http_responses_total counter")
+            for (method, route, status), value in sorted(self.responses.items()):
+                lines.append(f'canteen_http_responses_total{{{_labels(method, route)},status="{status}"}} {value}')
+            _histograms(lines, "canteen_db_queries_per_request", "SQL-запросов на HTTP-запрос", self.queries_per_request)
+            _histograms(lines, "canteen_db_seconds_per_request", "Время в базе на HTTP-запрос", self.db_time_per_request)
+            for name, kind, help_text, value in (
+                ("canteen_db_queries_total", "counter", "Всего SQL-запросов", self.queries_total),
+                ("canteen_db_seconds_total", "counter", "Всего времени в базе", round(self.db_time_total, 6)),
+                ("canteen_db_slow_queries_total", "counter", "Запросов дольше SLOW_QUERY_MS", self.slow_queries),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(method, route):
+    return f'method="{_escape(method)}",route="{_escape(route)}"'
+
+
+def _histograms(lines, name, help_text, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for (method, route), histogram in sorted(histograms.items()):
+        labels = _labels(method, route)
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {round(histogram.sum, 6)}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+registry = Registry()
+
+
+def record_query(statement, duration):
+    # Вызывается из хуков движка после каждого SQL-запроса
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += duration
+    slow = settings.SLOW_QUERY_MS > 0 and duration * 1000 >= settings.SLOW_QUERY_MS
+    registry.observe_query(duration, slow)
+    if slow:
+        slow_query_log.warning(
+            "%.1f ms [%s] %s", duration * 1000, stats.route if stats else "-", " ".join(statement.split())[:1000]
+        )
+
+
+class MetricsMiddleware:
+    # Чистый ASGI: не буферизует тело ответа, поэтому не мешает потоковым выгрузкам
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope["path"])
+        token = current_request.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request.reset(token)
+            # В метки идёт шаблон маршрута, а не путь с id; неизвестные пути сводим в одну метку
+            route = scope.get("route")
+            stats.route = route.path if route is not None else "unmatched"
+            registry.observe_request(scope["method"], stats.route, status, time.perf_counter() - started, stats)
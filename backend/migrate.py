@@ -0,0 +1,109 @@
+import argparse
+import os
+from sqlalchemy import inspect, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+from backend.database import engine, Base, make_engine, tenants
+from backend import models, allergens, stats
+from backend.tenancy import TENANT_NAME
+
+
+def add_missing_columns(bind):
+    # Новые nullable-колонки добавляются в существующие таблицы через ALTER TABLE
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+
+
+def add_autoincrement(bind):
+    # Таблицы, которым в модели добавили sqlite_autoincrement, пересоздаются с
+    # AUTOINCREMENT (ALTER TABLE этого не умеет), а счётчик id начинается не ниже
+    # уже перенесённых в архив строк
+    if bind.dialect.name != "sqlite":
+        return
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not table.dialect_options["sqlite"]["autoincrement"]:
+                continue
+            ddl = conn.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+            ).scalar()
+            if "AUTOINCREMENT" in ddl.upper():
+                continue
+            columns = ", ".join(column["name"] for column in inspector.get_columns(table.name))
+            for index in inspector.get_indexes(table.name):
+                conn.exec_driver_sql(f"DROP INDEX {index['name']}")
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {table.name}_old")
+            table.create(conn)
+            conn.exec_driver_sql(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {table.name}_old")
+            conn.exec_driver_sql(f"DROP TABLE {table.name}_old")
+            archived = conn.scalar(
+                select(models.ArchiveState.max_id).where(models.ArchiveState.name == table.name)
+            )
+            if archived is not None:
+                conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = ?", (table.name,))
+                conn.exec_driver_sql(
+                    f"INSERT INTO sqlite_sequence (name, seq) SELECT ?, max(?, coalesce(max(id), 0)) FROM {table.name}",
+                    (table.name, archived),
+                )
+
+
+def upgrade(bind=engine):
+    # create_all не трогает уже существующие таблицы, поэтому колонки и индексы,
+    # добавленные в модели позже, досоздаются отдельно
+    existing = set(inspect(bind).get_table_names())
+    Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+    add_autoincrement(bind)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+    allergens.backfill(bind)
+    # Сводные таблицы, только что появившиеся в базе с историей, заполняются сразу —
+    # иначе отчёты и рейтинги блюд показывают нули до ручного `stats rebuild`
+    if not {models.DailyStats.__tablename__, models.RatingStats.__tablename__} <= existing:
+        db = Session(bind=bind)
+        try:
+            stats.rebuild(db)
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Досоздание таблиц, колонок и индексов")
+    parser.add_argument("--tenant", action="append", help="школа из TENANT_DATABASE_URL; можно повторять")
+    parser.add_argument("--all-tenants", action="store_true", help="все школы, у которых уже есть база")
+    args = parser.parse_args()
+
+    if not args.tenant and not args.all_tenants:
+        upgrade()
+        print("Схема базы обновлена")
+        return
+    if tenants is None:
+        parser.error("не задан TENANT_DATABASE_URL")
+    for tenant in args.tenant or tenants.names():
+        if not TENANT_NAME.match(tenant):
+            parser.error(f"некорректное имя школы: {tenant}")
+        bind = tenant_engine(tenant)
+        upgrade(bind)
+        bind.dispose()
+        print(f"Схема базы школы {tenant} обновлена")
+
+
+def tenant_engine(tenant: str):
+    # Движок базы школы вне реестра (для CLI); каталог под файл SQLite создаётся заранее
+    url = make_url(tenants.url(tenant))
+    if url.get_backend_name() == "sqlite" and url.database:
+        os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+    return make_engine(tenants.url(tenant))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
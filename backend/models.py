@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Date, CheckConstraint
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Date, CheckConstraint, Index, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from backend.database import Base
@@ -27,6 +27,7 @@ class MenuItem(Base):
     __tablename__ = "menu_items"
     __table_args__ = (
         CheckConstraint('price >= 0', name='check_price_positive'),
+        Index('ix_menu_items_date_meal_type_is_available', 'date', 'meal_type', 'is_available'),
     )
 
     id = Column(Integer, primary_key=True, index=True)
@@ -36,16 +37,33 @@ class MenuItem(Base):
     meal_type = Column(String, nullable=False)
     date = Column(Date, nullable=False)
     is_available = Column(Boolean, default=True)
+    allergens = Column(JSON, nullable=True)
 
     orders = relationship("Order", back_populates="menu_item")
     reviews = relationship("Review", back_populates="menu_item")
     ingredients = relationship("Recipe", back_populates="menu_item", cascade="all, delete-orphan")
+    rating = relationship("RatingStats", uselist=False, viewonly=True)
+
+    @property
+    def rating_count(self):
+        return self.rating.reviews_count if self.rating else None
+
+    @property
+    def rating_average(self):
+        return self.rating.rating_sum / self.rating.reviews_count if self.rating and self.rating.reviews_count else None
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index('ix_orders_order_date_is_paid', 'order_date', 'is_paid'),
+        Index('ix_orders_is_paid_is_received', 'is_paid', 'is_received'),
+        # Строки уезжают в orders_archive: без AUTOINCREMENT SQLite выдал бы новым
+        # заказам id, которые уже лежат в архиве
+        {'sqlite_autoincrement': True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     menu_item_id = Column(Integer, ForeignKey("menu_items.id"), nullable=False)
     order_date = Column(Date, nullable=False)
     payment_type = Column(String, nullable=False)
@@ -56,6 +74,16 @@ class Order(Base):
     user = relationship("User", back_populates="orders")
     menu_item = relationship("MenuItem", back_populates="orders")
 
+class DailyStats(Base):
+    __tablename__ = "daily_stats"
+
+    day = Column(Date, primary_key=True)
+    meal_type = Column(String, primary_key=True)
+    paid_count = Column(Integer, nullable=False, default=0)
+    received_count = Column(Integer, nullable=False, default=0)
+    waiting_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
 class Inventory(Base):
     __tablename__ = "inventory"
     __table_args__ = (
@@ -75,7 +103,7 @@ class Recipe(Base):
     )
 
     id = Column(Integer, primary_key=True, index=True)
-    menu_item_id = Column(Integer, ForeignKey("menu_items.id"))
+    menu_item_id = Column(Integer, ForeignKey("menu_items.id"), index=True)
     inventory_id = Column(Integer, ForeignKey("inventory.id"))
     quantity_required = Column(Float, nullable=False)
 
@@ -86,20 +114,38 @@ class Review(Base):
     __tablename__ = "reviews"
     __table_args__ = (
         CheckConstraint('rating >= 1 AND rating <= 5', name='check_rating_range'),
+        Index('ix_reviews_user_id_menu_item_id', 'user_id', 'menu_item_id'),
+        {'sqlite_autoincrement': True},  # как у orders: id не должны повторять архивные
     )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    menu_item_id = Column(Integer, ForeignKey("menu_items.id"), nullable=False)
+    menu_item_id = Column(Integer, ForeignKey("menu_items.id"), nullable=False, index=True)
     rating = Column(Integer, nullable=False)
     comment = Column(String, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     user = relationship("User", back_populates="reviews")
     menu_item = relationship("MenuItem", back_populates="reviews")
 
+class RatingStats(Base):
+    __tablename__ = "rating_stats"
+
+    menu_item_id = Column(Integer, ForeignKey("menu_items.id"), primary_key=True)
+    reviews_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_1 = Column(Integer, nullable=False, default=0)
+    rating_2 = Column(Integer, nullable=False, default=0)
+    rating_3 = Column(Integer, nullable=False, default=0)
+    rating_4 = Column(Integer, nullable=False, default=0)
+    rating_5 = Column(Integer, nullable=False, default=0)
+    last_review_at = Column(DateTime(timezone=True), nullable=True)
+
 class PurchaseRequest(Base):
     __tablename__ = "purchase_requests"
+    __table_args__ = (
+        Index('ix_purchase_requests_product_name_status', 'product_name', 'status'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     product_name = Column(String, nullable=False)
@@ -114,3 +160,55 @@ class PurchaseRequest(Base):
     requester = relationship("User", foreign_keys=[requested_by], back_populates="requests_made")
     approver = relationship("User", foreign_keys=[approved_by], back_populates="requests_approved")
 
+
+# Архив: старые заказы и отзывы переносятся сюда с теми же id (python -m backend.archive),
+# чтобы горячие таблицы оставались маленькими. Запросы заглядывают в архив, только
+# если диапазон дат заходит за границу из archive_state
+
+class OrderArchive(Base):
+    __tablename__ = "orders_archive"
+    __table_args__ = (
+        Index('ix_orders_archive_user_id_id', 'user_id', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    menu_item_id = Column(Integer, ForeignKey("menu_items.id"), nullable=False, index=True)
+    order_date = Column(Date, nullable=False, index=True)
+    payment_type = Column(String, nullable=False)
+    is_paid = Column(Boolean, default=False)
+    is_received = Column(Boolean, default=False)
+    created_at = Column(DateTime(timezone=True))
+
+class ReviewArchive(Base):
+    __tablename__ = "reviews_archive"
+    __table_args__ = (
+        Index('ix_reviews_archive_user_id_menu_item_id', 'user_id', 'menu_item_id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    menu_item_id = Column(Integer, ForeignKey("menu_items.id"), nullable=False, index=True)
+    rating = Column(Integer, nullable=False)
+    comment = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), index=True)
+
+class ArchiveState(Base):
+    __tablename__ = "archive_state"
+
+    name = Column(String, primary_key=True)  # "orders" или "reviews"
+    horizon = Column(Date, nullable=False)  # всё, что раньше этой даты, лежит в архиве
+    max_id = Column(Integer, nullable=False)  # наибольший id в архиве
+
+class IdempotencyKey(Base):
+    # Ответы на запросы с заголовком Idempotency-Key: повтор с тем же ключом получает
+    # сохранённый ответ вместо повторного выполнения. Запись вставляется в той же
+    # транзакции, что и сама операция, поэтому второй процесс с тем же ключом
+    # упирается в первичный ключ и откатывается
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
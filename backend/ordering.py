@@ -0,0 +1,129 @@
+from fastapi import HTTPException
+from sqlalchemy import select, exists, func, case, insert
+from sqlalchemy.orm import Session, aliased
+from backend import models, schemas, allergens, stats
+
+
+def find_allergen(food_preferences, item):
+    conflicts = allergens.user_allergens(food_preferences) & allergens.item_allergens(item)
+    return min(conflicts) if conflicts else None
+
+
+def _ingredient_needs(portions_by_item: dict):
+    # Сколько каждого продукта нужно на все порции: inventory_id -> need
+    portions = case(portions_by_item, value=models.Recipe.menu_item_id, else_=0)
+    return (
+        select(
+            models.Recipe.inventory_id.label("inventory_id"),
+            func.sum(models.Recipe.quantity_required * portions).label("need"),
+        )
+        .where(models.Recipe.menu_item_id.in_(list(portions_by_item)))
+        .group_by(models.Recipe.inventory_id)
+        .subquery()
+    )
+
+
+def find_shortages(db: Session, portions_by_item: dict):
+    needs = _ingredient_needs(portions_by_item)
+    rows = db.execute(
+        select(models.Inventory.product_name)
+        .join(needs, needs.c.inventory_id == models.Inventory.id)
+        .where(models.Inventory.quantity < needs.c.need)
+        .order_by(models.Inventory.id)
+    ).all()
+    return [row.product_name for row in rows]
+
+
+def reserve_ingredients(db: Session, portions_by_item: dict):
+    # Одно условное UPDATE на все ингредиенты: либо списываются все, либо ни один.
+    # Проверка остатков и списание происходят в одном операторе, поэтому
+    # параллельные заказы не могут увести склад в минус.
+    needs = _ingredient_needs(portions_by_item)
+    stock = aliased(models.Inventory)
+    has_shortage = exists(
+        select(1)
+        .select_from(needs.join(stock, stock.id == needs.c.inventory_id))
+        .where(stock.quantity < needs.c.need)
+    )
+    need = select(needs.c.need).where(needs.c.inventory_id == models.Inventory.id).scalar_subquery()
+
+    reserved = db.query(models.Inventory).filter(
+        models.Inventory.id.in_(select(needs.c.inventory_id)),
+        ~has_shortage,
+    ).update(
+        {models.Inventory.quantity: models.Inventory.quantity - need},
+        synchronize_session=False,
+    )
+    if reserved:
+        return reserved
+
+    shortages = find_shortages(db, portions_by_item)
+    if shortages:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Блюдо нельзя приготовить: закончился продукт '{shortages[0]}'"
+        )
+    return 0
+
+
+def reserve_each(db: Session, item_ids):
+    # Списание по одной порции на каждый элемент, каждое в своей точке сохранения:
+    # отказ (нехватка продукта) получает только тот элемент, которому не хватило.
+    # Возвращает detail отказа или None по каждому элементу
+    details = []
+    for item_id in item_ids:
+        try:
+            with db.begin_nested():
+                reserve_ingredients(db, {item_id: 1})
+            details.append(None)
+        except HTTPException as error:
+            details.append(error.detail)
+    return details
+
+
+def debit_balance(db: Session, user_id: int, amount: float):
+    debited = db.query(models.User).filter(
+        models.User.id == user_id,
+        models.User.balance >= amount,
+    ).update(
+        {models.User.balance: models.User.balance - amount},
+        synchronize_session=False,
+    )
+    if not debited:
+        raise HTTPException(status_code=402, detail="Недостаточно средств")
+
+
+# Операции записи ниже не коммитят и не откатывают транзакцию сами: это делает
+# вызывающий код или очередь групповой записи (write_queue), которая откатывает
+# только точку сохранения неудавшейся операции
+
+def create_order(db: Session, user_id: int, item_id: int, price: float, meal_type: str, order_date, payment_type: str):
+    reserve_ingredients(db, {item_id: 1})
+    debit_balance(db, user_id, price)
+    order = db.scalars(insert(models.Order).returning(models.Order), [{
+        "user_id": user_id,
+        "menu_item_id": item_id,
+        "order_date": order_date,
+        "payment_type": payment_type,
+        "is_paid": True,
+        "is_received": False,
+    }]).one()
+    stats.record_paid(db, order_date, meal_type, price)
+    return schemas.OrderOut.model_validate(order)
+
+
+def receive_order(db: Session, order_id: int):
+    row = db.query(models.Order, models.MenuItem.meal_type).join(
+        models.MenuItem, models.Order.menu_item_id == models.MenuItem.id
+    ).filter(models.Order.id == order_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Заказ не найден")
+
+    db_order, meal_type = row
+    if db_order.is_received:
+        raise HTTPException(status_code=400, detail="Питание по этому заказу уже получено")
+
+    db_order.is_received = True
+    stats.record_received(db, db_order.order_date, meal_type, db_order.is_paid)
+    db.flush()
+    return schemas.OrderOut.model_validate(db_order)
@@ -0,0 +1,77 @@
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from fastapi import Query, Response
+from sqlalchemy import DateTime
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    # Страницы идут от новых записей к старым; курсор — id последней записи
+    # предыдущей страницы
+    def __init__(
+        self,
+        cursor: Optional[int] = Query(None, description="id последней записи предыдущей страницы"),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        date_from: Optional[date] = Query(None),
+        date_to: Optional[date] = Query(None),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+        self.date_from = date_from
+        self.date_to = date_to
+
+
+def date_range(column, date_from: Optional[date], date_to: Optional[date]):
+    conditions = []
+    if isinstance(column.type, DateTime):
+        if date_from:
+            conditions.append(column >= datetime.combine(date_from, time.min))
+        if date_to:
+            conditions.append(column < datetime.combine(date_to + timedelta(days=1), time.min))
+    else:
+        if date_from:
+            conditions.append(column >= date_from)
+        if date_to:
+            conditions.append(column <= date_to)
+    return conditions
+
+
+def paginate(query, id_column, page: PageParams, response: Response, date_column=None):
+    if date_column is not None:
+        query = query.filter(*date_range(date_column, page.date_from, page.date_to))
+    if page.cursor is not None:
+        query = query.filter(id_column < page.cursor)
+
+    rows = query.order_by(id_column.desc()).limit(page.limit + 1).all()
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = str(rows[-1].id)
+    return rows
+
+
+async def _page_async(db, stmt, id_column, page: PageParams, date_column):
+    if date_column is not None:
+        stmt = stmt.where(*date_range(date_column, page.date_from, page.date_to))
+    if page.cursor is not None:
+        stmt = stmt.where(id_column < page.cursor)
+    return (await db.scalars(stmt.order_by(id_column.desc()).limit(page.limit + 1))).all()
+
+
+async def paginate_async(db, stmt, id_column, page: PageParams, response: Response, date_column=None, archived=None):
+    # archived — (stmt, id_column, date_column, max_id) той же выборки по архивной таблице:
+    # id там те же, что были в горячей, поэтому страницы двух таблиц просто сливаются по id.
+    # Все архивные id не больше max_id, так что полная страница горячих строк выше него
+    # в архив не ходит
+    rows = await _page_async(db, stmt, id_column, page, date_column)
+    if archived is not None:
+        archived_stmt, archived_id, archived_date, max_id = archived
+        if len(rows) <= page.limit or rows[-1].id <= max_id:
+            rows += await _page_async(db, archived_stmt, archived_id, page, archived_date)
+            rows.sort(key=lambda row: row.id, reverse=True)
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = str(rows[-1].id)
+    return rows
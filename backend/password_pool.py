@@ -0,0 +1,103 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from backend import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordPool:
+    # bcrypt считается в отдельных процессах, а очередь ограничена: лишние запросы
+    # получают 503. Эндпоинты ждут результат асинхронно (hash_async/verify_async),
+    # поэтому вход и регистрация не занимают потоки FastAPI, нужные остальным эндпоинтам
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.rejected = 0
+        self._executor = None
+        self._pending = 0
+        self._latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.queue_size:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Сервер перегружен, повторите попытку позже",
+                    headers={"Retry-After": str(self._retry_after())},
+                )
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._pending += 1
+        return time.perf_counter()
+
+    def _release(self, started):
+        with self._lock:
+            self._pending -= 1
+            self._latencies.append(time.perf_counter() - started)
+
+    def _submit(self, fn, *args):
+        # Для CLI (seed): ждёт результат в текущем потоке
+        started = self._acquire()
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._release(started)
+
+    async def _submit_async(self, fn, *args):
+        # Для эндпоинтов: ждёт результат в цикле событий, не занимая поток пула FastAPI
+        started = self._acquire()
+        try:
+            return await asyncio.wrap_future(self._executor.submit(fn, *args))
+        finally:
+            self._release(started)
+
+    def _retry_after(self):
+        if not self._latencies:
+            return 1
+        average = sum(self._latencies) / len(self._latencies)
+        return max(1, math.ceil(self._pending * average / self.workers))
+
+    def hash(self, password):
+        return self._submit(_hash, password)
+
+    def verify(self, plain_password, hashed_password):
+        return self._submit(_verify, plain_password, hashed_password)
+
+    async def hash_async(self, password):
+        return await self._submit_async(_hash, password)
+
+    async def verify_async(self, plain_password, hashed_password):
+        return await self._submit_async(_verify, plain_password, hashed_password)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            pending = self._pending
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queue_depth": pending,
+            "rejected": self.rejected,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "latency_p99": latencies[int(len(latencies) * 0.99)] if latencies else None,
+            "latency_max": latencies[-1] if latencies else None,
+        }
+
+
+password_pool = PasswordPool(settings.PASSWORD_WORKERS, settings.PASSWORD_QUEUE_SIZE)
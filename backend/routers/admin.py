@@ -1,58 +1,122 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
-from datetime import date, datetime
-from backend.routers.auth import get_current_user
-from backend import models, schemas, database
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+from backend.routers.auth import get_current_user, token_cache, user_cache
+from backend.password_pool import password_pool
+from backend.write_queue import write_queue
+from backend.idempotency import idempotency_store
+from backend import models, schemas, database, events, stock, forecast
+from backend.pagination import PageParams, paginate, paginate_async
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
 @router.get("/purchase-requests", response_model=List[schemas.PurchaseRequestOut])
-def get_all_requests(status: str = None, db: Session = Depends(database.get_db)):
+def get_all_requests(response: Response, status: str = None, page: PageParams = Depends(), db: Session = Depends(database.get_read_db)):
     query = db.query(models.PurchaseRequest)
     if status:
         query = query.filter(models.PurchaseRequest.status == status)
-    return query.all()
+    return paginate(query, models.PurchaseRequest.id, page, response, date_column=models.PurchaseRequest.created_at)
 
 @router.patch("/purchase-requests/{req_id}/approve")
-def approve_request(req_id: int, admin_id: int, db: Session = Depends(database.get_db)):
+def approve_request(
+    req_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Только для админа")
+
     req = db.query(models.PurchaseRequest).filter(models.PurchaseRequest.id == req_id).first()
     if not req:
         raise HTTPException(status_code=404, detail="Заявка не найдена")
     
-    req.status = "approved"
-    req.approved_by = admin_id
-    req.approved_at = datetime.now()
+    result = stock.approve_requests(db, [req_id], current_user.id)[0]
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["detail"])
     
     db.commit()
+    events.purchase_request_changed(req_id, "approved")
+    events.stock_changed(db, inventory_ids=[result["inventory_id"]])
     return {"message": "Заявка одобрена"}
 
+@router.post("/purchase-requests/approve", response_model=List[schemas.PurchaseApprovalResult])
+def approve_requests_batch(
+    request_ids: List[int],
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Только для админа")
+
+    try:
+        results = stock.approve_requests(db, request_ids, current_user.id)
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+
+    approved = [result for result in results if result["success"]]
+    for result in approved:
+        events.purchase_request_changed(result["id"], "approved")
+    if approved:
+        events.stock_changed(db, inventory_ids={result["inventory_id"] for result in approved})
+    return results
+
+def forecast_period(date_from: Optional[date], date_to: Optional[date]):
+    # По умолчанию — завтрашний день
+    date_from = date_from or date.today() + timedelta(days=1)
+    date_to = date_to or date_from
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to раньше date_from")
+    if (date_to - date_from).days >= forecast.MAX_FORECAST_DAYS:
+        raise HTTPException(status_code=400, detail=f"Период прогноза — не больше {forecast.MAX_FORECAST_DAYS} дней")
+    return date_from, date_to
+
+@router.get("/forecast", response_model=List[schemas.IngredientForecast])
+def get_forecast(
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(database.get_read_db)
+):
+    if current_user.role not in ["admin", "cook"]:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+
+    return forecast.forecast(db, *forecast_period(date_from, date_to))
+
+@router.post("/purchase-requests/generate", response_model=List[schemas.PurchaseRequestOut])
+def generate_purchase_requests(
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    # Заявки на закупку всего, чего по прогнозу не хватит, за вычетом уже ожидающих заявок
+    if current_user.role not in ["admin", "cook"]:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+
+    created = forecast.generate_requests(db, *forecast_period(date_from, date_to), current_user.id)
+    for request in created:
+        events.purchase_request_changed(request.id, "pending")
+    return created
+
 @router.get("/stats/daily-report")
-def get_daily_report(
+async def get_daily_report(
     day: date = Query(default=date.today()), 
-    current_user: models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    current_user: schemas.CurrentUser = Depends(get_current_user), 
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Доступ только для администраторов")
     
-    total_orders = db.query(models.Order).filter(
-        models.Order.order_date == day,
-        models.Order.is_paid == True
-    ).count()
-
-    actually_received = db.query(models.Order).filter(
-        models.Order.order_date == day,
-        models.Order.is_received == True
-    ).count()
-
-    revenue = db.query(func.sum(models.MenuItem.price)).join(
-        models.Order, models.Order.menu_item_id == models.MenuItem.id
-    ).filter(
-        models.Order.order_date == day,
-        models.Order.is_paid == True
-    ).scalar() or 0.0
+    total_orders, actually_received, revenue = (await db.execute(select(
+        func.coalesce(func.sum(models.DailyStats.paid_count), 0),
+        func.coalesce(func.sum(models.DailyStats.received_count), 0),
+        func.coalesce(func.sum(models.DailyStats.revenue), 0.0)
+    ).where(models.DailyStats.day == day))).one()
 
     return {
         "date": day,
@@ -63,22 +127,70 @@ def get_daily_report(
     }
 
 @router.get("/stats/attendance")
-def get_attendance_report(db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
+async def get_attendance_report(
+    meal_type: str,
+    day: date = Query(default_factory=date.today),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: schemas.CurrentUser = Depends(get_current_user)
+):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Только для админа")
     
-    waiting = db.query(models.Order).filter(models.Order.is_paid == True, models.Order.is_received == False).count()
-    fed = db.query(models.Order).filter(models.Order.is_received == True).count()
+    # Одна строка сводки по первичному ключу (день, приём пищи)
+    row = await db.get(models.DailyStats, (day, meal_type))
+    waiting = row.waiting_count if row is not None else 0
+    fed = row.received_count if row is not None else 0
     
     return {
+        "date": day,
+        "meal_type": meal_type,
         "waiting_count": waiting,
         "fed_count": fed,
         "total_attendance": waiting + fed
     }
 
+@router.get("/stats/cache")
+def get_cache_stats(current_user: schemas.CurrentUser = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Только для админа")
+
+    return {
+        "tokens": token_cache.stats(),
+        "users": user_cache.stats()
+    }
+
+@router.get("/stats/passwords")
+def get_password_pool_stats(current_user: schemas.CurrentUser = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Только для админа")
+
+    return password_pool.stats()
+
+@router.get("/stats/writes")
+def get_write_queue_stats(current_user: schemas.CurrentUser = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Только для админа")
+
+    return write_queue.stats()
+
+@router.get("/stats/idempotency")
+def get_idempotency_stats(current_user: schemas.CurrentUser = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Только для админа")
+
+    return idempotency_store.stats()
+
+@router.get("/stats/events")
+async def get_event_stats(current_user: schemas.CurrentUser = Depends(get_current_user)):
+    # async: счётчики брокера живут в цикле событий, читаем их оттуда же
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Только для админа")
+
+    return events.broker.stats()
+
 @router.get("/inventory", response_model=List[schemas.Inventory]) 
-def get_inventory(db: Session = Depends(database.get_db)):
-    return db.query(models.Inventory).all()
+async def get_inventory(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    return await paginate_async(db, select(models.Inventory), models.Inventory.id, page, response)
 
 @router.put("/inventory/{item_id}")
 def update_inventory(item_id: int, quantity: float, db: Session = Depends(database.get_db)):
@@ -88,4 +200,22 @@ def update_inventory(item_id: int, quantity: float, db: Session = Depends(databa
     
     item.quantity = quantity
     db.commit()
-    return {"message": "Склад обновлен"}
\ No newline at end of file
+    events.stock_changed(db, inventory_ids=[item_id])
+    return {"message": "Склад обновлен"}
+
+@router.patch("/inventory", response_model=List[schemas.InventoryChangeResult])
+def update_inventory_batch(
+    changes: List[schemas.InventoryChange],
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    # Приход или инвентаризация сразу по многим продуктам одной транзакцией
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Только для админа")
+
+    results = stock.apply_changes(db, changes)
+    db.commit()
+    changed = {result["id"] for result in results if result["success"]}
+    if changed:
+        events.stock_changed(db, inventory_ids=changed)
+    return results
\ No newline at end of file
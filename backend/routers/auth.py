@@ -1,25 +1,33 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+import time
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from backend import models, schemas, database
+from backend.cache import TTLCache
+from backend.password_pool import password_pool
 
 SECRET_KEY = "SUPER_SECRET_KEY_FOR_SCHOOL_PROJECT"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440
+USER_CACHE_TTL_SECONDS = 60
+USER_CACHE_MAX_SIZE = 10000
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+# token -> username и username -> снимок пользователя, чтобы не ходить в users на каждый запрос
+token_cache = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+user_cache = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_pool.hash(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_pool.verify(plain_password, hashed_password)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -27,52 +35,90 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+# Растёт при каждом сбросе, как menu_generation: снимок, прочитанный до сброса,
+# не попадает в кэш. Сбрасывать нужно после каждого коммита, меняющего строку users
+user_generation = 0
+
+def snapshot_user(user: models.User):
+    return schemas.CurrentUser.model_validate(user)
+
+def invalidate_user(username: str):
+    global user_generation
+    user_generation += 1
+    user_cache.pop(database.tenant_key(username))
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Не удалось проверить учетные данные",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    username = token_cache.get(token)
+    if username is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
+        token_cache.set(token, username, ttl=payload["exp"] - time.time())
+
+    user = user_cache.get(database.tenant_key(username))
     if user is None:
-        raise credentials_exception
+        generation = user_generation
+        db_user = db.query(models.User).filter(models.User.username == username).first()
+        if db_user is None:
+            raise credentials_exception
+        user = snapshot_user(db_user)
+        if generation == user_generation:
+            user_cache.set(database.tenant_key(username), user)
     return user
 
+def find_user(db: Session, username: str):
+    # Соединение возвращается в пул сразу, а не держится, пока считается bcrypt
+    user = db.query(models.User).filter(models.User.username == username).first()
+    db.close()
+    return user
+
+def add_user(db: Session, user: models.User):
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    invalidate_user(user.username)
+    return user
+
+# Вход и регистрация асинхронные: bcrypt ждётся в цикле событий, а короткие запросы
+# к базе идут в пул потоков, так что всплеск входов не съедает пул FastAPI
+
 @router.post("/register", response_model=schemas.UserOut)
-def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+    db_user = await run_in_threadpool(find_user, db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Пользователь уже существует")
     
     new_user = models.User(
         username=user.username,
-        password_hash=get_password_hash(user.password),
+        password_hash=await password_pool.hash_async(user.password),
         email=user.email,
         role=user.role,
         food_preferences=user.food_preferences,
         balance=0.0 if user.role != "student" else 100.0
     )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return new_user
+    return await run_in_threadpool(add_user, db, new_user)
 
 @router.post("/login", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+    user = await run_in_threadpool(find_user, db, form_data.username)
+    if not user or not await password_pool.verify_async(form_data.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Неверный логин или пароль")
     
-    access_token = create_access_token(data={"sub": user.username})
+    claims = {"sub": user.username}
+    if database.current_tenant.get():
+        claims["tenant"] = database.current_tenant.get()
+    access_token = create_access_token(data=claims)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=schemas.UserOut)
-def read_users_me(current_user: models.User = Depends(get_current_user)):
+def read_users_me(current_user: schemas.CurrentUser = Depends(get_current_user)):
     return current_user
\ No newline at end of file
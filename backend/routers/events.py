@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from backend import schemas, database
+from backend.events import broker, topics_for
+from backend.routers.auth import get_current_user
+
+router = APIRouter(prefix="/events", tags=["Events"])
+
+
+def get_stream_user(
+    token: str = Query(..., description="JWT: EventSource не умеет передавать заголовок Authorization"),
+    db: Session = Depends(database.get_db, scope="function")
+):
+    # Сессия закрывается до начала потока, иначе каждый подписчик держал бы соединение пула
+    return get_current_user(token, db)
+
+
+@router.get("/")
+async def stream_events(current_user: schemas.CurrentUser = Depends(get_stream_user)):
+    # Server-Sent Events: заказы ученика, а для повара и админа — ещё склад,
+    # заявки на закупку и изменения счётчиков посещаемости
+    return StreamingResponse(
+        broker.stream(topics_for(current_user)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
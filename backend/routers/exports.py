@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, union_all
+from sqlalchemy.orm import Session
+from backend import models, schemas, database, archive
+from backend.pagination import date_range
+from backend.routers.auth import get_current_user
+
+EXPORT_CHUNK_SIZE = 1000
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+router = APIRouter(prefix="/admin/export", tags=["Export"])
+
+
+def require_admin(current_user: schemas.CurrentUser = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Только для админа")
+    return current_user
+
+
+def export_rows(stmt, fmt: str, bind=None):
+    # Строки читаются с сервера порциями по EXPORT_CHUNK_SIZE, поэтому память
+    # не зависит от размера таблицы
+    with (bind or database.read_engine).connect() as conn:
+        result = conn.execution_options(yield_per=EXPORT_CHUNK_SIZE).execute(stmt)
+        columns = list(result.keys())
+        if fmt == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(columns)
+            yield buffer.getvalue()
+        for partition in result.partitions():
+            buffer = io.StringIO()
+            if fmt == "csv":
+                csv.writer(buffer).writerows(partition)
+            else:
+                for row in partition:
+                    buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+
+
+def stream(stmt, fmt: str, name: str, db: Session):
+    # Сессия нужна только ради движка: выгрузка открывает своё соединение и
+    # живёт дольше зависимости
+    return StreamingResponse(
+        export_rows(stmt, fmt, bind=db.get_bind()),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+
+def orders_query(date_from=None, date_to=None, paid=None, received=None, table=models.Order):
+    stmt = (
+        select(
+            table.id.label("id"),
+            table.order_date,
+            table.created_at,
+            table.user_id,
+            models.User.username,
+            table.menu_item_id,
+            models.MenuItem.name.label("menu_item_name"),
+            models.MenuItem.meal_type,
+            models.MenuItem.price,
+            table.payment_type,
+            table.is_paid,
+            table.is_received,
+        )
+        .join(models.User, table.user_id == models.User.id)
+        .join(models.MenuItem, table.menu_item_id == models.MenuItem.id)
+        .where(*date_range(table.order_date, date_from, date_to))
+    )
+    if paid is not None:
+        stmt = stmt.where(table.is_paid == paid)
+    if received is not None:
+        stmt = stmt.where(table.is_received == received)
+    return stmt
+
+
+def reviews_query(date_from=None, date_to=None, menu_item_id=None, table=models.Review):
+    stmt = (
+        select(
+            table.id.label("id"),
+            table.created_at,
+            table.user_id,
+            table.menu_item_id,
+            models.MenuItem.name.label("menu_item_name"),
+            table.rating,
+            table.comment,
+        )
+        .join(models.MenuItem, table.menu_item_id == models.MenuItem.id)
+        .where(*date_range(table.created_at, date_from, date_to))
+    )
+    if menu_item_id is not None:
+        stmt = stmt.where(table.menu_item_id == menu_item_id)
+    return stmt
+
+
+def with_archive(db: Session, name: str, date_from, query, *args):
+    # Горячая таблица, а если диапазон заходит за границу архива — вместе с архивной
+    stmt = query(date_from, *args)
+    if archive.reaches(archive.state(db), name, date_from):
+        archived = query(date_from, *args, table=archive.TABLES[name][1])
+        return union_all(archived, stmt).order_by("id")
+    return stmt.order_by("id")
+
+
+@router.get("/orders")
+def export_orders(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    paid: Optional[bool] = None,
+    received: Optional[bool] = None,
+    current_user: schemas.CurrentUser = Depends(require_admin),
+    db: Session = Depends(database.get_read_db)
+):
+    stmt = with_archive(db, "orders", date_from, orders_query, date_to, paid, received)
+    return stream(stmt, format, "orders", db)
+
+
+@router.get("/reviews")
+def export_reviews(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    menu_item_id: Optional[int] = None,
+    current_user: schemas.CurrentUser = Depends(require_admin),
+    db: Session = Depends(database.get_read_db)
+):
+    stmt = with_archive(db, "reviews", date_from, reviews_query, date_to, menu_item_id)
+    return stream(stmt, format, "reviews", db)
+
+
+@router.get("/inventory")
+def export_inventory(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    current_user: schemas.CurrentUser = Depends(require_admin),
+    db: Session = Depends(database.get_read_db)
+):
+    stmt = select(
+        models.Inventory.id,
+        models.Inventory.product_name,
+        models.Inventory.quantity,
+        models.Inventory.unit,
+        models.Inventory.last_updated,
+    ).order_by(models.Inventory.id)
+    return stream(stmt, format, "inventory", db)
@@ -1,39 +1,159 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+import hashlib
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Response
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from pydantic import TypeAdapter
 from typing import List, Optional
 from datetime import date as date_type
 
-from backend import models, schemas, database
+from backend import models, schemas, database, allergens
+from backend.cache import TTLCache
 from backend.routers.auth import get_current_user
 
+MENU_CACHE_TTL_SECONDS = 300
+MENU_CACHE_MAX_SIZE = 256
 
 router = APIRouter(prefix="/menu", tags=["Menu"])
 
+# (day, meal_type) -> (etag, готовый JSON, список блюд); сбрасывается при любой записи в меню или рецепты
+menu_cache = TTLCache(maxsize=MENU_CACHE_MAX_SIZE, ttl=MENU_CACHE_TTL_SECONDS)
+menu_adapter = TypeAdapter(List[schemas.MenuItemOut])
+
+# Растёт при каждом сбросе: выборка, начатая до сброса, не кладёт в кэш устаревшее меню.
+# Гонка двух сбросов может потерять прибавку, но значение всё равно уйдёт от прочитанного
+menu_generation = 0
+
+def invalidate_menu():
+    global menu_generation
+    menu_generation += 1
+    menu_cache.clear()
+
+def invalidate_menu_day(day: date_type, meal_type: str):
+    # Только выборки школы текущего запроса, в которые попадает блюдо этого дня и приёма пищи
+    global menu_generation
+    menu_generation += 1
+    for key in ((day, meal_type), (day, None), (None, meal_type), (None, None)):
+        menu_cache.pop(database.tenant_key(key))
+
+def etag_matches(if_none_match: Optional[str], etag: str):
+    # If-None-Match — список тегов через запятую, слабые с префиксом W/, или "*"
+    if not if_none_match:
+        return False
+    return any(
+        candidate == "*" or candidate.removeprefix("W/") == etag
+        for candidate in (part.strip() for part in if_none_match.split(","))
+    )
+
+async def load_menu(db: AsyncSession, day: Optional[date_type], meal_type: Optional[str]):
+    stmt = select(models.MenuItem).options(
+        joinedload(models.MenuItem.ingredients),
+        joinedload(models.MenuItem.rating)
+    ).where(models.MenuItem.is_available == True)
+
+    if day:
+        stmt = stmt.where(models.MenuItem.date == day)
+    if meal_type:
+        stmt = stmt.where(models.MenuItem.meal_type == meal_type)
+
+    items = (await db.scalars(stmt)).unique().all()
+    menu = menu_adapter.validate_python(items, from_attributes=True)
+    body = menu_adapter.dump_json(menu)
+    return f'"{hashlib.sha1(body).hexdigest()}"', body, menu
+
+async def cached_menu(db: AsyncSession, day: Optional[date_type], meal_type: Optional[str]):
+    key = database.tenant_key((day, meal_type))
+    cached = menu_cache.get(key)
+    if cached is None:
+        generation = menu_generation
+        cached = await load_menu(db, day, meal_type)
+        if generation == menu_generation:
+            menu_cache.set(key, cached)
+    return cached
+
 @router.get("/", response_model=List[schemas.MenuItemOut])
-def get_menu(
+async def get_menu(
     day: Optional[date_type] = Query(None, description="Дата меню (по умолчанию сегодня)"),
     meal_type: Optional[str] = Query(None, description="breakfast или lunch"),
-    db: Session = Depends(database.get_db)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    query = db.query(models.MenuItem).filter(models.MenuItem.is_available == True)
-    
-    if day:
-        query = query.filter(models.MenuItem.date == day)
-    if meal_type:
-        query = query.filter(models.MenuItem.meal_type == meal_type)
-        
-    return query.all()
+    etag, body, _ = await cached_menu(db, day, meal_type)
+
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+@router.get("/safe", response_model=List[schemas.MenuItemOut])
+async def get_safe_menu(
+    day: Optional[date_type] = Query(None, description="Дата меню (по умолчанию сегодня)"),
+    meal_type: Optional[str] = Query(None, description="breakfast или lunch"),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    _, body, menu = await cached_menu(db, day, meal_type)
+    user_allergens = allergens.user_allergens(current_user.food_preferences)
+    if not user_allergens:
+        return Response(content=body, media_type="application/json")
+    return [
+        item for item in menu
+        if user_allergens.isdisjoint(item.allergens if item.allergens is not None else allergens.dish_allergens(item.description))
+    ]
 
 @router.post("/", response_model=schemas.MenuItemOut)
 def create_menu_item(
     item: schemas.MenuItemBase, 
-    current_user: models.User = Depends(get_current_user), 
+    current_user: schemas.CurrentUser = Depends(get_current_user), 
     db: Session = Depends(database.get_db)
 ):
     if current_user.role not in ["admin", "cook"]:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
     db_item = models.MenuItem(**item.dict())
+    allergens.index_item(db_item)
     db.add(db_item)
     db.commit()
+    invalidate_menu()
     db.refresh(db_item)
-    return db_item
\ No newline at end of file
+    return db_item
+
+@router.post("/batch", response_model=List[schemas.MenuItemOut])
+def create_menu_batch(
+    items: List[schemas.MenuItemCreate],
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    # Меню на неделю одним запросом: все продукты рецептов проверяются одним SELECT,
+    # блюда и строки рецептов вставляются двумя INSERT в одной транзакции
+    if current_user.role not in ["admin", "cook"]:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    if not items:
+        return []
+
+    inventory_ids = {recipe.inventory_id for item in items for recipe in item.ingredients}
+    if inventory_ids:
+        found = set(db.scalars(select(models.Inventory.id).where(models.Inventory.id.in_(inventory_ids))))
+        missing = sorted(inventory_ids - found)
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Продукты не найдены: {', '.join(map(str, missing))}")
+
+    rows = []
+    for item in items:
+        row = item.model_dump(exclude={"ingredients"})
+        row["allergens"] = sorted(allergens.dish_allergens(item.description))
+        rows.append(row)
+    item_ids = db.scalars(
+        insert(models.MenuItem).returning(models.MenuItem.id, sort_by_parameter_order=True), rows
+    ).all()
+    recipes = [
+        {"menu_item_id": item_id, **recipe.model_dump()}
+        for item_id, item in zip(item_ids, items)
+        for recipe in item.ingredients
+    ]
+    if recipes:
+        db.execute(insert(models.Recipe), recipes)
+    db.commit()
+    invalidate_menu()
+    return [
+        {**row, "id": item_id, "ingredients": item.ingredients}
+        for item_id, row, item in zip(item_ids, rows, items)
+    ]
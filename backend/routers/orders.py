@@ -1,79 +1,206 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from backend import models, schemas, database
-from backend.routers.auth import get_current_user
+from typing import List, Optional
+from backend import models, schemas, database, ordering, stats, events, archive
+from backend.serving import lines as serving_lines
+from backend.routers.auth import get_current_user, invalidate_user
+from backend.pagination import PageParams, paginate_async
+from backend.write_queue import write_queue
+from backend.idempotency import idempotency_store, make_key
 
 router = APIRouter(prefix="/orders", tags=["Orders"])
 
 @router.post("/", response_model=schemas.OrderOut)
 def place_order(
     order_data: schemas.OrderCreate, 
-    current_user: models.User = Depends(get_current_user), 
-    db: Session = Depends(database.get_db)
+    current_user: schemas.CurrentUser = Depends(get_current_user), 
+    db: Session = Depends(database.get_db),
+    idempotency_key: Optional[str] = Header(None)
 ):
-    item = db.query(models.MenuItem).filter(models.MenuItem.id == order_data.menu_item_id).first()
-    if not item or not item.is_available:
-        raise HTTPException(status_code=404, detail="Блюдо недоступно")
-
-    if current_user.food_preferences and item.description:
-        user_prefs = current_user.food_preferences.lower()
-        item_desc = item.description.lower()
-        common_allergens = ["орехи", "молоко", "мед", "яйца"]
-        for allergen in common_allergens:
-            if allergen in user_prefs and allergen in item_desc:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Внимание! Блюдо содержит аллерген: {allergen}"
-                )
-
-    recipe_items = db.query(models.Recipe).filter(models.Recipe.menu_item_id == item.id).all()
-    for ingredient_req in recipe_items:
-        inventory_item = db.query(models.Inventory).filter(models.Inventory.id == ingredient_req.inventory_id).first()
-        if inventory_item.quantity < ingredient_req.quantity_required:
+    # Повтор с тем же Idempotency-Key получает первый ответ и не списывает деньги второй раз
+    key = make_key(idempotency_key, f"orders:{current_user.id}", order_data)
+    with idempotency_store.lock(key):
+        replay = idempotency_store.replay(db, key)
+        if replay is not None:
+            return replay
+
+        item = db.query(models.MenuItem).filter(models.MenuItem.id == order_data.menu_item_id).first()
+        if not item or not item.is_available:
+            raise HTTPException(status_code=404, detail="Блюдо недоступно")
+
+        allergen = ordering.find_allergen(current_user.food_preferences, item)
+        if allergen:
             raise HTTPException(
                 status_code=400, 
-                detail=f"Блюдо нельзя приготовить: закончился продукт '{inventory_item.product_name}'"
+                detail=f"Внимание! Блюдо содержит аллерген: {allergen}"
             )
 
-    if current_user.balance < item.price:
-        raise HTTPException(status_code=402, detail="Недостаточно средств")
+        try:
+            new_order = write_queue.run(
+                db, idempotency_store.recorded(key, ordering.create_order),
+                current_user.id, item.id, item.price, item.meal_type, order_data.order_date, order_data.payment_type
+            )
+            invalidate_user(current_user.username)
+        except HTTPException:
+            db.rollback()
+            raise
+        except Exception as e:
+            db.rollback()
+            if idempotency_store.is_duplicate(key, e):
+                return idempotency_store.replay_duplicate(db, key)
+            raise HTTPException(status_code=500, detail="Ошибка транзакции")
+        idempotency_store.remember(key, new_order)
+
+    serving_lines.order_placed(db.get_bind(), new_order, current_user.username, item.name, item.meal_type)
+    events.order_changed(new_order, item.price)
+    events.stock_changed(db, menu_item_ids=[item.id])
+    return new_order
+
+@router.post("/batch", response_model=List[schemas.OrderBatchResult])
+def place_orders_batch(
+    orders_data: schemas.OrderBatch,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    item_ids = {order_data.menu_item_id for order_data in orders_data}
+    items = {
+        item.id: item
+        for item in db.query(models.MenuItem).filter(models.MenuItem.id.in_(item_ids))
+    }
+    recipes = db.query(models.Recipe).filter(models.Recipe.menu_item_id.in_(item_ids)).all()
+    inventory_items = db.query(models.Inventory).filter(
+        models.Inventory.id.in_({recipe.inventory_id for recipe in recipes})
+    ).all()
+    stock = {inventory_item.id: inventory_item.quantity for inventory_item in inventory_items}
+    names = {inventory_item.id: inventory_item.product_name for inventory_item in inventory_items}
+    needs_by_item = {}
+    for recipe in recipes:
+        needs = needs_by_item.setdefault(recipe.menu_item_id, {})
+        needs[recipe.inventory_id] = needs.get(recipe.inventory_id, 0) + recipe.quantity_required
+
+    results = []
+    accepted = []
+    portions_by_item = {}
+    balance = current_user.balance
+    for order_data in orders_data:
+        item = items.get(order_data.menu_item_id)
+        detail = None
+        if not item or not item.is_available:
+            detail = "Блюдо недоступно"
+        elif allergen := ordering.find_allergen(current_user.food_preferences, item):
+            detail = f"Внимание! Блюдо содержит аллерген: {allergen}"
+        else:
+            needs = needs_by_item.get(item.id, {})
+            # Продукт рецепта, которого нет на складе, — такая же нехватка
+            short = [inventory_id for inventory_id, need in needs.items() if stock.get(inventory_id, 0.0) < need]
+            if short:
+                detail = f"Блюдо нельзя приготовить: закончился продукт '{names.get(short[0], short[0])}'"
+            elif balance < item.price:
+                detail = "Недостаточно средств"
+            else:
+                for inventory_id, need in needs.items():
+                    stock[inventory_id] -= need
+                balance -= item.price
+                portions_by_item[item.id] = portions_by_item.get(item.id, 0) + 1
+
+        result = {"menu_item_id": order_data.menu_item_id, "success": detail is None, "detail": detail}
+        results.append(result)
+        if detail is None:
+            accepted.append((order_data, result))
+
+    if not accepted:
+        return results
 
     try:
-        current_user.balance -= item.price
-        for ingredient_req in recipe_items:
-            inventory_item = db.query(models.Inventory).filter(models.Inventory.id == ingredient_req.inventory_id).first()
-            inventory_item.quantity -= ingredient_req.quantity_required
-
-        new_order = models.Order(
-            user_id=current_user.id,
-            menu_item_id=item.id,
-            order_date=order_data.order_date,
-            payment_type=order_data.payment_type,
-            is_paid=True
-        )
-        db.add(new_order)
+        try:
+            with db.begin_nested():
+                ordering.reserve_ingredients(db, portions_by_item)
+        except HTTPException:
+            # Склад успели разобрать параллельные заказы: списываем по одному блюду,
+            # отказ получают только те, кому не хватило
+            details = ordering.reserve_each(db, [order_data.menu_item_id for order_data, _ in accepted])
+            for (_, result), detail in zip(accepted, details):
+                if detail is not None:
+                    result["success"] = False
+                    result["detail"] = detail
+            accepted = [(order_data, result) for order_data, result in accepted if result["success"]]
+            portions_by_item = {}
+            for order_data, _ in accepted:
+                portions_by_item[order_data.menu_item_id] = portions_by_item.get(order_data.menu_item_id, 0) + 1
+            if not accepted:
+                db.rollback()
+                return results
+        accepted = [order_data for order_data, _ in accepted]
+        ordering.debit_balance(db, current_user.id, sum(items[o.menu_item_id].price for o in accepted))
+
+        new_orders = db.scalars(
+            insert(models.Order).returning(models.Order, sort_by_parameter_order=True),
+            [
+                {
+                    "user_id": current_user.id,
+                    "menu_item_id": order_data.menu_item_id,
+                    "order_date": order_data.order_date,
+                    "payment_type": order_data.payment_type,
+                    "is_paid": True,
+                    "is_received": False,
+                }
+                for order_data in accepted
+            ],
+        ).all()
+        created = iter([schemas.OrderOut.model_validate(order) for order in new_orders])
+
+        groups = {}
+        for order_data in accepted:
+            item = items[order_data.menu_item_id]
+            count, revenue = groups.get((order_data.order_date, item.meal_type), (0, 0.0))
+            groups[(order_data.order_date, item.meal_type)] = (count + 1, revenue + item.price)
+        for (day, meal_type), (count, revenue) in groups.items():
+            stats.record_paid(db, day, meal_type, revenue, count=count)
+
         db.commit()
-        db.refresh(new_order)
-        return new_order
+        invalidate_user(current_user.username)
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail="Ошибка транзакции")
 
+    for result in results:
+        if result["success"]:
+            result["order"] = next(created)
+            item = items[result["menu_item_id"]]
+            serving_lines.order_placed(db.get_bind(), result["order"], current_user.username, item.name, item.meal_type)
+            events.order_changed(result["order"], item.price)
+    events.stock_changed(db, menu_item_ids=list(portions_by_item))
+    return results
+
 @router.get("/my", response_model=List[schemas.OrderOut])
-def get_my_orders(user_id: int, db: Session = Depends(database.get_db)):
-    return db.query(models.Order).filter(models.Order.user_id == user_id).all()
+async def get_my_orders(user_id: int, response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    stmt = select(models.Order).where(models.Order.user_id == user_id)
+    archived = None
+    archive_state = await archive.state_async(db)
+    if archive.reaches(archive_state, "orders", page.date_from):
+        archived = (
+            select(models.OrderArchive).where(models.OrderArchive.user_id == user_id),
+            models.OrderArchive.id, models.OrderArchive.order_date, archive.max_id(archive_state, "orders"),
+        )
+    return await paginate_async(db, stmt, models.Order.id, page, response, date_column=models.Order.order_date, archived=archived)
 
 @router.patch("/{order_id}/receive", response_model=schemas.OrderOut)
 def mark_order_as_received(order_id: int, db: Session = Depends(database.get_db)):
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not db_order:
-        raise HTTPException(status_code=404, detail="Заказ не найден")
-    
-    if db_order.is_received:
+    if serving_lines.is_served(db.get_bind(), order_id):
         raise HTTPException(status_code=400, detail="Питание по этому заказу уже получено")
-    
-    db_order.is_received = True
-    db.commit()
-    db.refresh(db_order)
-    return db_order
\ No newline at end of file
+    try:
+        order = write_queue.run(db, ordering.receive_order, order_id)
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception:
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Ошибка транзакции")
+    serving_lines.order_received(db.get_bind(), order_id)
+    events.order_changed(order)
+    return order
\ No newline at end of file
@@ -1,44 +1,125 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from backend import models, schemas
-from backend.database import get_db
+from typing import List, Optional
+from backend import models, schemas, stats, archive
+from backend.database import get_db, get_async_db
+from backend.idempotency import idempotency_store, make_key
+from backend.pagination import PageParams, paginate_async
+from backend.routers.menu import invalidate_menu_day
 
 router = APIRouter(prefix="/reviews", tags=["Reviews"])
 
 @router.post("/", response_model=schemas.ReviewOut)
-def create_review(review: schemas.ReviewCreate, user_id: int, db: Session = Depends(get_db)):
-    existing_review = db.query(models.Review).filter(
-        models.Review.user_id == user_id,
-        models.Review.menu_item_id == review.menu_item_id
-    ).first()
-    if existing_review:
-        raise HTTPException(
-            status_code=400, 
-            detail="Вы уже оставляли отзыв об этом блюде"
+def create_review(
+    review: schemas.ReviewCreate,
+    user_id: int,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None)
+):
+    key = make_key(idempotency_key, f"reviews:{user_id}", review)
+    with idempotency_store.lock(key):
+        replay = idempotency_store.replay(db, key)
+        if replay is not None:
+            return replay
+
+        existing_review = db.query(models.Review).filter(
+            models.Review.user_id == user_id,
+            models.Review.menu_item_id == review.menu_item_id
+        ).first()
+        if not existing_review and archive.reaches(archive.state(db), "reviews"):
+            existing_review = db.query(models.ReviewArchive.id).filter(
+                models.ReviewArchive.user_id == user_id,
+                models.ReviewArchive.menu_item_id == review.menu_item_id
+            ).first()
+        if existing_review:
+            raise HTTPException(
+                status_code=400, 
+                detail="Вы уже оставляли отзыв об этом блюде"
+            )
+        order = db.query(models.Order).filter(
+            models.Order.user_id == user_id, 
+            models.Order.menu_item_id == review.menu_item_id,
+            models.Order.is_received == True
+        ).first()
+        if not order and archive.reaches(archive.state(db), "orders"):
+            order = db.query(models.OrderArchive.id).filter(
+                models.OrderArchive.user_id == user_id,
+                models.OrderArchive.menu_item_id == review.menu_item_id,
+                models.OrderArchive.is_received == True
+            ).first()
+        if not order:
+            raise HTTPException(status_code=400, detail="Сначала нужно получить это блюдо")
+        menu_item = db.query(models.MenuItem.date, models.MenuItem.meal_type).filter(
+            models.MenuItem.id == review.menu_item_id
+        ).first()
+        db_review = models.Review(
+            user_id=user_id,
+            menu_item_id=review.menu_item_id,
+            rating=review.rating,
+            comment=review.comment
         )
-    order = db.query(models.Order).filter(
-        models.Order.user_id == user_id, 
-        models.Order.menu_item_id == review.menu_item_id,
-        models.Order.is_received == True
-    ).first()
-    if not order:
-        raise HTTPException(status_code=400, detail="Сначала нужно получить это блюдо")
-    db_review = models.Review(
-        user_id=user_id,
-        menu_item_id=review.menu_item_id,
-        rating=review.rating,
-        comment=review.comment
-    )
-    db.add(db_review)
-    db.commit()
-    db.refresh(db_review)
-    return db_review
+        db.add(db_review)
+        stats.record_review(db, review.menu_item_id, review.rating)
+        db.flush()
+        db.refresh(db_review)
+        created = schemas.ReviewOut.model_validate(db_review)
+        try:
+            idempotency_store.save(db, key, created)
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            if idempotency_store.is_duplicate(key, e):
+                return idempotency_store.replay_duplicate(db, key)
+            raise
+        idempotency_store.remember(key, created)
+    # Рейтинг блюда входит в меню его дня; остальные дни и школы остаются в кэше
+    if menu_item is not None:
+        invalidate_menu_day(menu_item.date, menu_item.meal_type)
+    return created
 
 @router.get("/item/{item_id}", response_model=List[schemas.ReviewOut])
-def get_item_reviews(item_id: int, db: Session = Depends(get_db)):
-    return db.query(models.Review).filter(models.Review.menu_item_id == item_id).all()
+async def get_item_reviews(item_id: int, response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    stmt = select(models.Review).where(models.Review.menu_item_id == item_id)
+    archived = None
+    archive_state = await archive.state_async(db)
+    if archive.reaches(archive_state, "reviews", page.date_from):
+        archived = (
+            select(models.ReviewArchive).where(models.ReviewArchive.menu_item_id == item_id),
+            models.ReviewArchive.id, models.ReviewArchive.created_at, archive.max_id(archive_state, "reviews"),
+        )
+    return await paginate_async(db, stmt, models.Review.id, page, response, date_column=models.Review.created_at, archived=archived)
 
 @router.get("/all", response_model=List[schemas.ReviewOut])
-def get_all_reviews(db: Session = Depends(get_db)):
-    return db.query(models.Review).all()
\ No newline at end of file
+async def get_all_reviews(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    stmt = select(models.Review)
+    archived = None
+    archive_state = await archive.state_async(db)
+    if archive.reaches(archive_state, "reviews", page.date_from):
+        archived = (
+            select(models.ReviewArchive), models.ReviewArchive.id, models.ReviewArchive.created_at,
+            archive.max_id(archive_state, "reviews"),
+        )
+    return await paginate_async(db, stmt, models.Review.id, page, response, date_column=models.Review.created_at, archived=archived)
+
+@router.get("/summary", response_model=List[schemas.RatingSummary])
+async def get_reviews_summary(
+    item_ids: Optional[List[int]] = Query(None, description="id блюд; по умолчанию все"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    stmt = select(models.RatingStats).where(models.RatingStats.reviews_count > 0)
+    if item_ids:
+        stmt = stmt.where(models.RatingStats.menu_item_id.in_(item_ids))
+    rows = (await db.scalars(stmt.order_by(models.RatingStats.menu_item_id))).all()
+    return [
+        {
+            "menu_item_id": row.menu_item_id,
+            "reviews_count": row.reviews_count,
+            "rating_average": row.rating_sum / row.reviews_count,
+            "histogram": {value: getattr(row, f"rating_{value}") for value in range(1, 6)},
+            "last_review_at": row.last_review_at,
+        }
+        for row in rows
+    ]
\ No newline at end of file
@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List
+from datetime import date
+from backend import models, schemas, database
+from backend.routers.auth import get_current_user
+from backend.serving import lines
+
+router = APIRouter(prefix="/serving", tags=["Serving"])
+
+# Режим раздачи для повара: заказы дня и приёма пищи загружаются в память одним
+# запросом, поиск по номеру заказа или логину ученика и выдача идут без базы,
+# а отметки о выдаче дописываются в неё пачками
+
+
+def require_staff(current_user: schemas.CurrentUser = Depends(get_current_user)):
+    if current_user.role not in ["admin", "cook"]:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    return current_user
+
+
+def get_line(
+    meal_type: str,
+    day: date = Query(default_factory=date.today),
+    current_user: schemas.CurrentUser = Depends(require_staff),
+    db: Session = Depends(database.get_db),
+):
+    # Чтение не открывает раздачу: иначе любой GET на произвольный день заводил бы
+    # в памяти новую
+    line = lines.find(db.get_bind(), day, meal_type)
+    if line is None:
+        raise HTTPException(status_code=404, detail="Раздача не открыта")
+    return line
+
+
+@router.post("/open", response_model=schemas.ServingLineOut)
+def open_line(
+    meal_type: str,
+    day: date = Query(default_factory=date.today),
+    current_user: schemas.CurrentUser = Depends(require_staff),
+    db: Session = Depends(database.get_db),
+):
+    # Повторное открытие перечитывает заказы из базы
+    return lines.get(db.get_bind(), day, meal_type, reload=True).summary()
+
+
+@router.get("/", response_model=schemas.ServingLineOut)
+def get_line_status(line=Depends(get_line)):
+    return line.summary()
+
+
+@router.get("/orders/{order_id}", response_model=schemas.ServingOrderOut)
+def lookup_order(order_id: int, line=Depends(get_line)):
+    order = line.get(order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Заказа нет в этой раздаче")
+    return order
+
+
+@router.get("/students/{username}", response_model=List[schemas.ServingOrderOut])
+def lookup_student(username: str, line=Depends(get_line)):
+    return line.for_student(username)
+
+
+@router.post("/serve", response_model=List[schemas.ServingResult])
+def serve_orders(
+    order_ids: List[int],
+    meal_type: str,
+    day: date = Query(default_factory=date.today),
+    current_user: schemas.CurrentUser = Depends(require_staff),
+    db: Session = Depends(database.get_db),
+):
+    # Выдача открывает раздачу сама — например, после перезапуска сервера
+    return lines.get(db.get_bind(), day, meal_type).serve(order_ids)
+
+
+@router.post("/flush", response_model=schemas.ServingLineOut)
+def flush_line(line=Depends(get_line)):
+    line.flush()
+    return line.summary()
+
+
+@router.delete("/", response_model=schemas.ServingLineOut)
+def close_line(line=Depends(get_line)):
+    lines.close(line.bind, line.day, line.meal_type)
+    return line.summary()
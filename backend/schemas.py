@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Annotated, Optional, List, Dict
 from datetime import datetime, date
 
 class UserBase(BaseModel):
@@ -18,6 +18,13 @@ class UserOut(UserBase):
     class Config:
         from_attributes = True
 
+class CurrentUser(UserOut):
+    # Снимок из кэша авторизации: один объект на все запросы пользователя, поэтому
+    # его нельзя менять — изменения пишутся в базу, а снимок сбрасывается
+    class Config:
+        from_attributes = True
+        frozen = True
+
 class MenuItemBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -28,7 +35,7 @@ class MenuItemBase(BaseModel):
 
 class RecipeBase(BaseModel):
     inventory_id: int
-    quantity_required: float
+    quantity_required: float = Field(gt=0)
 
 class RecipeOut(BaseModel):
     inventory_id: int
@@ -36,8 +43,16 @@ class RecipeOut(BaseModel):
     class Config:
         from_attributes = True
 
+class MenuItemCreate(MenuItemBase):
+    # Блюдо вместе с рецептом для публикации меню пачкой
+    price: float = Field(ge=0)
+    ingredients: List[RecipeBase] = []
+
 class MenuItemOut(MenuItemBase):
     id: int
+    allergens: Optional[List[str]] = None
+    rating_count: Optional[int] = None
+    rating_average: Optional[float] = None
     ingredients: List[RecipeOut] = []
     class Config:
         from_attributes = True
@@ -47,16 +62,51 @@ class OrderCreate(BaseModel):
     payment_type: str
     order_date: date
 
+# Корзина: не больше стольких блюд за один POST /orders/batch
+MAX_ORDER_BATCH = 20
+OrderBatch = Annotated[List[OrderCreate], Field(max_length=MAX_ORDER_BATCH)]
+
 class OrderOut(BaseModel):
     id: int
     user_id: int
     menu_item_id: int
+    order_date: date
     is_paid: bool
     is_received: bool
     created_at: datetime
     class Config:
         from_attributes = True
 
+class OrderBatchResult(BaseModel):
+    menu_item_id: int
+    success: bool
+    order: Optional[OrderOut] = None
+    detail: Optional[str] = None
+
+class ServingOrderOut(BaseModel):
+    id: int
+    user_id: int
+    username: str
+    menu_item_id: int
+    menu_item_name: str
+    order_date: date
+    is_received: bool
+    class Config:
+        from_attributes = True
+
+class ServingResult(BaseModel):
+    id: int
+    success: bool
+    order: Optional[ServingOrderOut] = None
+    detail: Optional[str] = None
+
+class ServingLineOut(BaseModel):
+    day: date
+    meal_type: str
+    waiting: int
+    served: int
+    unflushed: int
+
 class PurchaseRequestCreate(BaseModel):
     product_name: str
     requested_quantity: float
@@ -74,6 +124,15 @@ class PurchaseRequestOut(PurchaseRequestCreate):
     class Config:
         from_attributes = True
 
+class IngredientForecast(BaseModel):
+    inventory_id: int
+    product_name: str
+    unit: str
+    quantity: float
+    reserved: float
+    expected: float
+    shortfall: float
+
 class ReviewCreate(BaseModel):
     menu_item_id: int
     rating: int = Field(ge=1, le=5)
@@ -86,6 +145,13 @@ class ReviewOut(ReviewCreate):
     class Config:
         from_attributes = True
 
+class RatingSummary(BaseModel):
+    menu_item_id: int
+    reviews_count: int
+    rating_average: float
+    histogram: Dict[int, int]
+    last_review_at: Optional[datetime] = None
+
 class InventoryBase(BaseModel):
     product_name: str
     quantity: float
@@ -97,6 +163,25 @@ class Inventory(InventoryBase):
     class Config:
         from_attributes = True
 
+class InventoryChange(BaseModel):
+    # Либо приращение delta, либо новое значение quantity
+    id: int
+    delta: Optional[float] = None
+    quantity: Optional[float] = Field(None, ge=0)
+
+class InventoryChangeResult(BaseModel):
+    id: int
+    success: bool
+    quantity: Optional[float] = None
+    detail: Optional[str] = None
+
+class PurchaseApprovalResult(BaseModel):
+    id: int
+    success: bool
+    inventory_id: Optional[int] = None
+    quantity: Optional[float] = None
+    detail: Optional[str] = None
+
 class Token(BaseModel):
     access_token: str
     token_type: str
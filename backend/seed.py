@@ -1,12 +1,39 @@
-from backend.database import SessionLocal, engine, Base
-from backend import models
+import argparse
+import random
+import time
+from backend.database import engine, Base, make_engine, tenants
+from backend.migrate import tenant_engine
+from backend.tenancy import TENANT_NAME
+from backend import models, allergens, stats
 from backend.routers.auth import get_password_hash
-from datetime import date
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
 
-def seed_data():
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
+DISHES = {
+    "breakfast": [
+        ("Каша овсяная", "Овсяная каша на молоке с маслом"),
+        ("Сырники", "Сырники из творога со сметаной"),
+        ("Омлет", "Омлет из яиц с зеленью"),
+        ("Блины", "Блины с мёдом"),
+        ("Каша гречневая", "Гречневая каша с маслом"),
+        ("Бутерброд с сыром", "Хлеб, сыр, масло"),
+    ],
+    "lunch": [
+        ("Пицца школьная", "Вкусная пицца, содержит сыр и муку. Без орехов."),
+        ("Борщ", "Борщ со сметаной"),
+        ("Котлета с пюре", "Куриная котлета, картофельное пюре на молоке"),
+        ("Плов", "Плов с курицей"),
+        ("Макароны по-флотски", "Макароны с говяжьим фаршем"),
+        ("Салат с орехами", "Салат из свёклы с грецкими орехами"),
+    ],
+}
+PREFERENCES = [None, None, None, None, "аллергия на орехи", "непереносимость лактозы", "аллергия на мед", "аллергия на яйца"]
+
+def seed_data(bind=engine):
+    Base.metadata.drop_all(bind=bind)
+    Base.metadata.create_all(bind=bind)
+    db = sessionmaker(bind=bind)()
     admin = models.User(username="admin", password_hash=get_password_hash("password123"), role="admin", balance=1000000000000)
     cook = models.User(username="cook", password_hash=get_password_hash("password123"), role="cook", balance=0)
     student = models.User(username="student", password_hash=get_password_hash("password123"), role="student", balance=1000.0, food_preferences="аллергия на орехи")
@@ -24,13 +51,138 @@ def seed_data():
         date=date.today(), 
         is_available=True
     )
+    allergens.index_item(pizza)
     db.add(pizza)
     db.commit()
     recipe1 = models.Recipe(menu_item_id=pizza.id, inventory_id=flour.id, quantity_required=0.2)
     recipe2 = models.Recipe(menu_item_id=pizza.id, inventory_id=cheese.id, quantity_required=0.1)
     db.add_all([recipe1, recipe2])
     db.commit()
+    db.close()
     print("База готова!")
 
+def generate(bind, students=1000, days=30, dishes_per_meal=4, ingredients=50, order_rate=0.8,
+             receive_rate=0.9, review_rate=0.2, seed=42, batch_size=50000):
+    # Синтетическая база для нагрузочных замеров: те же учётные записи, что и в seed_data,
+    # плюс students учеников и days дней истории меню, заказов и отзывов
+    rng = random.Random(seed)
+    Base.metadata.drop_all(bind=bind)
+    Base.metadata.create_all(bind=bind)
+    password_hash = get_password_hash("password123")
+    today = date.today()
+
+    def insert_batches(model, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                with bind.begin() as conn:
+                    conn.execute(insert(model), batch)
+                batch = []
+        if batch:
+            with bind.begin() as conn:
+                conn.execute(insert(model), batch)
+
+    users = [
+        {"id": 1, "username": "admin", "role": "admin", "balance": 1000000000000, "food_preferences": None},
+        {"id": 2, "username": "cook", "role": "cook", "balance": 0, "food_preferences": None},
+        {"id": 3, "username": "student", "role": "student", "balance": 1000.0, "food_preferences": "аллергия на орехи"},
+    ]
+    users += [
+        {"id": 3 + n, "username": f"student{n}", "role": "student", "balance": 100000.0, "food_preferences": rng.choice(PREFERENCES)}
+        for n in range(1, students + 1)
+    ]
+    student_ids = [user["id"] for user in users if user["role"] == "student"]
+    insert_batches(models.User, ({**user, "password_hash": password_hash} for user in users))
+
+    insert_batches(models.Inventory, (
+        {"id": n, "product_name": f"Продукт {n}", "quantity": 1000000.0, "unit": "кг"} for n in range(1, ingredients + 1)
+    ))
+
+    menu = []
+    for offset in range(days):
+        day = today - timedelta(days=days - offset - 1)
+        for meal_type, dishes in DISHES.items():
+            for name, description in rng.sample(dishes, min(dishes_per_meal, len(dishes))):
+                menu.append({
+                    "id": len(menu) + 1, "name": name, "description": description, "price": float(rng.randint(40, 120)),
+                    "meal_type": meal_type, "date": day, "is_available": True,
+                    "allergens": sorted(allergens.dish_allergens(description)),
+                })
+    insert_batches(models.MenuItem, menu)
+    insert_batches(models.Recipe, (
+        {"menu_item_id": item["id"], "inventory_id": inventory_id, "quantity_required": round(rng.uniform(0.05, 0.3), 2)}
+        for item in menu for inventory_id in rng.sample(range(1, ingredients + 1), min(3, ingredients))
+    ))
+
+    menu_by_meal = {}
+    for item in menu:
+        menu_by_meal.setdefault((item["date"], item["meal_type"]), []).append(item)
+
+    reviews = []
+
+    def orders():
+        for (day, meal_type), items in menu_by_meal.items():
+            created_at = datetime.combine(day, datetime.min.time()) + timedelta(hours=8 if meal_type == "breakfast" else 12)
+            for user_id in student_ids:
+                if rng.random() >= order_rate:
+                    continue
+                item = rng.choice(items)
+                received = day < today and rng.random() < receive_rate
+                if received and rng.random() < review_rate:
+                    reviews.append({
+                        "user_id": user_id, "menu_item_id": item["id"], "rating": rng.choices(range(1, 6), (1, 1, 3, 5, 6))[0],
+                        "comment": None, "created_at": created_at + timedelta(hours=2),
+                    })
+                yield {
+                    "user_id": user_id, "menu_item_id": item["id"], "order_date": day, "payment_type": "balance",
+                    "is_paid": True, "is_received": received, "created_at": created_at,
+                }
+
+    insert_batches(models.Order, orders())
+    insert_batches(models.Review, reviews)
+
+    db = sessionmaker(bind=bind)()
+    stats.rebuild(db)
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заполнение базы тестовыми данными")
+    parser.add_argument("--students", type=int, help="сгенерировать синтетическую базу с этим числом учеников")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--dishes-per-meal", type=int, default=4)
+    parser.add_argument("--ingredients", type=int, default=50)
+    parser.add_argument("--order-rate", type=float, default=0.8)
+    parser.add_argument("--receive-rate", type=float, default=0.9)
+    parser.add_argument("--review-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--database-url", help="по умолчанию DATABASE_URL из настроек")
+    parser.add_argument("--tenant", help="заполнить базу школы из TENANT_DATABASE_URL")
+    args = parser.parse_args()
+
+    if args.tenant:
+        if tenants is None:
+            parser.error("не задан TENANT_DATABASE_URL")
+        if not TENANT_NAME.match(args.tenant):
+            parser.error(f"некорректное имя школы: {args.tenant}")
+        bind = tenant_engine(args.tenant)
+    else:
+        bind = make_engine(args.database_url) if args.database_url else engine
+
+    if args.students is None:
+        seed_data(bind)
+        return
+
+    started = time.perf_counter()
+    generate(
+        bind, students=args.students, days=args.days, dishes_per_meal=args.dishes_per_meal,
+        ingredients=args.ingredients, order_rate=args.order_rate, receive_rate=args.receive_rate,
+        review_rate=args.review_rate, seed=args.seed, batch_size=args.batch_size,
+    )
+    print(f"База готова за {time.perf_counter() - started:.1f} с")
+
+
 if __name__ == "__main__":
-    seed_data()
\ No newline at end of file
+    main()
\ No newline at end of file
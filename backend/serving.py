@@ -0,0 +1,288 @@
+import logging
+import threading
+import time
+from datetime import date
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from backend import models, settings, stats, events
+from backend.database import current_tenant
+
+log = logging.getLogger("canteen.serving")
+
+
+class ServingOrder:
+    __slots__ = ("id", "user_id", "username", "menu_item_id", "menu_item_name", "order_date", "is_paid", "is_received")
+
+    def __init__(self, row):
+        self.id = row.id
+        self.user_id = row.user_id
+        self.username = row.username
+        self.menu_item_id = row.menu_item_id
+        self.menu_item_name = row.menu_item_name
+        self.order_date = row.order_date
+        self.is_paid = True
+        self.is_received = False
+
+
+def _pending_orders(day, meal_type):
+    return (
+        select(
+            models.Order.id,
+            models.Order.user_id,
+            models.User.username,
+            models.Order.menu_item_id,
+            models.MenuItem.name.label("menu_item_name"),
+            models.Order.order_date,
+        )
+        .join(models.User, models.Order.user_id == models.User.id)
+        .join(models.MenuItem, models.Order.menu_item_id == models.MenuItem.id)
+        .where(
+            models.Order.order_date == day,
+            models.MenuItem.meal_type == meal_type,
+            models.Order.is_paid == True,
+            models.Order.is_received == False,
+        )
+    )
+
+
+class ServingLine:
+    # Оплаченные и ещё не выданные заказы одной раздачи (день + приём пищи) в памяти:
+    # поиск по номеру заказа или ученику и проверка повторной выдачи не ходят в базу,
+    # а отметки о выдаче пишутся пачками. Повторную выдачу раздача ловит только в своём
+    # процессе: другой процесс узнает об отметке не раньше, чем она дойдёт до базы
+    def __init__(self, bind, day, meal_type):
+        self.bind = bind
+        self.day = day
+        self.meal_type = meal_type
+        self.orders = {}
+        self.by_username = {}
+        self.unflushed = []
+        self.oldest_mark = None
+        self.served = 0
+        # Фоновая дозапись идёт вне запроса: события публикуются в темы школы раздачи
+        self.tenant = current_tenant.get()
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self.bind.connect() as conn:
+            rows = conn.execute(_pending_orders(self.day, self.meal_type)).all()
+        with self._lock:
+            self.orders = {}
+            self.by_username = {}
+            for row in rows:
+                self._add(ServingOrder(row))
+
+    def _add(self, order: ServingOrder):
+        self.orders[order.id] = order
+        self.by_username.setdefault(order.username, []).append(order)
+
+    def add(self, order: ServingOrder):
+        with self._lock:
+            if order.id not in self.orders:
+                self._add(order)
+
+    def get(self, order_id):
+        order = self.orders.get(order_id)
+        if order is None:
+            # Заказ мог появиться в другом процессе после загрузки раздачи
+            with self.bind.connect() as conn:
+                row = conn.execute(_pending_orders(self.day, self.meal_type).where(models.Order.id == order_id)).first()
+            if row is not None:
+                self.add(ServingOrder(row))
+                order = self.orders[order_id]
+        return order
+
+    def for_student(self, username):
+        return list(self.by_username.get(username, ()))
+
+    def serve(self, order_ids):
+        results = []
+        for order_id in order_ids:
+            order = self.get(order_id)
+            with self._lock:
+                if order is None:
+                    results.append({"id": order_id, "success": False, "detail": "Заказа нет в этой раздаче"})
+                elif order.is_received:
+                    results.append({"id": order_id, "success": False, "detail": "Питание по этому заказу уже получено"})
+                else:
+                    order.is_received = True
+                    self.unflushed.append(order)
+                    self.oldest_mark = self.oldest_mark or time.monotonic()
+                    self.served += 1
+                    results.append({"id": order_id, "success": True, "detail": None, "order": order})
+        if len(self.unflushed) >= settings.SERVING_FLUSH_SIZE:
+            try:
+                self.flush()
+            except Exception:
+                # Выдача уже принята в памяти, отметки вернулись в очередь — их допишет
+                # фоновый поток, а повар получает ответ о выдаче, а не 500
+                log.exception("Не удалось записать отметки раздачи %s %s", self.day, self.meal_type)
+        return results
+
+    def is_served(self, order_id):
+        order = self.orders.get(order_id)
+        return order is not None and order.is_received
+
+    def mark_received(self, order_id):
+        # Заказ выдан обычным PATCH /orders/{id}/receive — в раздаче он больше не ждёт
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is not None and not order.is_received:
+                order.is_received = True
+                self.served += 1
+
+    def due(self):
+        return self.oldest_mark is not None and time.monotonic() - self.oldest_mark >= settings.SERVING_FLUSH_SECONDS
+
+    def flush(self):
+        with self._lock:
+            batch, self.unflushed, self.oldest_mark = self.unflushed, [], None
+        if not batch:
+            return 0
+        db = Session(bind=self.bind)
+        try:
+            # Заказ мог быть выдан мимо раздачи (PATCH /orders/{id}/receive, другой процесс):
+            # такие строки UPDATE пропускает, и ни счётчик, ни событие по ним не нужны
+            received_ids = set(db.scalars(
+                update(models.Order)
+                .where(models.Order.id.in_([order.id for order in batch]), models.Order.is_received == False)
+                .values(is_received=True)
+                .returning(models.Order.id)
+                .execution_options(synchronize_session=False)
+            ))
+            received = len(received_ids)
+            if received:
+                stats.record_received(db, self.day, self.meal_type, count=received)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                # Не записалось — вернём отметки, следующая попытка запишет их снова
+                self.unflushed = batch + self.unflushed
+                self.oldest_mark = self.oldest_mark or time.monotonic()
+            raise
+        finally:
+            db.close()
+        reset = current_tenant.set(self.tenant)
+        try:
+            for order in batch:
+                if order.id in received_ids:
+                    events.order_changed(order)
+        finally:
+            current_tenant.reset(reset)
+        return received
+
+    def summary(self):
+        with self._lock:
+            waiting = sum(1 for order in self.orders.values() if not order.is_received)
+            return {
+                "day": self.day,
+                "meal_type": self.meal_type,
+                "waiting": waiting,
+                "served": self.served,
+                "unflushed": len(self.unflushed),
+            }
+
+
+class ServingLines:
+    # Раздачи по (база, день, приём пищи); фоновый поток дописывает отметки не реже
+    # чем раз в SERVING_FLUSH_SECONDS
+    def __init__(self):
+        self._lines = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def get(self, bind, day, meal_type, reload=False):
+        # Открывает раздачу, если её ещё нет; только для открытия и выдачи, не для чтения
+        key = (bind, day, meal_type)
+        with self._lock:
+            line = self._lines.get(key)
+            created = line is None
+            if created:
+                line = self._lines[key] = ServingLine(bind, day, meal_type)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+        if created or reload:
+            line.flush()
+            line.load()
+        return line
+
+    def find(self, bind, day, meal_type):
+        return self._lines.get((bind, day, meal_type))
+
+    def close(self, bind, day, meal_type):
+        with self._lock:
+            line = self._lines.pop((bind, day, meal_type), None)
+        if line is not None:
+            line.flush()
+        return line
+
+    def release(self, bind):
+        # База школы закрывается: дописываем отметки и забываем её раздачи
+        for line_bind, day, meal_type in list(self._lines):
+            if line_bind is bind:
+                self.close(bind, day, meal_type)
+
+    def evict_past(self, today=None):
+        # Раздачи прошедших дней больше не нужны: отметки дописываются, раздача забывается.
+        # Не записалось — раздача остаётся до следующего круга, отметки не теряются
+        today = today or date.today()
+        for key in [key for key in list(self._lines) if key[1] < today]:
+            with self._lock:
+                line = self._lines.pop(key, None)
+            if line is None:
+                continue
+            try:
+                line.flush()
+            except Exception:
+                log.exception("Не удалось записать отметки раздачи %s %s", key[1], key[2])
+                with self._lock:
+                    self._lines.setdefault(key, line)
+
+    def flush_all(self):
+        for line in list(self._lines.values()):
+            line.flush()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(settings.SERVING_FLUSH_SECONDS / 2)
+            for line in list(self._lines.values()):
+                if line.due():
+                    try:
+                        line.flush()
+                    except Exception:
+                        pass  # отметки остались в очереди, повторим на следующем круге
+            self.evict_past()
+
+    # Вызываются обработчиками заказов после коммита, чтобы открытые раздачи не отставали
+
+    def order_placed(self, bind, order, username, menu_item_name, meal_type):
+        line = self.find(bind, order.order_date, meal_type)
+        if line is not None:
+            line.add(ServingOrder(_Row(order, username, menu_item_name)))
+
+    def is_served(self, bind, order_id):
+        # Отметка раздачи могла ещё не дойти до базы — обычная выдача не должна выдать второй раз
+        return any(
+            line.is_served(order_id)
+            for (line_bind, _, _), line in list(self._lines.items()) if line_bind is bind
+        )
+
+    def order_received(self, bind, order_id):
+        for (line_bind, _, _), line in list(self._lines.items()):
+            if line_bind is bind:
+                line.mark_received(order_id)
+
+
+class _Row:
+    def __init__(self, order, username, menu_item_name):
+        self.id = order.id
+        self.user_id = order.user_id
+        self.username = username
+        self.menu_item_id = order.menu_item_id
+        self.menu_item_name = menu_item_name
+        self.order_date = order.order_date
+
+
+lines = ServingLines()
@@ -0,0 +1,127 @@
+import sys
+from sqlalchemy import func, case, delete, insert, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from backend import models
+from backend.database import SessionLocal
+
+COUNTERS = ["paid_count", "received_count", "waiting_count", "revenue"]
+RATING_COUNTERS = ["reviews_count", "rating_sum", "rating_1", "rating_2", "rating_3", "rating_4", "rating_5"]
+
+
+def increment(db: Session, model, keys: dict, deltas: dict, values: dict = None):
+    # Счётчики меняются в той же транзакции, что и исходные записи (upsert с прибавлением)
+    values = values or {}
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    table = model.__table__
+    stmt = dialect.insert(table).values(**keys, **deltas, **values)
+    set_ = {name: table.c[name] + stmt.excluded[name] for name in deltas}
+    set_.update({name: stmt.excluded[name] for name in values})
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c[key] for key in keys], set_=set_)
+    db.execute(stmt)
+
+
+def _add(db: Session, day, meal_type, **deltas):
+    increment(db, models.DailyStats, {"day": day, "meal_type": meal_type}, deltas)
+
+
+def record_paid(db: Session, day, meal_type, revenue, count=1):
+    _add(db, day, meal_type, paid_count=count, waiting_count=count, revenue=revenue)
+
+
+def record_received(db: Session, day, meal_type, was_paid=True, count=1):
+    if was_paid:
+        _add(db, day, meal_type, received_count=count, waiting_count=-count)
+    else:
+        _add(db, day, meal_type, received_count=count)
+
+
+def _all_rows(hot, cold, *columns):
+    # Сводные таблицы считают всю историю: и горячие строки, и перенесённые в архив
+    return union_all(
+        select(*[getattr(hot, column) for column in columns]),
+        select(*[getattr(cold, column) for column in columns]),
+    ).subquery()
+
+
+def _raw_stats():
+    orders = _all_rows(models.Order, models.OrderArchive, "order_date", "menu_item_id", "is_paid", "is_received")
+    paid = orders.c.is_paid == True
+    received = orders.c.is_received == True
+    return (
+        select(
+            orders.c.order_date.label("day"),
+            models.MenuItem.meal_type.label("meal_type"),
+            func.sum(case((paid, 1), else_=0)).label("paid_count"),
+            func.sum(case((received, 1), else_=0)).label("received_count"),
+            func.sum(case((paid & ~received, 1), else_=0)).label("waiting_count"),
+            func.sum(case((paid, models.MenuItem.price), else_=0.0)).label("revenue"),
+        )
+        .join(models.MenuItem, orders.c.menu_item_id == models.MenuItem.id)
+        .group_by(orders.c.order_date, models.MenuItem.meal_type)
+    )
+
+
+def record_review(db: Session, menu_item_id, rating):
+    deltas = {"reviews_count": 1, "rating_sum": rating, f"rating_{rating}": 1}
+    increment(db, models.RatingStats, {"menu_item_id": menu_item_id}, deltas, {"last_review_at": func.now()})
+
+
+def _raw_ratings():
+    reviews = _all_rows(models.Review, models.ReviewArchive, "id", "menu_item_id", "rating", "created_at")
+    return (
+        select(
+            reviews.c.menu_item_id.label("menu_item_id"),
+            func.count(reviews.c.id).label("reviews_count"),
+            func.sum(reviews.c.rating).label("rating_sum"),
+            *[
+                func.sum(case((reviews.c.rating == value, 1), else_=0)).label(f"rating_{value}")
+                for value in range(1, 6)
+            ],
+            func.max(reviews.c.created_at).label("last_review_at"),
+        )
+        .group_by(reviews.c.menu_item_id)
+    )
+
+
+# Сводная таблица -> (запрос по сырым данным, ключевые колонки, счётчики, прочие колонки)
+ROLLUPS = [
+    (models.DailyStats, _raw_stats, ["day", "meal_type"], COUNTERS, []),
+    (models.RatingStats, _raw_ratings, ["menu_item_id"], RATING_COUNTERS, ["last_review_at"]),
+]
+
+
+def rebuild(db: Session):
+    for model, raw, keys, counters, extra in ROLLUPS:
+        db.execute(delete(model))
+        db.execute(insert(model).from_select(keys + counters + extra, raw()))
+    db.commit()
+
+
+def check(db: Session):
+    # Возвращает расхождения между сводными таблицами и сырыми данными
+    mismatches = []
+    for model, raw, keys, counters, _ in ROLLUPS:
+        raw_rows = {tuple(getattr(row, key) for key in keys): row for row in db.execute(raw())}
+        rollup = {tuple(getattr(row, key) for key in keys): row for row in db.query(model)}
+        for key in sorted(set(raw_rows) | set(rollup), key=str):
+            for counter in counters:
+                expected = getattr(raw_rows[key], counter) if key in raw_rows else 0
+                actual = getattr(rollup[key], counter) if key in rollup else 0
+                if abs((expected or 0) - (actual or 0)) > 1e-6:
+                    mismatches.append({"table": model.__tablename__, "key": key, "counter": counter, "expected": expected, "actual": actual})
+    return mismatches
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    db = SessionLocal()
+    if command == "rebuild":
+        rebuild(db)
+        print("Сводная статистика пересчитана")
+    else:
+        mismatches = check(db)
+        for mismatch in mismatches:
+            print(mismatch)
+        print("Расхождений нет" if not mismatches else f"Расхождений: {len(mismatches)}")
+        sys.exit(1 if mismatches else 0)
@@ -0,0 +1,134 @@
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.orm import Session
+from backend import models
+
+# Складские операции пачкой: вызывающий код коммитит сам, результат — по строке на входной элемент
+
+
+def apply_changes(db: Session, changes):
+    # Все изменения одним UPDATE ... SET quantity = CASE id ...; строки, которые ушли бы
+    # в минус, условие WHERE просто не трогает, остальные применяются
+    results = [{"id": change.id, "success": False, "quantity": None, "detail": None} for change in changes]
+    targets = {}  # id -> (новое значение или None, приращение), повторы id складываются по порядку
+    for change, result in zip(changes, results):
+        if (change.delta is None) == (change.quantity is None):
+            result["detail"] = "Укажите либо delta, либо quantity"
+            continue
+        base, delta = targets.get(change.id, (None, 0.0))
+        if change.quantity is not None:
+            base, delta = change.quantity, 0.0
+        else:
+            delta += change.delta
+        targets[change.id] = (base, delta)
+
+    updated = {}
+    existing = set()
+    if targets:
+        new_quantity = case(
+            {
+                item_id: (models.Inventory.quantity + delta) if base is None else base + delta
+                for item_id, (base, delta) in targets.items()
+            },
+            value=models.Inventory.id,
+        )
+        rows = db.execute(
+            update(models.Inventory)
+            .where(models.Inventory.id.in_(list(targets)), new_quantity >= 0)
+            .values(quantity=new_quantity)
+            .returning(models.Inventory.id, models.Inventory.quantity)
+            .execution_options(synchronize_session=False)
+        ).all()
+        updated = {row.id: row.quantity for row in rows}
+        missing = set(targets) - set(updated)
+        if missing:
+            existing = set(db.scalars(select(models.Inventory.id).where(models.Inventory.id.in_(missing))))
+
+    for change, result in zip(changes, results):
+        if result["detail"]:
+            continue
+        if change.id in updated:
+            result["success"] = True
+            result["quantity"] = updated[change.id]
+        elif change.id in existing:
+            result["detail"] = "Остаток не может стать отрицательным"
+        else:
+            result["detail"] = "Товар не найден"
+    return results
+
+
+def approve_requests(db: Session, request_ids, admin_id: int):
+    # Одобренные заявки сразу приходуются на склад по названию и единице измерения;
+    # продукт, которого на складе ещё нет, заводится с нуля
+    requests = {
+        request.id: request
+        for request in db.query(models.PurchaseRequest).filter(models.PurchaseRequest.id.in_(request_ids))
+    }
+    units = {
+        item.product_name: item.unit
+        for item in db.query(models.Inventory).filter(
+            models.Inventory.product_name.in_({request.product_name for request in requests.values()})
+        )
+    }
+    new_products = {}
+    amounts = {}
+    accepted = []
+    results = []
+    for request_id in request_ids:
+        request = requests.get(request_id)
+        detail = None
+        if request is None:
+            detail = "Заявка не найдена"
+        elif request.status != "pending" or request_id in accepted:
+            detail = "Заявка уже обработана"
+        elif units.get(request.product_name, request.unit) != request.unit:
+            detail = f"Единица измерения не совпадает со складом: {units[request.product_name]}"
+        else:
+            if request.product_name not in units:
+                units[request.product_name] = new_products[request.product_name] = request.unit
+            amounts[request.product_name] = amounts.get(request.product_name, 0.0) + request.requested_quantity
+            accepted.append(request_id)
+        results.append({"id": request_id, "success": detail is None, "detail": detail})
+
+    if not accepted:
+        return results
+
+    if new_products:
+        db.execute(insert(models.Inventory), [
+            {"product_name": name, "quantity": 0.0, "unit": unit} for name, unit in new_products.items()
+        ])
+    db.execute(
+        update(models.Inventory)
+        .where(models.Inventory.product_name.in_(list(amounts)))
+        .values(quantity=models.Inventory.quantity + case(amounts, value=models.Inventory.product_name))
+        .execution_options(synchronize_session=False)
+    )
+    approved = db.query(models.PurchaseRequest).filter(
+        models.PurchaseRequest.id.in_(accepted),
+        models.PurchaseRequest.status == "pending",
+    ).update(
+        {
+            models.PurchaseRequest.status: "approved",
+            models.PurchaseRequest.approved_by: admin_id,
+            models.PurchaseRequest.approved_at: datetime.now(),
+        },
+        synchronize_session=False,
+    )
+    if approved != len(accepted):
+        # Кто-то одобрил часть заявок между чтением и записью: не приходуем дважды
+        raise HTTPException(status_code=409, detail="Заявки уже обрабатываются, повторите запрос")
+
+    stock = {
+        row.product_name: row
+        for row in db.execute(
+            select(models.Inventory.id, models.Inventory.product_name, models.Inventory.quantity)
+            .where(models.Inventory.product_name.in_(list(amounts)))
+        )
+    }
+    for result in results:
+        if result["success"]:
+            row = stock[requests[result["id"]].product_name]
+            result["inventory_id"] = row.id
+            result["quantity"] = row.quantity
+    return results
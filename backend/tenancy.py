@@ -0,0 +1,66 @@
+import re
+from urllib.parse import parse_qs
+from jose import JWTError, jwt
+from starlette.responses import JSONResponse
+from backend import settings
+from backend.cache import TTLCache
+from backend.database import current_tenant
+from backend.routers.auth import SECRET_KEY, ALGORITHM, USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS
+
+# Имя школы идёт в путь к файлу базы, поэтому только латиница, цифры, "_" и "-"
+TENANT_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+# token -> школа из JWT, чтобы не проверять подпись на каждый запрос
+token_tenants = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+
+def tenant_of_token(token: str):
+    tenant = token_tenants.get(token)
+    if tenant is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None  # сам токен отклонит get_current_user
+        tenant = payload.get("tenant") or ""
+        token_tenants.set(token, tenant)
+    return tenant or None
+
+
+class TenantMiddleware:
+    # Выбирает школу запроса: из JWT (заголовок Authorization или ?token= у SSE),
+    # а до входа — из заголовка TENANT_HEADER. Сессии берут базу школы из current_tenant
+    def __init__(self, app):
+        self.app = app
+        self.header = settings.TENANT_HEADER.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header_tenant = token = None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                header_tenant = value.decode("latin-1").strip().lower() or None
+            elif name == b"authorization" and value[:7].lower() == b"bearer ":
+                token = value[7:].decode("latin-1")
+        if token is None and scope.get("query_string"):
+            token = parse_qs(scope["query_string"].decode("latin-1")).get("token", [None])[0]
+
+        tenant = header_tenant
+        if token:
+            token_tenant = tenant_of_token(token)
+            if token_tenant and header_tenant and token_tenant != header_tenant:
+                await JSONResponse({"detail": "Токен выдан другой школе"}, status_code=403)(scope, receive, send)
+                return
+            tenant = token_tenant or header_tenant
+        if tenant is not None and not TENANT_NAME.match(tenant):
+            await JSONResponse({"detail": "Некорректное имя школы"}, status_code=400)(scope, receive, send)
+            return
+
+        reset = current_tenant.set(tenant)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_tenant.reset(reset)
+
@@ -0,0 +1,158 @@
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy.orm import Session
+from backend import settings
+
+
+class WriteQueue:
+    # SQLite пускает одного писателя за раз, и каждый заказ со своим коммитом ждёт
+    # блокировку базы. В режиме группировки обработчики отдают операции одному
+    # потоку-писателю на базу, а он применяет их пачками: каждая операция в своей
+    # точке сохранения, вся пачка — одним коммитом. Ошибка одной операции
+    # откатывает только её и возвращается именно её вызывающему.
+    def __init__(self, enabled: bool, max_batch: int, max_wait_ms: float):
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.operations = 0
+        self.fallbacks = 0
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    def run(self, db: Session, fn, *args):
+        # fn(db, *args) не коммитит сам; без группировки коммит делается здесь же
+        if not self.enabled:
+            result = fn(db, *args)
+            db.commit()
+            return result
+        # Соединение сессии обработчика возвращается в пул до ожидания писателя: иначе
+        # ждущие обработчики разбирают весь пул, и писателю не из чего взять своё.
+        # Загруженные объекты остаются читаемыми, сессия откроет новое соединение сама
+        db.close()
+        return self.submit(db.get_bind(), fn, *args)
+
+    def submit(self, bind, fn, *args):
+        future = Future()
+        # Контекст запроса идёт вместе с операцией, чтобы её SQL попал в метрики запроса
+        self._writer(bind).put((contextvars.copy_context(), fn, args, future))
+        return future.result()
+
+    def _writer(self, bind):
+        with self._lock:
+            if bind not in self._writers:
+                operations = queue.Queue()
+                thread = threading.Thread(target=self._loop, args=(bind, operations), daemon=True)
+                self._writers[bind] = (operations, thread)
+                thread.start()
+            return self._writers[bind][0]
+
+    def _loop(self, bind, operations):
+        while True:
+            first = operations.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    operation = operations.get(timeout=timeout) if timeout > 0 else operations.get_nowait()
+                except queue.Empty:
+                    break
+                if operation is None:
+                    operations.put(None)
+                    break
+                batch.append(operation)
+            self._apply(bind, batch)
+
+    def _apply(self, bind, batch):
+        outcomes = []
+        db = Session(bind=bind, autoflush=False)
+        try:
+            for context, fn, args, future in batch:
+                savepoint = db.begin_nested()
+                try:
+                    result = context.run(fn, db, *args)
+                    savepoint.commit()
+                    outcomes.append((future, result, None))
+                except Exception as error:
+                    savepoint.rollback()
+                    outcomes.append((future, None, error))
+            db.commit()
+        except Exception:
+            db.rollback()
+            db.close()
+            # Пачка не записалась целиком — применяем операции по одной, чтобы
+            # каждая получила свой собственный результат или ошибку
+            with self._lock:
+                self.fallbacks += 1
+            for operation in batch:
+                self._apply_one(bind, operation)
+            return
+        finally:
+            db.close()
+
+        with self._lock:
+            self.batches += 1
+            self.operations += len(batch)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _apply_one(self, bind, operation):
+        context, fn, args, future = operation
+        db = Session(bind=bind, autoflush=False)
+        try:
+            result = context.run(fn, db, *args)
+            db.commit()
+            future.set_result(result)
+        except Exception as error:
+            # Исходная ошибка, как и в _apply: вызывающий сам решает, что с ней делать
+            # (например, IntegrityError ключа идемпотентности — это повтор, а не 500)
+            db.rollback()
+            future.set_exception(error)
+        finally:
+            db.close()
+        with self._lock:
+            self.batches += 1
+            self.operations += 1
+
+    def release(self, bind):
+        # Движок закрывается (например, база школы вытеснена из реестра): писатель
+        # дописывает очередь и завершается
+        with self._lock:
+            writer = self._writers.pop(bind, None)
+        if writer is not None:
+            operations, thread = writer
+            operations.put(None)
+            thread.join()
+
+    def close(self):
+        with self._lock:
+            writers = list(self._writers.values())
+            self._writers.clear()
+        for operations, thread in writers:
+            operations.put(None)
+            thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "operations": self.operations,
+                "average_batch": round(self.operations / self.batches, 2) if self.batches else None,
+                "fallbacks": self.fallbacks,
+                "queue_depth": sum(operations.qsize() for operations, _ in self._writers.values()),
+            }
+
+
+write_queue = WriteQueue(settings.WRITE_BATCHING, settings.WRITE_BATCH_SIZE, settings.WRITE_BATCH_WAIT_MS)
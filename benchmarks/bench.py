@@ -0,0 +1,944 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import date, timedelta
+import httpx
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker, joinedload
+from backend import models, ordering, database, settings, serving, archive, stats
+from backend.main import app
+from backend.migrate import upgrade
+from backend.routers.auth import token_cache, user_cache
+from backend.routers.menu import menu_cache
+from backend.seed import generate
+from backend.write_queue import WriteQueue
+from backend.idempotency import idempotency_store
+from backend.forecast import demand_cache
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def summarize(latencies, duration, errors=0):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+def run_workers(workers, duration):
+    # workers: список (имя, функция запроса); каждая функция возвращает True при успехе,
+    # False при ошибке и None, когда работа кончилась (например, нечего выдавать)
+    results = {name: ([], [0], [0.0]) for name, _ in workers}
+    started_at = time.perf_counter()
+    deadline = started_at + duration
+
+    def loop(name, request):
+        latencies, errors, elapsed = results[name]
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            ok = request()
+            if ok is None:
+                break
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[0] += 1
+        elapsed[0] = max(elapsed[0], min(time.perf_counter() - started_at, duration))
+
+    threads = [threading.Thread(target=loop, args=worker) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        name: summarize(latencies, elapsed[0] or duration, errors[0])
+        for name, (latencies, errors, elapsed) in results.items()
+    }
+
+
+def bench_write_batching(client, args):
+    # Оформление и выдача заказа по одному коммиту на операцию против групповой записи
+    report = {}
+    for mode in ("direct", "batched"):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = orders_database(os.path.join(tmp, 'writes.db'), args.writers, args.profile)
+            Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+            writes = WriteQueue(mode == "batched", args.batch_size, args.batch_wait_ms)
+            writer_ids = iter(range(1, args.writers + 1))
+            lock = threading.Lock()
+
+            def make_writer():
+                with lock:
+                    user_id = next(writer_ids)
+
+                def write():
+                    db = Session()
+                    try:
+                        order = writes.run(db, ordering.create_order, user_id, 1, 50.0, "lunch", date.today(), "balance")
+                        writes.run(db, ordering.receive_order, order.id)
+                        return True
+                    except Exception:
+                        db.rollback()
+                        return False
+                    finally:
+                        db.close()
+                return write
+
+            started = time.perf_counter()
+            result = run_workers([("order+receive", make_writer()) for _ in range(args.writers)], args.duration)["order+receive"]
+            elapsed = time.perf_counter() - started
+            writes.close()
+            commits = writes.batches if mode == "batched" else result["requests"] * 2
+            result["operations_per_second"] = round(result["requests"] * 2 / elapsed, 1)
+            result["commits_per_second"] = round(commits / elapsed, 1)
+            result["average_batch"] = writes.stats()["average_batch"]
+            report[mode] = result
+            engine.dispose()
+    return report
+
+
+def bench_tenants(client, args):
+    # --schools школ по --writers писателей оформляют и выдают заказы: все в одной
+    # общей базе против базы на школу из реестра TenantRegistry. Со --max-engines
+    # меньше числа школ движки ещё и вытесняются по LRU
+    report = {}
+    for mode in ("shared", "per_tenant"):
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = database.TenantRegistry(f"sqlite:///{tmp}/{{tenant}}.db", args.max_engines, 600)
+            schools = [f"school{n}" for n in range(args.schools)]
+            users = args.writers * args.schools
+            if mode == "shared":
+                shared = orders_database(os.path.join(tmp, "shared.db"), users, args.profile)
+                Session = sessionmaker(autocommit=False, autoflush=False, bind=shared)
+            else:
+                for school in schools:
+                    orders_database(os.path.join(tmp, f"{school}.db"), args.writers, args.profile).dispose()
+            writer_ids = iter(range(users))
+            lock = threading.Lock()
+
+            def make_writer():
+                with lock:
+                    n = next(writer_ids)
+                school = schools[n % args.schools]
+                user_id = n + 1 if mode == "shared" else n // args.schools + 1
+
+                def write():
+                    db = Session() if mode == "shared" else registry.get(school).Session()
+                    try:
+                        order = ordering.create_order(db, user_id, 1, 50.0, "lunch", date.today(), "balance")
+                        db.commit()
+                        ordering.receive_order(db, order.id)
+                        db.commit()
+                        return True
+                    except Exception:
+                        db.rollback()
+                        return False
+                    finally:
+                        db.close()
+                return write
+
+            started = time.perf_counter()
+            result = run_workers([("order+receive", make_writer()) for _ in range(users)], args.duration)["order+receive"]
+            result["operations_per_second"] = round(result["requests"] * 2 / (time.perf_counter() - started), 1)
+            if mode == "shared":
+                shared.dispose()
+            else:
+                stats = registry.stats()
+                result["engines_opened"], result["engines_closed"] = stats["opened"], stats["closed"]
+                registry.close_all()
+            report[mode] = result
+    return report
+
+
+def bench_archive(client, args):
+    # Горячие пути на многолетней истории до и после переноса старше --archive-days
+    # в архивные таблицы; запросы «за последний месяц» архива не касаются, а вся
+    # история пользователя склеивается из двух таблиц
+    rng = random.Random(42)
+    today = date.today()
+    month_ago = (today - timedelta(days=30)).isoformat()
+    yesterday = (today - timedelta(days=1)).isoformat()
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = database.make_engine(f"sqlite:///{os.path.join(tmp, 'archive.db')}")
+        started = time.perf_counter()
+        generate(engine, students=args.sizes[-1], days=args.days)
+        report["generate_seconds"] = round(time.perf_counter() - started, 1)
+        with engine.connect() as conn:
+            user_ids = list(conn.scalars(select(models.User.id).where(models.User.username.like("student%"))))
+            recent_items = list(conn.scalars(select(models.MenuItem.id).where(models.MenuItem.date >= today - timedelta(days=30))))
+
+        def history(client, user_id):
+            # Все страницы истории заказов пользователя — проверка, что архив не теряет строк
+            ids, cursor = [], None
+            while True:
+                response = client.get(f"/orders/my?user_id={user_id}&limit=500" + (f"&cursor={cursor}" if cursor else ""))
+                ids += [order["id"] for order in response.json()]
+                cursor = response.headers.get("X-Next-Cursor")
+                if not cursor:
+                    return ids
+
+        with serve(engine) as local_client:
+            admin = login_headers(local_client, "admin", args.password)
+            student = login_headers(local_client, "student1", args.password)
+            item_id = safe_item(local_client, student)
+            endpoints = {
+                "GET /orders/my (30 дней)": lambda: local_client.get(
+                    f"/orders/my?user_id={rng.choice(user_ids)}&date_from={month_ago}").status_code == 200,
+                "GET /orders/my (вся история)": lambda: local_client.get(
+                    f"/orders/my?user_id={rng.choice(user_ids)}").status_code == 200,
+                "GET /reviews/item/{id} (30 дней)": lambda: local_client.get(
+                    f"/reviews/item/{rng.choice(recent_items)}?date_from={month_ago}").status_code == 200,
+                "GET /reviews/all (30 дней)": lambda: local_client.get(
+                    f"/reviews/all?date_from={month_ago}").status_code == 200,
+                "GET /admin/export/orders (вчера)": lambda: local_client.get(
+                    f"/admin/export/orders?format=ndjson&date_from={yesterday}&date_to={yesterday}", headers=admin
+                ).status_code == 200,
+                "POST /orders/": lambda: local_client.post("/orders/", json={
+                    "menu_item_id": item_id, "payment_type": "balance", "order_date": today.isoformat()
+                }, headers=student).status_code == 200,
+            }
+            sample = user_ids[:20]
+            before = {user_id: history(local_client, user_id) for user_id in sample}
+            for phase in ("before", "after"):
+                if phase == "after":
+                    db = sessionmaker(bind=engine)()
+                    started = time.perf_counter()
+                    report["archived"] = archive.run(db, today - timedelta(days=args.archive_days))
+                    report["archive_seconds"] = round(time.perf_counter() - started, 1)
+                    report["stats_mismatches"] = len(stats.check(db))
+                    db.close()
+                for name, request in endpoints.items():
+                    report.setdefault(name, {})[phase] = run_workers([(name, request)], args.duration)[name]
+            report["history_preserved"] = all(history(local_client, user_id)[:len(ids)] == ids for user_id, ids in before.items())
+        with engine.connect() as conn:
+            report["rows"] = {
+                table.__tablename__: conn.scalar(select(func.count()).select_from(table))
+                for table in (models.Order, models.OrderArchive, models.Review, models.ReviewArchive)
+            }
+        engine.dispose()
+    return report
+
+
+def bench_events(client, args):
+    # Тысячи простаивающих SSE-подписчиков (каждый ученик на свою тему) и несколько
+    # подписчиков персонала; события публикуются из потока, как в синхронных обработчиках
+    from backend.events import EventBroker, STAFF_TOPICS
+
+    broker = EventBroker()
+
+    async def consume(topics, latencies=None):
+        async for chunk in broker.stream(topics):
+            if latencies is not None and chunk.startswith("event:"):
+                latencies.append(time.perf_counter() - json.loads(chunk.split("data: ", 1)[1])["sent"])
+
+    def publish():
+        # Равномерно, args.event_rate событий в секунду
+        started = time.perf_counter()
+        for n in range(args.events):
+            delay = started + n / args.event_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            broker.publish(("user:0",) + STAFF_TOPICS, "order", {"sent": time.perf_counter(), "id": n})
+
+    async def run():
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        idle = [asyncio.create_task(consume([f"user:{n}"])) for n in range(1, args.subscribers + 1)]
+        latencies = [[] for _ in range(args.staff)]
+        staff = [asyncio.create_task(consume(["role:cook"], latencies[n])) for n in range(args.staff)]
+        while broker.stats()["subscribers"] < args.subscribers + args.staff:
+            await asyncio.sleep(0.01)
+        rss_subscribed = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        started = time.perf_counter()
+        await asyncio.to_thread(publish)
+        publish_seconds = time.perf_counter() - started
+        while sum(map(len, latencies)) < args.events * args.staff and time.perf_counter() - started < 60:
+            await asyncio.sleep(0.01)
+        delivered_seconds = time.perf_counter() - started
+
+        for task in idle + staff:
+            task.cancel()
+        await asyncio.gather(*idle, *staff, return_exceptions=True)
+        delivered = [latency for staff_latencies in latencies for latency in staff_latencies]
+        return {
+            "idle_subscribers": args.subscribers,
+            "staff_subscribers": args.staff,
+            "events": args.events,
+            "published_per_second": round(args.events / publish_seconds),
+            "deliveries_per_second": round(len(delivered) / delivered_seconds),
+            "delivered": len(delivered),
+            "dropped": broker.dropped,
+            "delivery_p50_ms": round(percentile(delivered, 0.50) * 1000, 2) if delivered else None,
+            "delivery_p99_ms": round(percentile(delivered, 0.99) * 1000, 2) if delivered else None,
+            "rss_kb_per_1000_subscribers": round((rss_subscribed - rss_before) * 1000 / args.subscribers),
+            "subscribers_left": broker.stats()["subscribers"],
+        }
+
+    return asyncio.run(run())
+
+
+def clear_caches():
+    for cache in (token_cache, user_cache, menu_cache, idempotency_store.cache, demand_cache):
+        cache.clear()
+
+
+@contextmanager
+def serve(engine):
+    # TestClient поверх отдельной базы: все зависимости сессий подменяются на engine,
+    # кэши сбрасываются, чтобы не отдавать пользователей и меню из другой базы
+    async_engine = database.make_async_engine(database.to_async_url(engine.url.render_as_string(hide_password=False)))
+    TestingSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    AsyncTestingSession = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    def get_test_db():
+        db = TestingSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_test_async_db():
+        async with AsyncTestingSession() as db:
+            yield db
+
+    app.dependency_overrides[database.get_db] = get_test_db
+    app.dependency_overrides[database.get_read_db] = get_test_db
+    app.dependency_overrides[database.get_async_db] = get_test_async_db
+    auto_migrate, app.state.auto_migrate = app.state.auto_migrate, False
+    clear_caches()
+    try:
+        with TestClient(app) as client:
+            try:
+                yield client
+            finally:
+                client.portal.call(async_engine.dispose)
+    finally:
+        app.dependency_overrides.clear()
+        app.state.auto_migrate = auto_migrate
+        clear_caches()
+
+
+def bench_login(client, args):
+    def login():
+        response = client.post("/auth/login", data={"username": args.username, "password": args.password})
+        if response.status_code == 503:
+            # как и настоящий клиент, не долбим сервер сразу после отказа
+            time.sleep(0.1)
+        return response.status_code == 200
+
+    def menu():
+        return client.get("/menu/").status_code == 200
+
+    baseline = run_workers([("menu", menu)] * args.readers, args.duration)
+    under_load = run_workers([("login", login)] * args.logins + [("menu", menu)] * args.readers, args.duration)
+    return {"menu_idle": baseline["menu"], "menu_during_logins": under_load["menu"], "login": under_load["login"]}
+
+
+def orders_database(path, users, profile=settings.DB_PROFILE):
+    # Пользователи user0..user<users-1> с большим балансом и 20 блюд из одного продукта
+    engine = database.make_engine(f"sqlite:///{path}", profile=profile)
+    upgrade(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"username": f"user{i}", "password_hash": "-", "role": "student", "balance": 1e9} for i in range(users)
+        ])
+        conn.execute(insert(models.Inventory), [{"product_name": "Мука", "quantity": 1e9, "unit": "кг"}])
+        conn.execute(insert(models.MenuItem), [
+            {"name": f"Блюдо {i}", "price": 50.0, "meal_type": "lunch", "date": date.today(), "is_available": True} for i in range(20)
+        ])
+        conn.execute(insert(models.Recipe), [
+            {"menu_item_id": i, "inventory_id": 1, "quantity_required": 0.1} for i in range(1, 21)
+        ])
+    return engine
+
+
+def bench_db_profiles(client, args):
+    # Смешанная нагрузка напрямую на движок: читатели грузят меню, писатели оформляют заказы
+    report = {}
+    for profile in ("legacy", "tuned"):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = orders_database(os.path.join(tmp, 'bench.db'), args.writers, profile)
+            Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+            writer_ids = iter(range(1, args.writers + 1))
+            lock = threading.Lock()
+
+            def read():
+                db = Session()
+                try:
+                    db.query(models.MenuItem).options(joinedload(models.MenuItem.ingredients)).filter(
+                        models.MenuItem.date == date.today(), models.MenuItem.meal_type == "lunch"
+                    ).all()
+                    return True
+                finally:
+                    db.close()
+
+            def make_writer():
+                with lock:
+                    user_id = next(writer_ids)
+
+                def write():
+                    db = Session()
+                    try:
+                        ordering.reserve_ingredients(db, {1: 1})
+                        ordering.debit_balance(db, user_id, 50.0)
+                        db.add(models.Order(user_id=user_id, menu_item_id=1, order_date=date.today(), payment_type="balance", is_paid=True))
+                        db.commit()
+                        return True
+                    except Exception:
+                        db.rollback()
+                        return False
+                    finally:
+                        db.close()
+                return write
+
+            workers = [("read", read)] * args.readers + [("write", make_writer()) for _ in range(args.writers)]
+            report[profile] = run_workers(workers, args.duration)
+            engine.dispose()
+    return report
+
+
+async def run_concurrent(path, concurrency, duration):
+    # concurrency одновременных клиентов прямо через ASGI, без сетевого стека
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.get(path)
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return summarize(latencies, duration, errors)
+
+
+def bench_concurrency(client, args):
+    # Асинхронные читающие эндпоинты против синхронного, ограниченного пулом потоков
+    paths = {
+        "async /reviews/all": "/reviews/all?limit=20",
+        "async /orders/my": "/orders/my?user_id=1&limit=20",
+        "async /admin/inventory": "/admin/inventory?limit=20",
+        "sync /admin/purchase-requests": "/admin/purchase-requests?limit=20",
+    }
+
+    async def run_all():
+        report = {}
+        try:
+            for level in args.concurrency:
+                report[level] = {name: await run_concurrent(path, level, args.duration) for name, path in paths.items()}
+        finally:
+            await database.async_engine.dispose()
+        return report
+
+    return asyncio.run(run_all())
+
+
+def fill_orders(engine, rows):
+    # Пустая база с одним учеником, одним блюдом и rows заказами — материал для экспорта
+    upgrade(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"username": "student", "password_hash": "-", "role": "student", "balance": 0}])
+        conn.execute(insert(models.MenuItem), [{"name": "Пицца", "price": 70.0, "meal_type": "lunch", "date": date.today()}])
+    batch = [{"user_id": 1, "menu_item_id": 1, "order_date": date.today(), "payment_type": "balance", "is_paid": True, "is_received": True}] * 50000
+    for offset in range(0, rows, len(batch)):
+        with engine.begin() as conn:
+            conn.execute(insert(models.Order), batch[:rows - offset])
+
+
+def export_peak_kb(engine, fmt):
+    # Пик памяти, выделенной за время самой выгрузки. ru_maxrss здесь не годится: это
+    # пик за всю жизнь процесса, и его уже подняло заполнение базы
+    from backend.routers.exports import export_rows, orders_query
+
+    tracemalloc.start()
+    try:
+        for _ in export_rows(orders_query().order_by("id"), fmt, bind=engine):
+            pass
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_export(client, args):
+    # Экспорт args.rows заказов; память выгрузки не должна расти вместе с таблицей
+    from backend.routers.exports import export_rows, orders_query
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = database.make_engine(f"sqlite:///{os.path.join(tmp, 'export.db')}")
+        fill_orders(engine, args.rows)
+
+        started = time.perf_counter()
+        exported = 0
+        for chunk in export_rows(orders_query().order_by("id"), args.format, bind=engine):
+            exported += len(chunk)
+        duration = time.perf_counter() - started
+        # Отдельным проходом: трассировка выделений замедляет выгрузку в разы
+        peak_kb = export_peak_kb(engine, args.format)
+        engine.dispose()
+
+    return {
+        "rows": args.rows,
+        "bytes": exported,
+        "seconds": round(duration, 2),
+        "rows_per_second": round(args.rows / duration),
+        "export_peak_kb": peak_kb,
+    }
+
+
+def login_headers(client, username, password):
+    response = client.post("/auth/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def safe_item(client, headers):
+    # Блюдо на сегодня без аллергенов ученика, иначе заказ отклонится с 400
+    for meal_type in ("lunch", "breakfast"):
+        menu = client.get(f"/menu/safe?meal_type={meal_type}", headers=headers).json()
+        if menu:
+            return menu[0]["id"]
+    return None
+
+
+def bench_endpoints(client, args):
+    # Горячие пути API на текущей базе: у каждого потока свой ученик student<N>,
+    # выдача забирает ещё не выданные заказы на сегодня, включая только что оформленные
+    today = date.today().isoformat()
+    admin = login_headers(client, "admin", args.password)
+    students = [login_headers(client, f"student{n}", args.password) for n in range(1, max(args.clients) + 1)]
+    items = [safe_item(client, headers) for headers in students]
+    exported = client.get(f"/admin/export/orders?format=ndjson&received=false&date_from={today}", headers=admin)
+    pending = [json.loads(line)["id"] for line in exported.text.splitlines()]
+
+    def login(n):
+        def request():
+            response = client.post("/auth/login", data={"username": f"student{n + 1}", "password": args.password})
+            if response.status_code == 503:
+                time.sleep(0.1)
+            return response.status_code == 200
+        return request
+
+    def me(n):
+        return lambda: client.get("/auth/me", headers=students[n]).status_code == 200
+
+    def menu(n):
+        return lambda: client.get("/menu/?meal_type=lunch").status_code == 200
+
+    def order(n):
+        def request():
+            if items[n] is None:
+                return False
+            response = client.post("/orders/", json={"menu_item_id": items[n], "payment_type": "balance", "order_date": today}, headers=students[n])
+            if response.status_code != 200:
+                return False
+            pending.append(response.json()["id"])
+            return True
+        return request
+
+    def receive(n):
+        def request():
+            try:
+                order_id = pending.pop()
+            except IndexError:
+                return None
+            return client.patch(f"/orders/{order_id}/receive").status_code == 200
+        return request
+
+    def daily_report(n):
+        return lambda: client.get(f"/admin/stats/daily-report?day={today}", headers=admin).status_code == 200
+
+    def reviews_all(n):
+        return lambda: client.get("/reviews/all?limit=100").status_code == 200
+
+    endpoints = {
+        "POST /auth/login": login,
+        "GET /auth/me": me,
+        "GET /menu/": menu,
+        "POST /orders/": order,
+        "PATCH /orders/{id}/receive": receive,
+        "GET /admin/stats/daily-report": daily_report,
+        "GET /reviews/all": reviews_all,
+    }
+    # Уровни во внешнем цикле: выдача на каждом уровне получает заказы, оформленные перед ней
+    report = {name: {} for name in endpoints}
+    for level in args.clients:
+        for name, make in endpoints.items():
+            workers = [(name, make(n)) for n in range(level)]
+            report[name][str(level)] = run_workers(workers, args.duration)[name]
+    return report
+
+
+def bench_api(client, args):
+    # Полный набор эндпоинтов на синтетических базах разного размера; с --url — на уже запущенном сервере
+    if args.url:
+        return {"live": bench_endpoints(client, args)}
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for students in args.sizes:
+            engine = database.make_engine(f"sqlite:///{os.path.join(tmp, f'api-{students}.db')}")
+            generate(engine, students=students, days=args.days)
+            with serve(engine) as local_client:
+                report[f"students={students}"] = bench_endpoints(local_client, args)
+            engine.dispose()
+    return report
+
+
+def bench_serving(client, args):
+    # Очередь у раздачи: один повар сканирует заказы на сегодняшний обед по одному.
+    # Половина выдаётся обычным PATCH /orders/{id}/receive, половина — через режим
+    # раздачи; считаются задержка скана и SQL-запросы на скан (включая дозапись пачек)
+    today = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = database.make_engine(f"sqlite:///{os.path.join(tmp, 'serving.db')}")
+        generate(engine, students=args.sizes[-1], days=args.days)
+        with engine.connect() as conn:
+            pending = list(conn.scalars(serving._pending_orders(today, "lunch").with_only_columns(models.Order.id)))
+        queries = []
+        event.listen(engine, "before_cursor_execute", lambda *a: queries.append(1))
+        report = {"orders": len(pending)}
+        with serve(engine) as local_client:
+            cook = login_headers(local_client, "cook", args.password)
+            half = len(pending) // 2
+
+            def scan(name, ids, request):
+                latencies = []
+                errors = 0
+                queries.clear()
+                started = time.perf_counter()
+                for order_id in ids:
+                    begin = time.perf_counter()
+                    if not request(order_id):
+                        errors += 1
+                    latencies.append(time.perf_counter() - begin)
+                if name == "serving":
+                    local_client.post("/serving/flush?meal_type=lunch", headers=cook)
+                report[name] = summarize(latencies, time.perf_counter() - started, errors)
+                report[name]["queries_per_scan"] = round(len(queries) / max(len(ids), 1), 2)
+
+            scan("receive", pending[:half], lambda order_id: local_client.patch(f"/orders/{order_id}/receive").status_code == 200)
+            local_client.post("/serving/open?meal_type=lunch", headers=cook)
+            scan("serving", pending[half:], lambda order_id: local_client.post(
+                "/serving/serve?meal_type=lunch", json=[order_id], headers=cook
+            ).json()[0]["success"])
+            # Повторный скан уже выданного заказа должен отклоняться из памяти
+            repeat = local_client.post("/serving/serve?meal_type=lunch", json=pending[-1:], headers=cook).json()
+            report["double_serve_rejected"] = not repeat[0]["success"] if repeat else None
+        with engine.connect() as conn:
+            report["left_unreceived"] = conn.scalar(
+                select(func.count()).select_from(serving._pending_orders(today, "lunch").subquery())
+            )
+        engine.dispose()
+    return report
+
+
+def bench_idempotency(client, args):
+    # Шторм повторов: --duplicates одинаковых запросов с одним Idempotency-Key уходят
+    # одновременно; вторая волна идёт после сброса кэша, как если бы повторы попали
+    # в другой процесс и ответ нашёлся только в таблице. Деньги должны списаться
+    # один раз на ключ, а все ответы совпасть
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = database.make_engine(f"sqlite:///{os.path.join(tmp, 'idempotency.db')}")
+        generate(engine, students=50, days=2)
+        with serve(engine) as local_client:
+            student = login_headers(local_client, "student1", args.password)
+            item_id = safe_item(local_client, student)
+            with engine.connect() as conn:
+                price = conn.scalar(select(models.MenuItem.price).where(models.MenuItem.id == item_id))
+            balance_before = local_client.get("/auth/me", headers=student).json()["balance"]
+            today = date.today().isoformat()
+            latencies = []
+            mismatched = 0
+            order_ids = set()
+
+            def storm(path, payload, key):
+                barrier = threading.Barrier(args.duplicates)
+                responses = [None] * args.duplicates
+
+                def fire(n):
+                    barrier.wait()
+                    started = time.perf_counter()
+                    responses[n] = local_client.post(path, json=payload, headers={**student, "Idempotency-Key": key})
+                    latencies.append(time.perf_counter() - started)
+
+                threads = [threading.Thread(target=fire, args=(n,)) for n in range(args.duplicates)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                return [(response.status_code, response.json()) for response in responses]
+
+            for _ in range(args.rounds):
+                key = str(uuid.uuid4())
+                payload = {"menu_item_id": item_id, "payment_type": "balance", "order_date": today}
+                results = storm("/orders/", payload, key)
+                idempotency_store.cache.clear()
+                results += storm("/orders/", payload, key)
+                mismatched += sum(1 for result in results if result != results[0])
+                if results[0][0] == 200:
+                    order_ids.add(results[0][1]["id"])
+
+            # Отзыв на выданный заказ: дубликаты не должны упираться в «уже оставляли отзыв»
+            local_client.patch(f"/orders/{min(order_ids)}/receive")
+            user_id = local_client.get("/auth/me", headers=student).json()["id"]
+            review = storm(f"/reviews/?user_id={user_id}", {"menu_item_id": item_id, "rating": 5}, str(uuid.uuid4()))
+            balance_after = local_client.get("/auth/me", headers=student).json()["balance"]
+            with engine.connect() as conn:
+                created = conn.scalar(select(func.count()).select_from(models.Order).where(models.Order.id.in_(order_ids)))
+                reviews = conn.scalar(select(func.count()).select_from(models.Review).where(
+                    models.Review.user_id == user_id, models.Review.menu_item_id == item_id
+                ))
+        engine.dispose()
+    return {
+        "requests": len(latencies),
+        "keys": args.rounds,
+        "distinct_orders": len(order_ids),
+        "orders_in_db": created,
+        "charged": round(balance_before - balance_after, 2),
+        "expected_charge": round(price * args.rounds, 2),
+        "mismatched_responses": mismatched,
+        "review_statuses": sorted({status for status, _ in review}),
+        "reviews_created": reviews,
+        **{key: value for key, value in summarize(latencies, 1).items() if key.endswith("_ms")},
+    }
+
+
+def bench_menu(client, args):
+    # Публикация меню на неделю: --dishes блюд на каждый приём пищи пяти учебных дней,
+    # у каждого блюда рецепт из трёх продуктов. По одному POST /menu/ (рецепты так
+    # создать нельзя) против одного POST /menu/batch вместе с рецептами
+    monday = date.today() + timedelta(days=7 - date.today().weekday())
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = database.make_engine(f"sqlite:///{os.path.join(tmp, 'menu.db')}")
+        generate(engine, students=10, days=1)
+        with engine.connect() as conn:
+            inventory_ids = list(conn.scalars(select(models.Inventory.id)))
+        rng = random.Random(7)
+        week = [
+            {
+                "name": f"Блюдо {n}",
+                "description": "Суп с молоком" if n % 4 == 0 else "Овощное рагу",
+                "price": 100.0 + n,
+                "meal_type": meal_type,
+                "date": (monday + timedelta(days=day)).isoformat(),
+                "ingredients": [
+                    {"inventory_id": inventory_id, "quantity_required": 0.1}
+                    for inventory_id in rng.sample(inventory_ids, 3)
+                ],
+            }
+            for day in range(5)
+            for meal_type in ("breakfast", "lunch")
+            for n in range(args.dishes)
+        ]
+        queries = []
+        event.listen(engine, "before_cursor_execute", lambda *a: queries.append(1))
+        report = {"dishes": len(week), "recipes": 3 * len(week)}
+        with serve(engine) as local_client:
+            admin = login_headers(local_client, "admin", args.password)
+
+            def publish(name, requests):
+                queries.clear()
+                started = time.perf_counter()
+                errors = sum(1 for request in requests if request().status_code != 200)
+                report[name] = {
+                    "requests": len(requests),
+                    "errors": errors,
+                    "seconds": round(time.perf_counter() - started, 3),
+                    "queries": len(queries),
+                }
+
+            publish("single", [
+                lambda dish=dish: local_client.post(
+                    "/menu/", json={key: value for key, value in dish.items() if key != "ingredients"}, headers=admin
+                )
+                for dish in week
+            ])
+            batch = [{**dish, "date": (date.fromisoformat(dish["date"]) + timedelta(days=7)).isoformat()} for dish in week]
+            publish("batch", [lambda: local_client.post("/menu/batch", json=batch, headers=admin)])
+            published = local_client.get(f"/menu/?day={batch[0]['date']}&meal_type=breakfast").json()
+            report["batch_menu_with_recipes"] = all(len(item["ingredients"]) == 3 for item in published) \
+                and len(published) == args.dishes
+            unknown = [{**week[0], "ingredients": [{"inventory_id": max(inventory_ids) + 1, "quantity_required": 1}]}]
+            report["unknown_inventory_status"] = local_client.post("/menu/batch", json=unknown, headers=admin).status_code
+        with engine.connect() as conn:
+            report["recipes_in_db"] = conn.scalar(
+                select(func.count()).select_from(models.Recipe).join(models.MenuItem)
+                .where(models.MenuItem.date >= monday + timedelta(days=7))
+            )
+        engine.dispose()
+    return report
+
+
+def bench_forecast(client, args):
+    # Потребность в продуктах на сегодня: как повар считал бы её вручную (заказ за
+    # заказом, рецепт за рецептом) против одной группировки GET /admin/forecast —
+    # сначала холодной, потом из кэша. Склад урезается, чтобы появилась нехватка;
+    # повторная генерация заявок не должна заказать те же продукты второй раз
+    today = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = database.make_engine(f"sqlite:///{os.path.join(tmp, 'forecast.db')}")
+        generate(engine, students=args.sizes[-1], days=args.days)
+        with engine.begin() as conn:
+            conn.execute(models.Inventory.__table__.update().values(quantity=models.Inventory.id % 5))
+        queries = []
+        event.listen(engine, "before_cursor_execute", lambda *a: queries.append(1))
+        report = {}
+
+        def measure(name, fn):
+            queries.clear()
+            started = time.perf_counter()
+            result = fn()
+            report[name] = {"ms": round((time.perf_counter() - started) * 1000, 2), "queries": len(queries)}
+            return result
+
+        def by_hand():
+            db = sessionmaker(bind=engine)()
+            needs = {}
+            for order in db.query(models.Order).filter(
+                models.Order.order_date == today, models.Order.is_paid == True, models.Order.is_received == False
+            ):
+                for recipe in db.query(models.Recipe).filter(models.Recipe.menu_item_id == order.menu_item_id):
+                    needs[recipe.inventory_id] = needs.get(recipe.inventory_id, 0.0) + recipe.quantity_required
+            db.close()
+            return needs
+
+        needs = measure("by_hand", by_hand)
+        with serve(engine) as local_client:
+            cook = login_headers(local_client, "cook", args.password)
+            url = f"/admin/forecast?date_from={today}&date_to={today}"
+            rows = measure("forecast", lambda: local_client.get(url, headers=cook).json())
+            measure("forecast_cached", lambda: local_client.get(url, headers=cook).json())
+            generate_url = f"/admin/purchase-requests/generate?date_from={today}&date_to={today}"
+            created = measure("generate", lambda: local_client.post(generate_url, headers=cook).json())
+            repeated = local_client.post(generate_url, headers=cook).json()
+        engine.dispose()
+    report["ingredients"] = len(rows)
+    report["reserved_matches"] = all(abs(row["reserved"] - round(needs.get(row["inventory_id"], 0.0), 3)) < 1e-6 for row in rows) \
+        and len(rows) >= len(needs)
+    report["shortfalls"] = sum(1 for row in rows if row["shortfall"] > 0)
+    report["requests_created"] = len(created)
+    report["requests_created_again"] = len(repeated)
+    return report
+
+
+SCENARIOS = {
+    "login": bench_login,
+    "db": bench_db_profiles,
+    "concurrency": bench_concurrency,
+    "export": bench_export,
+    "api": bench_api,
+    "writes": bench_write_batching,
+    "events": bench_events,
+    "serving": bench_serving,
+    "idempotency": bench_idempotency,
+    "tenants": bench_tenants,
+    "archive": bench_archive,
+    "menu": bench_menu,
+    "forecast": bench_forecast,
+}
+
+
+def regressions(report, baseline, threshold, path=()):
+    # Сравнивает замеры с базовыми по всем совпадающим ключам: просадка пропускной
+    # способности или рост p95/p99 больше чем на threshold считается регрессией
+    if "throughput" in baseline:
+        found = []
+        if baseline["throughput"] and report["throughput"] < baseline["throughput"] * (1 - threshold):
+            found.append((" / ".join(path), "throughput", baseline["throughput"], report["throughput"]))
+        for key in ("p95_ms", "p99_ms"):
+            if baseline.get(key) and report.get(key) and report[key] > baseline[key] * (1 + threshold):
+                found.append((" / ".join(path), key, baseline[key], report[key]))
+        return found
+    found = []
+    for key, value in baseline.items():
+        if isinstance(value, dict) and isinstance(report.get(key), dict):
+            found += regressions(report[key], value, threshold, path + (key,))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочные замеры API столовой")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--profile", choices=["tuned", "legacy"], default=settings.DB_PROFILE)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--batch-wait-ms", type=float, default=2.0)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--staff", type=int, default=10)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--event-rate", type=float, default=2000)
+    parser.add_argument("--duplicates", type=int, default=32, help="одновременных повторов на ключ в сценарии idempotency")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--dishes", type=int, default=8, help="блюд на приём пищи в сценарии menu")
+    parser.add_argument("--archive-days", type=int, default=settings.ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--schools", type=int, default=4)
+    parser.add_argument("--max-engines", type=int, default=32)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--username", default="student")
+    parser.add_argument("--password", default="password123")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32], help="уровни параллельности сценария api")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 5000], help="число учеников в синтетических базах")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--url", help="адрес запущенного сервера вместо TestClient, например http://127.0.0.1:8000")
+    parser.add_argument("--baseline", help="JSON с базовыми замерами для сравнения")
+    parser.add_argument("--save-baseline", help="сохранить текущие замеры как базовые")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+    if args.scenario == "api" and not args.url and min(args.sizes) < max(args.clients):
+        parser.error("в каждой базе учеников должно быть не меньше, чем одновременных клиентов")
+
+    if args.url:
+        with httpx.Client(base_url=args.url, timeout=60) as client:
+            report = SCENARIOS[args.scenario](client, args)
+    else:
+        with TestClient(app) as client:
+            report = SCENARIOS[args.scenario](client, args)
+    report = json.loads(json.dumps(report))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(report, json.load(f), args.threshold)
+        for where, metric, before, after in found:
+            print(f"РЕГРЕССИЯ {where}: {metric} {before} -> {after}")
+        print("Регрессий нет" if not found else f"Регрессий: {len(found)}")
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+from sqlalchemy import event, insert, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from backend import models, database, archive
+from benchmarks.bench import serve
+from backend.idempotency import idempotency_store
+from backend.migrate import upgrade
+from backend.seed import generate
+
+# Запросы, которым полный проход по таблице разрешён: daily_stats — это
+# сводная таблица на несколько строк в день, archive_state — по строке
+# на архивируемую таблицу
+ALLOWED_SCANS = {"daily_stats", "archive_state"}
+
+TODAY = date.today()
+
+
+def populate(engine):
+    generate(engine, students=1000, days=60, ingredients=500)
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(insert(models.PurchaseRequest), [
+            {"product_name": f"Продукт {rng.randint(1, 50)}", "requested_quantity": 10, "unit": "кг",
+             "requested_by": 2, "status": rng.choice(["pending", "approved"])}
+            for _ in range(2000)
+        ])
+    # Последний месяц в горячих таблицах, остальное — в архиве, чтобы проверить и его запросы
+    db = sessionmaker(bind=engine)()
+    archive.run(db, TODAY - timedelta(days=30))
+    db.close()
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def expect(response, status=200):
+    # Вызов, упавший до своего запроса, молча выбросил бы его план из проверки
+    if response.status_code != status:
+        raise AssertionError(
+            f"{response.request.method} {response.request.url.path}: {response.status_code} вместо {status}: {response.text}"
+        )
+    return response
+
+
+def exercise(client):
+    # Проходим по всем роутерам так же, как это делает фронтенд
+    student = {"Authorization": "Bearer " + expect(client.post("/auth/login", data={"username": "student", "password": "password123"})).json()["access_token"]}
+    admin = {"Authorization": "Bearer " + expect(client.post("/auth/login", data={"username": "admin", "password": "password123"})).json()["access_token"]}
+    today = TODAY.isoformat()
+    month_ago = (TODAY - timedelta(days=30)).isoformat()
+    long_ago = (TODAY - timedelta(days=45)).isoformat()
+    expect(client.get("/auth/me", headers=student))
+    expect(client.get(f"/menu/?day={today}&meal_type=lunch"))
+    expect(client.post("/menu/", json={"name": "Суп", "price": 10, "meal_type": "lunch", "date": today}, headers=admin))
+    expect(client.post("/menu/batch", json=[
+        {"name": "Суп", "price": 10, "meal_type": "lunch", "date": today, "ingredients": [{"inventory_id": 1, "quantity_required": 0.1}]}
+    ], headers=admin))
+    order = expect(client.post("/orders/", json={"menu_item_id": 1, "payment_type": "balance", "order_date": today}, headers=student)).json()
+    for _ in range(2):
+        expect(client.post("/orders/", json={"menu_item_id": 1, "payment_type": "balance", "order_date": today}, headers={**student, "Idempotency-Key": "plan"}))
+        idempotency_store.cache.clear()
+    expect(client.post("/orders/batch", json=[{"menu_item_id": i, "payment_type": "balance", "order_date": today} for i in (2, 3)], headers=student))
+    expect(client.get("/orders/my?user_id=3&cursor=1000000000"))
+    expect(client.get(f"/orders/my?user_id=3&date_from={month_ago}"))
+    expect(client.patch(f"/orders/{order['id']}/receive"))
+    expect(client.post("/serving/open?meal_type=lunch", headers=admin))
+    expect(client.get("/serving/orders/999999999?meal_type=lunch", headers=admin), 404)
+    expect(client.post("/serving/serve?meal_type=lunch", json=[order["id"] + 1], headers=admin))
+    expect(client.post("/serving/flush?meal_type=lunch", headers=admin))
+    expect(client.post("/reviews/?user_id=3", json={"menu_item_id": 1, "rating": 5}))
+    expect(client.get("/reviews/item/1?cursor=1000000000"))
+    expect(client.get("/reviews/all?cursor=1000000000"))
+    expect(client.get(f"/reviews/all?date_from={long_ago}&date_to={long_ago}"))
+    expect(client.get(f"/reviews/item/1?date_from={long_ago}"))
+    expect(client.get(f"/admin/export/orders?format=ndjson&date_from={long_ago}&date_to={long_ago}", headers=admin))
+    expect(client.get(f"/admin/export/reviews?format=ndjson&date_from={long_ago}&date_to={long_ago}", headers=admin))
+    expect(client.get("/admin/purchase-requests?status=pending&cursor=1000000000"))
+    expect(client.patch("/admin/inventory", json=[{"id": 1, "quantity": 0}], headers=admin))
+    expect(client.get(f"/admin/forecast?date_from={today}&date_to={today}", headers=admin))
+    expect(client.post(f"/admin/purchase-requests/generate?date_from={today}&date_to={today}", headers=admin))
+    expect(client.get("/admin/inventory?cursor=1000000000"))
+    expect(client.patch("/admin/inventory", json=[{"id": 1, "delta": 1}, {"id": 2, "quantity": 100}], headers=admin))
+    expect(client.post("/admin/purchase-requests/approve", json=[1, 2, 3], headers=admin))
+    expect(client.get(f"/admin/stats/daily-report?day={today}", headers=admin))
+    expect(client.get("/admin/stats/attendance?meal_type=lunch", headers=admin))
+
+
+def full_scans(plan):
+    tables = {table.name for table in database.Base.metadata.sorted_tables}
+    scans = []
+    for row in plan:
+        words = row[-1].split()
+        if words[:1] == ["SCAN"] and words[1] in tables and words[1] not in ALLOWED_SCANS:
+            scans.append(row[-1])
+    return scans
+
+
+def check():
+    # Прогоняет exercise на синтетической базе и возвращает число проверенных запросов
+    # и список (запрос, строки плана с полным сканированием)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = database.make_engine(f"sqlite:///{os.path.join(tmp, 'plans.db')}")
+        upgrade(engine)
+        populate(engine)
+
+        statements = []
+
+        # Слушаем все движки: синхронный и асинхронный, который serve создаёт поверх той же базы
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().split()[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+                statements.append((statement, parameters))
+
+        event.listen(Engine, "before_cursor_execute", capture)
+        try:
+            with serve(engine) as client:
+                exercise(client)
+        finally:
+            event.remove(Engine, "before_cursor_execute", capture)
+
+        failures = []
+        seen = set()
+        with engine.connect() as conn:
+            for statement, parameters in statements:
+                if statement in seen:
+                    continue
+                seen.add(statement)
+                plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+                scans = full_scans(plan)
+                if scans:
+                    failures.append((" ".join(statement.split()), scans))
+        engine.dispose()
+    return len(seen), failures
+
+
+def main():
+    checked, failures = check()
+    for statement, scans in failures:
+        print("FULL SCAN:", statement)
+        for scan in scans:
+            print("   ", scan)
+    print(f"Проверено запросов: {checked}, с полным сканированием: {len(failures)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
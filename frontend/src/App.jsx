@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { authApi, menuApi, orderApi, reviewApi, adminApi } from './api';
+import { authApi, menuApi, orderApi, reviewApi, adminApi, servingApi, subscribeEvents } from './api';
 import { 
   Utensils, User, LogOut, ShoppingBag, CheckCircle, 
   ClipboardList, TrendingUp, Users, Package, Truck, AlertCircle, Plus
@@ -203,9 +203,15 @@ function StudentMenu({ user, setUser }) {
 function StudentOrders({ user }) {
   const [orders, setOrders] = useState([]);
   useEffect(() => {
-    orderApi.getMyOrders(user.id).then(res => setOrders(res.data.reverse()));
+    orderApi.getMyOrders(user.id).then(res => setOrders(res.data)); // первая страница — самые новые
   }, [user.id]);
 
+  useEffect(() => subscribeEvents({
+    order: (order) => setOrders(prev => prev.some(o => o.id === order.id)
+      ? prev.map(o => o.id === order.id ? { ...o, ...order } : o)
+      : [{ created_at: new Date().toISOString(), ...order }, ...prev]),
+  }), [user.id]);
+
   return (
     <div className="orders-list">
       {orders.length === 0 && <p style={{textAlign:'center', color: '#666'}}>У вас пока нет заказов</p>}
@@ -250,26 +256,72 @@ function CookDashboard() {
 }
 
 function CookKitchenView() {
-  const [orderId, setOrderId] = useState('');
+  const [query, setQuery] = useState('');
+  const [mealType, setMealType] = useState(new Date().getHours() < 11 ? 'breakfast' : 'lunch');
+  const [line, setLine] = useState(null);
+  const [found, setFound] = useState(null);
+
+  useEffect(() => {
+    servingApi.open(mealType).then(res => setLine(res.data)).catch(() => setLine(null));
+    setFound(null);
+  }, [mealType]);
+
+  const serve = async (orderIds) => {
+    const res = await servingApi.serve(mealType, orderIds);
+    const failed = res.data.filter(r => !r.success);
+    const served = res.data.length - failed.length;
+    setLine(prev => prev && { ...prev, waiting: prev.waiting - served, served: prev.served + served });
+    if (failed.length) alert(failed.map(r => `#${r.id}: ${r.detail}`).join('\n'));
+    else alert(`Готово! Выдано заказов: ${served}`);
+  };
+
   const handleIssue = async (e) => {
     e.preventDefault();
-    if (!orderId) return;
+    const value = query.trim();
+    if (!value) return;
+    try {
+      if (/^\d+$/.test(value)) {
+        await serve([Number(value)]);
+      } else {
+        const res = await servingApi.findStudent(mealType, value);
+        setFound({ username: value, orders: res.data.filter(o => !o.is_received) });
+      }
+      setQuery('');
+    } catch (err) { alert("Ошибка выдачи"); }
+  };
+
+  const serveFound = async () => {
     try {
-      await orderApi.receiveOrder(orderId);
-      alert(`Готово! Заказ #${orderId} отмечен как выданный.`);
-      setOrderId('');
-    } catch (err) { alert("Ошибка: Заказ не найден или уже выдан"); }
+      await serve(found.orders.map(o => o.id));
+      setFound(null);
+    } catch (err) { alert("Ошибка выдачи"); }
   };
+
   return (
     <div style={{maxWidth: '400px', margin: '2rem auto', textAlign: 'center'}}>
       <div className="auth-card">
         <h3>Выдача блюда</h3>
+        <select style={{width:'100%', padding:'10px', marginBottom: '1rem'}} value={mealType} onChange={e => setMealType(e.target.value)}>
+          <option value="breakfast">☕ Завтрак</option>
+          <option value="lunch">🍲 Обед</option>
+        </select>
+        {line && <p>Ожидают: {line.waiting} · Выдано: {line.served}</p>}
         <form onSubmit={handleIssue}>
-          <input className="form-group" type="number" placeholder="Номер заказа" 
+          <input className="form-group" placeholder="Номер заказа или логин ученика" 
             style={{width: '100%', padding: '15px', fontSize: '1.2rem', marginBottom: '1rem', textAlign: 'center'}}
-            value={orderId} onChange={e => setOrderId(e.target.value)} />
+            value={query} onChange={e => setQuery(e.target.value)} />
           <button className="btn btn-primary" style={{width: '100%', padding: '15px'}}>Подтвердить выдачу</button>
         </form>
+        {found && (
+          <div style={{marginTop: '1rem'}}>
+            {found.orders.length === 0 ? <p>У ученика {found.username} нет заказов к выдаче</p> : (
+              <>
+                {found.orders.map(o => <p key={o.id}>#{o.id} — {o.menu_item_name}</p>)}
+                <button className="btn btn-primary" style={{width: '100%'}} onClick={serveFound}>Выдать всё ({found.orders.length})</button>
+              </>
+            )}
+          </div>
+        )}
       </div>
     </div>
   );
@@ -321,7 +373,7 @@ function AdminDashboard({ user }) {
       {tab === 'stats' && <AdminStatsView />}
       {tab === 'users' && <AdminUsersView />}
       {tab === 'inventory' && <AdminInventoryView role="admin" />}
-      {tab === 'requests' && <AdminRequestsView user={user} />}
+      {tab === 'requests' && <AdminRequestsView />}
     </div>
   );
 }
@@ -335,6 +387,18 @@ function AdminStatsView() {
     adminApi.getDailyReport(today).then(res => setStats(res.data));
   }, []);
 
+  useEffect(() => subscribeEvents({
+    attendance: (delta) => {
+      if (delta.day !== new Date().toISOString().split('T')[0]) return;
+      setStats(prev => prev && {
+        ...prev,
+        total_orders_count: prev.total_orders_count + (delta.paid_count || 0),
+        received_meals_count: prev.received_meals_count + (delta.received_count || 0),
+        total_revenue: prev.total_revenue + (delta.revenue || 0),
+      });
+    },
+  }), []);
+
   if (!stats) return <p>Загрузка...</p>;
   return (
     <div className="menu-grid">
@@ -410,12 +474,20 @@ function AdminInventoryView({ role }) {
     fetchInventory();
   }, []);
 
+  // Остатки меняются и при заказах, поэтому обновляем их по событиям сервера
+  useEffect(() => subscribeEvents({
+    inventory: ({ items }) => setInventory(prev => prev.map(item => {
+      const changed = items.find(i => i.id === item.id);
+      return changed ? { ...item, quantity: changed.quantity } : item;
+    })),
+  }), []);
+
   const handleUpdate = async (id, currentQty) => {
     if (role !== 'admin') return alert("Только админ может менять остатки");
     const val = prompt("Новое количество:", currentQty);
     if (val !== null) {
       await adminApi.updateInventory(id, parseFloat(val));
-      fetchInventory(); // Обновляем данные без перезагрузки всей страницы
+      fetchInventory(); // Обновляем данные без перезагрузки всей страницы, даже если поток событий оборвался
     }
   };
 
@@ -435,7 +507,7 @@ function AdminInventoryView({ role }) {
   );
 }
 
-function AdminRequestsView({ user }) {
+function AdminRequestsView() {
   const [requests, setRequests] = useState([]);
   
   // ИСПРАВЛЕНО: добавлен [] массив зависимостей
@@ -443,18 +515,36 @@ function AdminRequestsView({ user }) {
     adminApi.getRequests('pending').then(res => setRequests(res.data));
   }, []);
 
+  useEffect(() => subscribeEvents({
+    purchase_request: (req) => {
+      if (req.status !== 'pending') setRequests(prev => prev.filter(r => r.id !== req.id));
+    },
+  }), []);
+
   const handleApprove = async (id) => {
     try {
-      await adminApi.approveRequest(id, user.id);
+      await adminApi.approveRequest(id);
       alert("Одобрено");
       setRequests(requests.filter(r => r.id !== id));
     } catch (err) { alert("Ошибка при одобрении"); }
   };
 
+  // Одобряет все заявки одним запросом; количество сразу приходуется на склад
+  const handleApproveAll = async () => {
+    try {
+      const res = await adminApi.approveRequests(requests.map(r => r.id));
+      const failed = res.data.filter(r => !r.success);
+      if (failed.length) alert(failed.map(r => `#${r.id}: ${r.detail}`).join('\n'));
+      const approved = new Set(res.data.filter(r => r.success).map(r => r.id));
+      setRequests(prev => prev.filter(r => !approved.has(r.id)));
+    } catch (err) { alert("Ошибка при одобрении"); }
+  };
+
   return (
     <div className="orders-list">
       <h3>Заявки на закупку</h3>
       {requests.length === 0 && <p style={{textAlign: 'center', color: '#666'}}>Нет активных заявок</p>}
+      {requests.length > 1 && <button onClick={handleApproveAll} className="btn btn-primary">Одобрить все</button>}
       {requests.map(req => (
         <div key={req.id} className="order-card">
           <div><b>{req.product_name}</b>: {req.requested_quantity} {req.unit}</div>
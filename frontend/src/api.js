@@ -6,12 +6,44 @@ const api = axios.create({
     baseURL: API_URL,
 });
 
+// Школа для развёртывания на несколько школ (TENANT_DATABASE_URL на сервере);
+// после входа школа берётся сервером из токена
+const SCHOOL = import.meta.env.VITE_SCHOOL;
+
 api.interceptors.request.use((config) => {
     const token = localStorage.getItem('access_token');
     if (token) config.headers.Authorization = `Bearer ${token}`;
+    if (SCHOOL) config.headers['X-School'] = SCHOOL;
     return config;
 });
 
+// Один ключ на действие пользователя: при сетевой ошибке запрос повторяется с тем же
+// Idempotency-Key, и сервер вернёт первый ответ вместо второго списания
+const postOnce = async (url, data, retries = 2) => {
+    const headers = { 'Idempotency-Key': crypto.randomUUID() };
+    for (let attempt = 0; ; attempt++) {
+        try {
+            return await api.post(url, data, { headers });
+        } catch (err) {
+            if (err.response || attempt >= retries) throw err;
+        }
+    }
+};
+
+// Списки отдаются страницами от новых к старым; следующая страница — по курсору
+// из заголовка X-Next-Cursor. Для списков, которые нужны целиком (склад, заявки)
+const getAll = async (url) => {
+    const items = [];
+    let cursor = null;
+    do {
+        const sep = url.includes('?') ? '&' : '?';
+        const res = await api.get(cursor ? `${url}${sep}cursor=${cursor}` : url);
+        items.push(...res.data);
+        cursor = res.headers['x-next-cursor'];
+    } while (cursor);
+    return { data: items };
+};
+
 export const authApi = {
     login: (username, password) => {
         const formData = new URLSearchParams();
@@ -25,12 +57,14 @@ export const authApi = {
 
 export const menuApi = {
     getMenu: (meal_type) => api.get(`/menu/?meal_type=${meal_type || ''}`),
+    getSafeMenu: (meal_type) => api.get(`/menu/safe?meal_type=${meal_type || ''}`),
     addMenuItem: (data) => api.post('/menu/', data),
+    addMenuBatch: (items) => api.post('/menu/batch', items),
 };
 
 export const orderApi = {
     placeOrder: (menu_item_id) => 
-        api.post('/orders/', { 
+        postOnce('/orders/', { 
             menu_item_id, 
             payment_type: 'balance', 
             order_date: new Date().toISOString().split('T')[0] 
@@ -39,18 +73,40 @@ export const orderApi = {
     receiveOrder: (orderId) => api.patch(`/orders/${orderId}/receive`),
 };
 
+// Режим раздачи: заказы приёма пищи держатся на сервере в памяти, скан не ходит в базу
+export const servingApi = {
+    open: (mealType) => api.post(`/serving/open?meal_type=${mealType}`),
+    findStudent: (mealType, username) => api.get(`/serving/students/${encodeURIComponent(username)}?meal_type=${mealType}`),
+    serve: (mealType, orderIds) => api.post(`/serving/serve?meal_type=${mealType}`, orderIds),
+};
+
 export const reviewApi = {
-    createReview: (userId, data) => api.post(`/reviews/?user_id=${userId}`, data),
+    createReview: (userId, data) => postOnce(`/reviews/?user_id=${userId}`, data),
     getAllReviews: () => api.get('/reviews/all'),
 };
 
 export const adminApi = {
-    getInventory: () => api.get('/admin/inventory'),
+    getInventory: () => getAll('/admin/inventory?limit=500'),
     updateInventory: (itemId, quantity) => api.put(`/admin/inventory/${itemId}?quantity=${quantity}`),
-    getRequests: (status) => api.get(`/admin/purchase-requests${status ? `?status=${status}` : ''}`),
-    approveRequest: (reqId, adminId) => api.patch(`/admin/purchase-requests/${reqId}/approve?admin_id=${adminId}`),
+    getRequests: (status) => getAll(`/admin/purchase-requests${status ? `?status=${status}` : ''}`),
+    approveRequest: (reqId) => api.patch(`/admin/purchase-requests/${reqId}/approve`),
+    approveRequests: (reqIds) => api.post('/admin/purchase-requests/approve', reqIds),
+    getForecast: (dateFrom, dateTo) => api.get(`/admin/forecast?date_from=${dateFrom}&date_to=${dateTo}`),
+    generateRequests: (dateFrom, dateTo) => api.post(`/admin/purchase-requests/generate?date_from=${dateFrom}&date_to=${dateTo}`),
+    updateInventoryBatch: (changes) => api.patch('/admin/inventory', changes),
     getDailyReport: (date) => api.get(`/admin/stats/daily-report?day=${date}`),
-    getAttendance: () => api.get('/admin/stats/attendance'),
+    getAttendance: (day, mealType) => api.get(`/admin/stats/attendance?day=${day}&meal_type=${mealType}`),
+};
+
+// Server-Sent Events: заказы, склад, заявки и счётчики посещаемости приходят сами,
+// без повторной загрузки списков. handlers: { order: fn, inventory: fn, ... }
+export const subscribeEvents = (handlers) => {
+    const token = localStorage.getItem('access_token');
+    const source = new EventSource(`${API_URL}/events/?token=${encodeURIComponent(token)}`);
+    Object.entries(handlers).forEach(([event, handler]) =>
+        source.addEventListener(event, (e) => handler(JSON.parse(e.data)))
+    );
+    return () => source.close();
 };
 
 export default api;
\ No newline at end of file
@@ -0,0 +1,71 @@
+import os
+import tempfile
+
+# Тесты не должны трогать backend/canteen.db: всё, что не подменено фикстурами,
+# уходит во временную базу. Задаётся до первого импорта backend
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'canteen-tests.db')}")
+os.environ.setdefault("AUTO_MIGRATE", "0")
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from backend import database
+from backend.forecast import demand_cache
+from backend.idempotency import idempotency_store
+from backend.main import app
+from backend.routers.auth import token_cache, user_cache
+from backend.routers.menu import menu_cache
+from backend.seed import generate
+
+CACHES = (token_cache, user_cache, menu_cache, idempotency_store.cache, demand_cache)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'canteen.db'}")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(engine):
+    # Небольшая синтетическая база: admin, cook, student и student1..student8,
+    # меню на сегодня, склад по 1 000 000 каждого продукта
+    generate(engine, students=8, days=1)
+    async_engine = database.make_async_engine(database.to_async_url(engine.url.render_as_string(hide_password=False)))
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    AsyncSession = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    # Все сессии приложения — к базе теста; кэши процесса не должны отдавать
+    # пользователей и меню из базы предыдущего теста
+    app.dependency_overrides[database.get_db] = get_db
+    app.dependency_overrides[database.get_read_db] = get_db
+    app.dependency_overrides[database.get_async_db] = get_async_db
+    for cache in CACHES:
+        cache.clear()
+    try:
+        with TestClient(app) as client:
+            yield client
+            client.portal.call(async_engine.dispose)
+    finally:
+        app.dependency_overrides.clear()
+        for cache in CACHES:
+            cache.clear()
+
+
+def login(client, username, password="password123"):
+    response = client.post("/auth/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,26 @@
+from sqlalchemy import insert, select
+from backend import models
+from conftest import login
+
+
+def test_only_admin_approves_purchase_requests(engine, client):
+    with engine.begin() as conn:
+        request_id = conn.scalar(
+            insert(models.PurchaseRequest)
+            .values(product_name="Продукт 1", requested_quantity=5.0, unit="кг", requested_by=2, status="pending")
+            .returning(models.PurchaseRequest.id)
+        )
+    url = f"/admin/purchase-requests/{request_id}/approve"
+
+    # Раньше одобряющего брали из admin_id в строке запроса, без всякой проверки
+    assert client.patch(f"{url}?admin_id=1").status_code == 401
+    assert client.patch(url, headers=login(client, "cook")).status_code == 403
+    assert client.patch(url, headers=login(client, "admin")).status_code == 200
+
+    with engine.connect() as conn:
+        request = conn.execute(
+            select(models.PurchaseRequest.status, models.PurchaseRequest.approved_by)
+            .where(models.PurchaseRequest.id == request_id)
+        ).one()
+    assert request.status == "approved"
+    assert request.approved_by == 1
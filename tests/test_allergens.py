@@ -0,0 +1,38 @@
+from datetime import date
+import pytest
+from sqlalchemy import insert, update
+from backend import models
+from backend.allergens import dish_allergens, user_allergens
+from conftest import login
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Блины с мёдом", {"мед"}),
+    ("Пирог медовый", {"мед"}),
+    ("Чай с медом", {"мед"}),
+    ("Ешьте медленно", set()),
+    ("Стейк медиум", set()),
+    ("Салат без орехов", set()),
+    ("Каша на молоке, без мёда", {"молоко"}),
+])
+def test_dish_allergens(text, expected):
+    assert dish_allergens(text) == expected
+
+
+def test_user_allergens_ignore_negation():
+    # В предпочтениях "без орехов" — просьба убрать орехи, а не отсутствие аллергии
+    assert user_allergens("без орехов, пожалуйста") == {"орехи"}
+
+
+def test_order_blocked_by_preference_with_negation(engine, client):
+    with engine.begin() as conn:
+        conn.execute(update(models.User).where(models.User.username == "student1").values(food_preferences="без орехов, пожалуйста"))
+        item_id = conn.scalar(insert(models.MenuItem).values(
+            name="Салат с орехами", description="Салат из свёклы с грецкими орехами", price=50.0,
+            meal_type="lunch", date=date.today(), is_available=True, allergens=["орехи"],
+        ).returning(models.MenuItem.id))
+    response = client.post(
+        "/orders/", json={"menu_item_id": item_id, "payment_type": "balance", "order_date": date.today().isoformat()},
+        headers=login(client, "student1"),
+    )
+    assert response.status_code == 400
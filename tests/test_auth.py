@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from pydantic import ValidationError
+from backend import database
+from backend.password_pool import PasswordPool
+from backend.routers import auth
+from conftest import login
+
+# Больше, чем потоков в пуле FastAPI (40 по умолчанию)
+LOGINS = 48
+
+
+def test_login_burst_does_not_starve_sync_endpoints(client, monkeypatch):
+    headers = login(client, "student")
+    # Маленький пул bcrypt, чтобы входы заведомо стояли в очереди дольше, чем идёт проверка
+    monkeypatch.setattr(auth, "password_pool", PasswordPool(workers=1, queue_size=LOGINS))
+
+    def burst(n):
+        return client.post("/auth/login", data={"username": f"student{n % 8 + 1}", "password": "password123"}).status_code
+
+    with ThreadPoolExecutor(max_workers=LOGINS) as pool:
+        statuses = pool.map(burst, range(LOGINS))
+        time.sleep(0.5)
+        started = time.perf_counter()
+        me = client.get("/auth/me", headers=headers)
+        elapsed = time.perf_counter() - started
+        statuses = list(statuses)
+
+    assert me.status_code == 200
+    assert elapsed < 1.0
+    assert statuses == [200] * LOGINS
+
+
+def test_cached_user_is_an_immutable_snapshot(client):
+    headers = login(client, "student1")
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    user = auth.user_cache.get(database.tenant_key("student1"))
+    with pytest.raises(ValidationError):
+        user.balance = 0
+
+
+def test_user_read_before_invalidation_is_not_cached(client, monkeypatch):
+    headers = login(client, "student1")
+    snapshot_user = auth.snapshot_user
+
+    def invalidated_while_reading(db_user):
+        # Запись в users закоммитилась, пока этот запрос читал строку
+        auth.invalidate_user(db_user.username)
+        return snapshot_user(db_user)
+
+    monkeypatch.setattr(auth, "snapshot_user", invalidated_while_reading)
+    assert client.get("/auth/me", headers=headers).status_code == 200
+    assert auth.user_cache.get(database.tenant_key("student1")) is None
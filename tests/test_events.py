@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+from backend.events import EventBroker, STAFF_TOPICS
+
+IDLE_SUBSCRIBERS = 1000
+STAFF_SUBSCRIBERS = 4
+EVENTS = 500
+
+
+def test_staff_get_every_event_and_idle_subscribers_are_released():
+    # Тысяча простаивающих учеников не мешает персоналу получить все события,
+    # а после отключения от брокера не остаётся ни одного подписчика
+    broker = EventBroker()
+
+    async def consume(topics, received=None):
+        async for chunk in broker.stream(topics):
+            if received is not None and chunk.startswith("event:"):
+                received.append(chunk)
+
+    def publish():
+        # Из потока, как в синхронных обработчиках, порциями меньше очереди подписчика:
+        # кто не успел разобрать EVENT_QUEUE_SIZE событий, тот и правда отстал
+        for n in range(EVENTS):
+            broker.publish(("user:0",) + STAFF_TOPICS, "order", {"id": n})
+            if n % 50 == 49:
+                time.sleep(0.02)
+
+    async def run():
+        idle = [asyncio.create_task(consume([f"user:{n}"])) for n in range(1, IDLE_SUBSCRIBERS + 1)]
+        received = [[] for _ in range(STAFF_SUBSCRIBERS)]
+        staff = [asyncio.create_task(consume(["role:cook"], received[n])) for n in range(STAFF_SUBSCRIBERS)]
+        while broker.stats()["subscribers"] < IDLE_SUBSCRIBERS + STAFF_SUBSCRIBERS:
+            await asyncio.sleep(0.01)
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        await asyncio.to_thread(publisher.join)
+        for _ in range(500):
+            if sum(map(len, received)) == EVENTS * STAFF_SUBSCRIBERS:
+                break
+            await asyncio.sleep(0.01)
+        for task in idle + staff:
+            task.cancel()
+        await asyncio.gather(*idle, *staff, return_exceptions=True)
+        return received
+
+    received = asyncio.run(run())
+    assert [len(events) for events in received] == [EVENTS] * STAFF_SUBSCRIBERS
+    assert broker.dropped == 0
+    assert broker.stats()["subscribers"] == 0
@@ -0,0 +1,40 @@
+import tracemalloc
+from datetime import date
+from sqlalchemy import insert
+from backend import database, models
+from backend.migrate import upgrade
+from backend.routers.exports import export_rows, orders_query
+
+# Выгрузка держит в памяти порцию EXPORT_CHUNK_SIZE строк, а не всю таблицу:
+# для 20 000 заказов целиком это было бы больше 10 МБ
+EXPORT_PEAK_LIMIT_KB = 4096
+
+
+def export_peak_kb(tmp_path, rows):
+    # Пик памяти, выделенной за время самой выгрузки, без заполнения базы
+    engine = database.make_engine(f"sqlite:///{tmp_path / f'export-{rows}.db'}")
+    try:
+        upgrade(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(models.User), [{"username": "student", "password_hash": "-", "role": "student", "balance": 0}])
+            conn.execute(insert(models.MenuItem), [{"name": "Пицца", "price": 70.0, "meal_type": "lunch", "date": date.today()}])
+            conn.execute(insert(models.Order), [
+                {"user_id": 1, "menu_item_id": 1, "order_date": date.today(), "payment_type": "balance", "is_paid": True, "is_received": True}
+            ] * rows)
+        tracemalloc.start()
+        try:
+            exported = sum(chunk.count("\n") for chunk in export_rows(orders_query().order_by("id"), "csv", bind=engine))
+            peak = tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+        assert exported == rows + 1  # строка заголовка
+        return peak
+    finally:
+        engine.dispose()
+
+
+def test_export_memory_does_not_grow_with_table(tmp_path):
+    small = export_peak_kb(tmp_path, 2000)
+    large = export_peak_kb(tmp_path, 20000)
+    assert large < EXPORT_PEAK_LIMIT_KB
+    assert large < small * 1.5 + 256
@@ -0,0 +1,23 @@
+from datetime import date
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from backend import models, forecast
+
+
+def test_pending_requests_count_only_in_the_same_unit(engine, client, monkeypatch):
+    monkeypatch.setattr(forecast, "forecast", lambda db, date_from, date_to: [
+        {"product_name": "Молоко", "unit": "л", "shortfall": 10.0},
+    ])
+    with engine.begin() as conn:
+        conn.execute(insert(models.PurchaseRequest), [
+            {"product_name": "Молоко", "requested_quantity": 4.0, "unit": "л", "requested_by": 2, "status": "pending"},
+            # Такую заявку approve_requests на склад не оприходует, нехватку она не покрывает
+            {"product_name": "Молоко", "requested_quantity": 50.0, "unit": "шт", "requested_by": 2, "status": "pending"},
+        ])
+
+    with Session(engine) as db:
+        created = forecast.generate_requests(db, date.today(), date.today(), user_id=1)
+
+    assert [(request.product_name, request.unit, request.requested_quantity) for request in created] == [
+        ("Молоко", "л", 6.0),
+    ]
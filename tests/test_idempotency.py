@@ -0,0 +1,79 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend import models
+from backend.idempotency import idempotency_store, make_key
+from conftest import login
+
+DUPLICATES = 8
+ROUNDS = 3
+
+
+def test_only_the_key_constraint_is_a_duplicate(engine, client):
+    key = make_key("duplicate", "tests", {})
+    row = {"key": key.value, "fingerprint": key.fingerprint, "status_code": 200, "response": {}}
+    with engine.begin() as conn:
+        conn.execute(insert(models.IdempotencyKey).values(**row))
+    with engine.connect() as conn:
+        with pytest.raises(IntegrityError) as duplicate:
+            conn.execute(insert(models.IdempotencyKey).values(**row))
+        conn.rollback()
+        # Имя таблицы есть и в тексте этой ошибки, но ключ тут ни при чём
+        with pytest.raises(IntegrityError) as other:
+            conn.execute(insert(models.IdempotencyKey).values(**{**row, "key": "other", "fingerprint": None}))
+    assert idempotency_store.is_duplicate(key, duplicate.value)
+    assert not idempotency_store.is_duplicate(key, other.value)
+
+
+def test_duplicate_without_recorded_response_is_a_conflict(engine, client):
+    # Ключ занят, а ответ первого запроса ещё не виден — 409, а не пустой ответ и 500
+    with Session(bind=engine) as db, pytest.raises(HTTPException) as error:
+        idempotency_store.replay_duplicate(db, make_key("in-flight", "tests", {}))
+    assert error.value.status_code == 409
+
+
+def test_retry_storm_charges_once_per_key(engine, client):
+    # Одинаковые запросы с одним Idempotency-Key уходят одновременно; вторая волна —
+    # после сброса кэша, как если бы повторы попали в другой процесс и ответ нашёлся
+    # только в таблице. Деньги списываются один раз на ключ, все ответы совпадают
+    student = login(client, "student1")
+    with engine.begin() as conn:
+        conn.execute(update(models.User).where(models.User.username == "student1").values(food_preferences=None))
+        item = conn.execute(
+            select(models.MenuItem.id, models.MenuItem.price).where(models.MenuItem.date == date.today()).order_by(models.MenuItem.id)
+        ).first()
+    balance_before = client.get("/auth/me", headers=student).json()["balance"]
+    payload = {"menu_item_id": item.id, "payment_type": "balance", "order_date": date.today().isoformat()}
+
+    def storm(key):
+        barrier = threading.Barrier(DUPLICATES)
+
+        def fire(_):
+            barrier.wait()
+            response = client.post("/orders/", json=payload, headers={**student, "Idempotency-Key": key})
+            return response.status_code, response.json()
+
+        with ThreadPoolExecutor(max_workers=DUPLICATES) as pool:
+            return list(pool.map(fire, range(DUPLICATES)))
+
+    order_ids = set()
+    for _ in range(ROUNDS):
+        key = str(uuid.uuid4())
+        results = storm(key)
+        idempotency_store.cache.clear()
+        results += storm(key)
+        assert all(result == results[0] for result in results)
+        assert results[0][0] == 200
+        order_ids.add(results[0][1]["id"])
+
+    balance_after = client.get("/auth/me", headers=student).json()["balance"]
+    assert len(order_ids) == ROUNDS
+    assert round(balance_before - balance_after, 2) == round(item.price * ROUNDS, 2)
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(models.Order).where(models.Order.id.in_(order_ids))) == ROUNDS
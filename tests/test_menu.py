@@ -0,0 +1,25 @@
+from datetime import date
+from backend.routers import menu
+from backend.routers.menu import menu_cache
+
+
+def test_if_none_match_list_weak_and_star(client):
+    url = f"/menu/?day={date.today()}&meal_type=lunch"
+    etag = client.get(url).headers["ETag"]
+    for header in (etag, f'"other", {etag}', f"W/{etag}", "*"):
+        assert client.get(url, headers={"If-None-Match": header}).status_code == 304, header
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_stale_load_is_not_cached_after_invalidation(client, monkeypatch):
+    load_menu = menu.load_menu
+
+    async def load_then_invalidate(*args):
+        # Меню меняется, пока выборка ещё идёт
+        loaded = await load_menu(*args)
+        menu.invalidate_menu()
+        return loaded
+
+    monkeypatch.setattr(menu, "load_menu", load_then_invalidate)
+    assert client.get(f"/menu/?day={date.today()}&meal_type=lunch").status_code == 200
+    assert menu_cache.get((date.today(), "lunch")) is None
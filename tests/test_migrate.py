@@ -0,0 +1,53 @@
+from datetime import date
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from backend import models, stats
+from backend.migrate import upgrade
+from conftest import login
+
+
+def test_upgrade_fills_new_rollups(engine, client):
+    # База с историей, заведённая до появления сводных таблиц
+    models.DailyStats.__table__.drop(engine)
+    models.RatingStats.__table__.drop(engine)
+    upgrade(engine)
+
+    with Session(bind=engine) as db:
+        assert db.scalar(select(models.DailyStats.day).limit(1)) is not None
+        assert stats.check(db) == []
+
+
+def test_attendance_reads_one_meal(engine, client):
+    today = date.today()
+    with engine.connect() as conn:
+        row = conn.execute(select(models.DailyStats).where(models.DailyStats.day == today, models.DailyStats.meal_type == "lunch")).one()
+    response = client.get(f"/admin/stats/attendance?day={today}&meal_type=lunch", headers=login(client, "admin"))
+    assert response.status_code == 200
+    assert response.json()["waiting_count"] == row.waiting_count
+    assert response.json()["fed_count"] == row.received_count
+
+
+def test_upgrade_keeps_new_ids_above_archive(engine, monkeypatch):
+    from datetime import timedelta
+    from sqlalchemy import func, insert, text
+    from backend import archive
+    from backend.seed import generate
+
+    # База, созданная до sqlite_autoincrement: все заказы уехали в архив, горячая таблица пуста
+    for model in (models.Order, models.Review):
+        monkeypatch.setitem(model.__table__.dialect_options["sqlite"], "autoincrement", False)
+    generate(engine, students=8, days=2)
+    monkeypatch.undo()
+    with Session(bind=engine) as db:
+        archive.archive_table(db, "orders", date.today() + timedelta(days=1))
+        archived = db.scalar(select(func.max(models.OrderArchive.id)))
+        assert db.scalar(select(func.count()).select_from(models.Order)) == 0
+
+    upgrade(engine)
+
+    with engine.begin() as conn:
+        assert "AUTOINCREMENT" in conn.scalar(text("SELECT sql FROM sqlite_master WHERE name = 'orders'"))
+        new_id = conn.scalar(insert(models.Order).values(
+            user_id=4, menu_item_id=1, order_date=date.today(), payment_type="balance", is_paid=True, is_received=False,
+        ).returning(models.Order.id))
+    assert new_id > archived
@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+from datetime import date
+from sqlalchemy import func, select, update
+from backend import models
+from conftest import login
+
+STUDENTS = ["student1", "student2", "student3", "student4"]
+PORTIONS_IN_STOCK = 50
+ORDERS_PER_STUDENT = 20
+
+
+def prepare(engine):
+    # Одно блюдо, склада которого хватает на PORTIONS_IN_STOCK порций (полпорции запаса
+    # на погрешность float), и ученики с деньгами на ORDERS_PER_STUDENT заказов каждый —
+    # в сумме больше, чем порций
+    with engine.begin() as conn:
+        item = conn.execute(
+            select(models.MenuItem.id, models.MenuItem.price)
+            .where(models.MenuItem.date == date.today())
+            .order_by(models.MenuItem.id)
+        ).first()
+        recipes = conn.execute(
+            select(models.Recipe.inventory_id, models.Recipe.quantity_required).where(models.Recipe.menu_item_id == item.id)
+        ).all()
+        for recipe in recipes:
+            conn.execute(
+                update(models.Inventory).where(models.Inventory.id == recipe.inventory_id)
+                .values(quantity=recipe.quantity_required * (PORTIONS_IN_STOCK + 0.5))
+            )
+        conn.execute(
+            update(models.User).where(models.User.username.in_(STUDENTS))
+            .values(balance=item.price * ORDERS_PER_STUDENT, food_preferences=None)
+        )
+    return item, [recipe.inventory_id for recipe in recipes]
+
+
+def count_orders(engine, item_id):
+    with engine.connect() as conn:
+        return conn.scalar(select(func.count()).select_from(models.Order).where(models.Order.menu_item_id == item_id))
+
+
+def test_parallel_orders_never_oversell(engine, client):
+    item, inventory_ids = prepare(engine)
+    orders_before = count_orders(engine, item.id)
+    headers = {username: login(client, username) for username in STUDENTS}
+    payload = {"menu_item_id": item.id, "payment_type": "balance", "order_date": date.today().isoformat()}
+
+    def order(n):
+        return client.post("/orders/", json=payload, headers=headers[STUDENTS[n % len(STUDENTS)]]).status_code
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        statuses = list(pool.map(order, range(300)))
+
+    succeeded = statuses.count(200)
+    assert set(statuses) <= {200, 400, 402}
+    assert succeeded == PORTIONS_IN_STOCK
+    assert count_orders(engine, item.id) - orders_before == succeeded
+
+    with engine.connect() as conn:
+        stock = conn.scalars(select(models.Inventory.quantity).where(models.Inventory.id.in_(inventory_ids))).all()
+        balances = conn.scalars(select(models.User.balance).where(models.User.username.in_(STUDENTS))).all()
+    assert all(quantity >= -1e-9 for quantity in stock)
+    assert all(balance >= 0 for balance in balances)
+    debited = item.price * ORDERS_PER_STUDENT * len(STUDENTS) - sum(balances)
+    assert round(debited / item.price) == succeeded
+
+
+def test_batched_writes_survive_more_requests_than_pool(engine, client, monkeypatch):
+    # Больше одновременных заказов, чем соединений в пуле (20 + 20) и потоков FastAPI:
+    # писателю всё равно должно найтись соединение
+    from backend.write_queue import write_queue
+
+    item, _ = prepare(engine)
+    headers = {username: login(client, username) for username in STUDENTS}
+    payload = {"menu_item_id": item.id, "payment_type": "balance", "order_date": date.today().isoformat()}
+    monkeypatch.setattr(write_queue, "enabled", True)
+
+    def order(n):
+        return client.post("/orders/", json=payload, headers=headers[STUDENTS[n % len(STUDENTS)]]).status_code
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=100) as pool:
+            statuses = list(pool.map(order, range(100)))
+    finally:
+        write_queue.release(engine)
+
+    assert time.perf_counter() - started < 20
+    assert statuses.count(200) == PORTIONS_IN_STOCK
+    assert set(statuses) <= {200, 400, 402}
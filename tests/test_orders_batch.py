@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from sqlalchemy import delete, select, update
+from backend import models, schemas
+from conftest import login
+
+STUDENTS = [f"student{n}" for n in range(1, 9)]
+
+
+def today_item(engine):
+    with engine.begin() as conn:
+        item_id = conn.scalar(select(models.MenuItem.id).where(models.MenuItem.date == date.today()).order_by(models.MenuItem.id))
+        conn.execute(update(models.User).values(food_preferences=None))
+        inventory_ids = conn.scalars(select(models.Recipe.inventory_id).where(models.Recipe.menu_item_id == item_id)).all()
+    return item_id, inventory_ids
+
+
+def basket(item_id, size):
+    return [{"menu_item_id": item_id, "payment_type": "balance", "order_date": date.today().isoformat()}] * size
+
+
+def test_basket_size_is_limited(engine, client):
+    item_id, _ = today_item(engine)
+    headers = login(client, "student1")
+    response = client.post("/orders/batch", json=basket(item_id, schemas.MAX_ORDER_BATCH + 1), headers=headers)
+    assert response.status_code == 422
+
+
+def test_missing_inventory_row_is_a_shortage(engine, client):
+    item_id, inventory_ids = today_item(engine)
+    with engine.begin() as conn:
+        conn.execute(delete(models.Inventory).where(models.Inventory.id == inventory_ids[0]))
+    headers = login(client, "student1")
+    response = client.post("/orders/batch", json=basket(item_id, 2), headers=headers)
+    assert response.status_code == 200
+    assert [result["success"] for result in response.json()] == [False, False]
+
+
+def test_concurrent_shortage_is_reported_per_item(engine, client):
+    # Склада хватает на 5 порций, а восемь учеников одновременно заказывают по две:
+    # каждая корзина получает 200, и ровно 5 блюд оформлены
+    item_id, inventory_ids = today_item(engine)
+    with engine.begin() as conn:
+        for recipe in conn.execute(
+            select(models.Recipe.inventory_id, models.Recipe.quantity_required).where(models.Recipe.menu_item_id == item_id)
+        ).all():
+            conn.execute(
+                update(models.Inventory).where(models.Inventory.id == recipe.inventory_id)
+                .values(quantity=recipe.quantity_required * 5.5)
+            )
+    headers = {username: login(client, username) for username in STUDENTS}
+
+    def order(username):
+        return client.post("/orders/batch", json=basket(item_id, 2), headers=headers[username])
+
+    with ThreadPoolExecutor(max_workers=len(STUDENTS)) as pool:
+        responses = list(pool.map(order, STUDENTS))
+
+    assert [response.status_code for response in responses] == [200] * len(STUDENTS)
+    results = [result for response in responses for result in response.json()]
+    assert sum(result["success"] for result in results) == 5
+    assert all(result["detail"] for result in results if not result["success"])
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+from sqlalchemy import insert, select
+from sqlalchemy.orm import sessionmaker
+from backend import archive, models
+
+
+def all_pages(client, url):
+    ids, cursor = [], None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        ids.append([row["id"] for row in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+def test_orders_page_newest_first_across_archive(engine, client):
+    # 150 заказов за 300 дней, старшая часть — в архиве: первая страница начинается
+    # с самого нового заказа, а курсор проходит всю историю без пропусков и повторов
+    today = date.today()
+    with engine.begin() as conn:
+        user_id = conn.scalar(select(models.User.id).where(models.User.username == "student1"))
+        item_id = conn.scalar(select(models.MenuItem.id))
+        conn.execute(insert(models.Order), [
+            {"user_id": user_id, "menu_item_id": item_id, "order_date": today - timedelta(days=300 - 2 * n),
+             "payment_type": "balance", "is_paid": True, "is_received": True}
+            for n in range(150)
+        ])
+        expected = conn.scalars(select(models.Order.id).where(models.Order.user_id == user_id)).all()
+    db = sessionmaker(bind=engine)()
+    assert archive.run(db, today - timedelta(days=100))["orders"] > 0
+    db.close()
+    archive.state_cache.clear()
+
+    pages = all_pages(client, f"/orders/my?user_id={user_id}&limit=40")
+    ids = [order_id for page in pages for order_id in page]
+    assert ids[0] == max(expected)
+    assert ids == sorted(expected, reverse=True)
+    assert all(len(page) == 40 for page in pages[:-1])
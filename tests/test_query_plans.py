@@ -0,0 +1,7 @@
+from benchmarks import query_plans
+
+
+def test_no_full_scans():
+    checked, failures = query_plans.check()
+    assert checked > 0
+    assert failures == [], "\n".join(statement for statement, _ in failures)
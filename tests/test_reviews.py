@@ -0,0 +1,28 @@
+from datetime import date
+from sqlalchemy import select
+from backend import database, models
+from backend.routers.menu import menu_cache
+
+
+def test_review_refreshes_only_its_menu(engine, client):
+    today = date.today()
+    with engine.connect() as conn:
+        order = conn.execute(
+            select(models.Order.id, models.Order.user_id, models.Order.menu_item_id, models.MenuItem.meal_type)
+            .join(models.MenuItem, models.MenuItem.id == models.Order.menu_item_id)
+            .where(models.Order.order_date == today)
+            .order_by(models.Order.id)
+        ).first()
+    other_meal = "breakfast" if order.meal_type == "lunch" else "lunch"
+    assert client.patch(f"/orders/{order.id}/receive").status_code == 200
+    client.get(f"/menu/?day={today}&meal_type={order.meal_type}")
+    client.get(f"/menu/?day={today}&meal_type={other_meal}")
+
+    response = client.post(f"/reviews/?user_id={order.user_id}", json={"menu_item_id": order.menu_item_id, "rating": 5})
+    assert response.status_code == 200
+
+    assert menu_cache.get(database.tenant_key((today, other_meal))) is not None
+    assert menu_cache.get(database.tenant_key((today, order.meal_type))) is None
+    menu = client.get(f"/menu/?day={today}&meal_type={order.meal_type}").json()
+    reviewed = next(item for item in menu if item["id"] == order.menu_item_id)
+    assert reviewed["rating_count"] >= 1
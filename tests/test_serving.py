@@ -0,0 +1,69 @@
+from datetime import date
+from sqlalchemy import select
+from backend import models, settings, stats
+from conftest import login
+
+
+def test_serve_survives_failed_flush(engine, client, monkeypatch):
+    with engine.connect() as conn:
+        order = conn.execute(
+            select(models.Order.id, models.MenuItem.meal_type)
+            .join(models.MenuItem, models.MenuItem.id == models.Order.menu_item_id)
+            .where(models.Order.order_date == date.today(), models.Order.is_received == False)
+            .order_by(models.Order.id)
+        ).first()
+    cook = login(client, "cook")
+    params = {"meal_type": order.meal_type}
+    assert client.post("/serving/open", params=params, headers=cook).status_code == 200
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("база недоступна")
+
+    monkeypatch.setattr(settings, "SERVING_FLUSH_SIZE", 1)
+    monkeypatch.setattr(stats, "record_received", broken)
+    response = client.post("/serving/serve", params=params, json=[order.id], headers=cook)
+    assert response.status_code == 200
+    assert response.json()[0]["success"]
+    assert client.get("/serving/", params=params, headers=cook).json()["unflushed"] == 1
+
+    # Отметка не потерялась: второй раз не выдаётся и дописывается, когда база снова доступна
+    again = client.post("/serving/serve", params=params, json=[order.id], headers=cook).json()[0]
+    assert not again["success"]
+    monkeypatch.undo()
+    assert client.delete("/serving/", params=params, headers=cook).json()["unflushed"] == 0
+    with engine.connect() as conn:
+        assert conn.scalar(select(models.Order.is_received).where(models.Order.id == order.id))
+
+
+def test_flush_publishes_only_updated_orders(engine, client, monkeypatch):
+    from datetime import timedelta
+    from sqlalchemy import update
+    from backend import events
+    from backend.serving import lines
+
+    with engine.connect() as conn:
+        orders = conn.execute(
+            select(models.Order.id, models.MenuItem.meal_type)
+            .join(models.MenuItem, models.MenuItem.id == models.Order.menu_item_id)
+            .where(models.Order.order_date == date.today(), models.Order.is_received == False, models.MenuItem.meal_type == "lunch")
+            .order_by(models.Order.id)
+            .limit(2)
+        ).all()
+    cook = login(client, "cook")
+    # Чтение не заводит раздачу
+    assert client.get("/serving/", params={"meal_type": "lunch"}, headers=cook).status_code == 404
+    assert client.post("/serving/open", params={"meal_type": "lunch"}, headers=cook).status_code == 200
+    line = lines.find(engine, date.today(), "lunch")
+
+    # Первый заказ выдал другой процесс, раздача об этом ещё не знает
+    with engine.begin() as conn:
+        conn.execute(update(models.Order).where(models.Order.id == orders[0].id).values(is_received=True))
+    published = []
+    monkeypatch.setattr(events, "order_changed", lambda order, price=None: published.append(order.id))
+    line.serve([order.id for order in orders])
+    assert line.flush() == 1
+    assert published == [orders[1].id]
+
+    # Раздачи прошедших дней забываются
+    lines.evict_past(today=date.today() + timedelta(days=1))
+    assert lines.find(engine, date.today(), "lunch") is None
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from backend.database import TenantRegistry
+
+
+def registry(tmp_path, schools, max_engines=32):
+    for school in schools:
+        (tmp_path / f"{school}.db").touch()
+    return TenantRegistry(f"sqlite:///{tmp_path}/{{tenant}}.db", max_engines, 600)
+
+
+def test_reopened_school_is_not_migrated_again(tmp_path):
+    tenants = registry(tmp_path, ["school1", "school2"], max_engines=1)
+    created, closed = [], []
+    tenants.on_create(created.append)
+    tenants.on_close(closed.append)
+    for _ in range(10):
+        tenants.get("school1")
+        tenants.get("school2")
+    assert tenants.stats()["opened"] == 20
+    assert len(closed) == 19
+    assert len(created) == 2
+    tenants.close_all()
+
+
+def test_slow_migration_does_not_block_other_schools(tmp_path):
+    tenants = registry(tmp_path, ["slow", "fast"])
+    release = threading.Event()
+    tenants.on_create(lambda engine: engine.url.database.endswith("slow.db") and release.wait(10))
+    opening = threading.Thread(target=tenants.get, args=("slow",))
+    opening.start()
+    try:
+        done = threading.Event()
+        threading.Thread(target=lambda: (tenants.get("fast"), done.set())).start()
+        assert done.wait(2), "база другой школы ждала чужую миграцию"
+    finally:
+        release.set()
+        opening.join()
+    tenants.close_all()
+
+
+def test_async_open_and_close_run_off_the_event_loop(tmp_path):
+    tenants = registry(tmp_path, ["school1", "school2"], max_engines=1)
+    hook_threads = []
+    tenants.on_create(lambda engine: hook_threads.append(threading.get_ident()))
+    tenants.on_close(lambda engine: hook_threads.append(threading.get_ident()))
+
+    async def open_both():
+        await tenants.get_async("school1")
+        await tenants.get_async("school2")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(open_both())
+    assert len(hook_threads) == 3
+    assert loop_thread not in hook_threads
+    tenants.close_all()
@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from backend import models
+from backend.idempotency import idempotency_store, make_key
+from backend.write_queue import WriteQueue
+
+
+def test_one_by_one_fallback_keeps_original_error(engine, client, monkeypatch):
+    # Пачка не записалась, операции идут по одной: дубликат ключа идемпотентности
+    # должен дойти до обработчика как IntegrityError, чтобы тот отдал повтор, а не 500
+    queue = WriteQueue(True, 10, 1)
+    monkeypatch.setattr(queue, "_apply", lambda bind, batch: [queue._apply_one(bind, operation) for operation in batch])
+    key = make_key("raced", "tests", {})
+    with engine.begin() as conn:
+        conn.execute(insert(models.IdempotencyKey).values(key=key.value, fingerprint=key.fingerprint, status_code=200, response={}))
+    try:
+        with pytest.raises(IntegrityError) as error:
+            queue.submit(engine, idempotency_store.recorded(key, lambda db: {}))
+    finally:
+        queue.release(engine)
+    assert idempotency_store.is_duplicate(key, error.value)